@@ -0,0 +1,282 @@
+"""
+Историческая загрузка (backfill) отчетов iiko за произвольный период.
+
+Период разбивается на окна по несколько дней, окна загружаются параллельно,
+а прогресс каждого окна записывается в таблицу etl_backfill_ledger в Neon.
+Размер окна подстраивается по наблюдаемому объему и длительности ответов.
+Прерванная загрузка при повторном запуске с тем же backfill_id продолжается
+с первого незагруженного дня.
+"""
+import os
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from iiko.api.extract import run_iiko_etl
+from neon.db import connection
+
+
+class WindowSizer:
+    """
+    Адаптивный выбор размера окна загрузки (в днях).
+
+    По завершенным окнам оценивает число строк и секунд на один день
+    (экспоненциальное сглаживание) и выбирает размер так, чтобы окно
+    укладывалось и в целевую длительность, и в целевой объем ответа.
+    """
+
+    def __init__(
+        self,
+        initial_days: int,
+        min_days: int = 1,
+        max_days: int = 31,
+        target_seconds: float = 30.0,
+        target_rows: int = 50000,
+        smoothing: float = 0.5
+    ):
+        self.min_days = max(1, min_days)
+        self.max_days = max(self.min_days, max_days)
+        self.target_seconds = target_seconds
+        self.target_rows = target_rows
+        self.smoothing = smoothing
+        self.days = min(max(initial_days, self.min_days), self.max_days)
+        self._rows_per_day: Optional[float] = None
+        self._seconds_per_day: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _smooth(self, previous: Optional[float], value: float) -> float:
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def observe(self, days: int, rows: int, seconds: float):
+        """Учесть результат загруженного окна и пересчитать размер."""
+        with self._lock:
+            self._rows_per_day = self._smooth(self._rows_per_day, rows / days)
+            self._seconds_per_day = self._smooth(self._seconds_per_day, seconds / days)
+
+            candidates = [float(self.max_days), self.days * 2.0]  # Рост не более чем вдвое за шаг
+            if self._seconds_per_day > 0:
+                candidates.append(self.target_seconds / self._seconds_per_day)
+            if self._rows_per_day > 0:
+                candidates.append(self.target_rows / self._rows_per_day)
+
+            self.days = max(self.min_days, int(min(candidates)))
+
+    def shrink(self):
+        """Уменьшить окно вдвое (после ошибки или таймаута)."""
+        with self._lock:
+            self.days = max(self.min_days, self.days // 2)
+
+    def next_size(self) -> int:
+        with self._lock:
+            return self.days
+
+
+def get_completed_days(conn, backfill_id: str) -> Set[date]:
+    """Получить дни, уже загруженные в рамках backfill_id."""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            SELECT window_from, window_to
+            FROM etl_backfill_ledger
+            WHERE backfill_id = %s AND status = 'done'
+            """,
+            (backfill_id,)
+        )
+        days = set()
+        for window_from, window_to in cur.fetchall():
+            day = window_from
+            while day <= window_to:
+                days.add(day)
+                day += timedelta(days=1)
+        return days
+    finally:
+        cur.close()
+
+
+def mark_window(
+    conn,
+    backfill_id: str,
+    window_from: date,
+    window_to: date,
+    status: str,
+    rows_loaded: Optional[int] = None,
+    duration_seconds: Optional[float] = None,
+    error: Optional[str] = None
+):
+    """Записать состояние окна в журнал etl_backfill_ledger."""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            INSERT INTO etl_backfill_ledger
+            (backfill_id, window_from, window_to, status, rows_loaded, duration_seconds, error,
+             started_at, finished_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP,
+                    CASE WHEN %s = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END)
+            ON CONFLICT (backfill_id, window_from)
+            DO UPDATE SET
+                window_to = EXCLUDED.window_to,
+                status = EXCLUDED.status,
+                rows_loaded = EXCLUDED.rows_loaded,
+                duration_seconds = EXCLUDED.duration_seconds,
+                error = EXCLUDED.error,
+                started_at = CASE WHEN EXCLUDED.status = 'running'
+                                  THEN EXCLUDED.started_at
+                                  ELSE etl_backfill_ledger.started_at END,
+                finished_at = EXCLUDED.finished_at
+            """,
+            (backfill_id, window_from, window_to, status, rows_loaded, duration_seconds, error, status)
+        )
+    finally:
+        cur.close()
+
+
+def _take_window(pending: deque, size: int) -> Tuple[date, date]:
+    """Взять из очереди до size подряд идущих дней."""
+    window_from = pending.popleft()
+    window_to = window_from
+    while (
+        pending
+        and (window_to - window_from).days + 1 < size
+        and pending[0] == window_to + timedelta(days=1)
+    ):
+        window_to = pending.popleft()
+    return window_from, window_to
+
+
+def _load_window(window_from: date, window_to: date) -> Tuple[int, float]:
+    """Загрузить все отчеты iiko за окно. Возвращает (строк, секунд)."""
+    started = time.monotonic()
+    stats = run_iiko_etl(
+        datetime.combine(window_from, datetime.min.time()),
+        datetime.combine(window_to, datetime.min.time())
+    )
+    return sum(stats.values()), time.monotonic() - started
+
+
+def run_backfill(
+    date_from: datetime,
+    date_to: datetime,
+    backfill_id: Optional[str] = None,
+    max_parallel: Optional[int] = None,
+    window_days: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Загрузить отчеты iiko за период окнами с журналом прогресса в Neon.
+
+    Args:
+        date_from: Дата начала периода
+        date_to: Дата окончания периода (включительно)
+        backfill_id: Идентификатор загрузки для продолжения после сбоя
+                     (по умолчанию строится из дат периода)
+        max_parallel: Число одновременно загружаемых окон (BACKFILL_PARALLEL, по умолчанию 2)
+        window_days: Начальный размер окна в днях (BACKFILL_WINDOW_DAYS, по умолчанию 7)
+
+    Returns:
+        dict: Итоги загрузки (дней загружено, пропущено, с ошибкой, строк)
+
+    Raises:
+        RuntimeError: Если часть дней не удалось загрузить за BACKFILL_MAX_ATTEMPTS попыток
+    """
+    first_day = date_from.date()
+    last_day = date_to.date()
+    if first_day > last_day:
+        raise ValueError(f"Дата начала {first_day} позже даты окончания {last_day}")
+
+    if backfill_id is None:
+        backfill_id = f"{first_day:%Y%m%d}-{last_day:%Y%m%d}"
+    if max_parallel is None:
+        max_parallel = int(os.environ.get("BACKFILL_PARALLEL", "2"))
+    if window_days is None:
+        window_days = int(os.environ.get("BACKFILL_WINDOW_DAYS", "7"))
+    max_attempts = int(os.environ.get("BACKFILL_MAX_ATTEMPTS", "3"))
+
+    sizer = WindowSizer(
+        initial_days=window_days,
+        max_days=int(os.environ.get("BACKFILL_MAX_WINDOW_DAYS", "31")),
+        target_seconds=float(os.environ.get("BACKFILL_TARGET_SECONDS", "30")),
+        target_rows=int(os.environ.get("BACKFILL_TARGET_ROWS", "50000"))
+    )
+
+    # Журнал пишется через отдельное подключение пула: прогресс не должен
+    # откатываться вместе с транзакцией запуска
+    with connection(isolated=True) as conn:
+        completed = get_completed_days(conn, backfill_id)
+        all_days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+        pending = deque(day for day in all_days if day not in completed)
+        days_skipped = len(all_days) - len(pending)
+
+        print(f"🗂  Backfill '{backfill_id}': {len(all_days)} дн., "
+              f"уже загружено {days_skipped}, осталось {len(pending)}")
+
+        attempts: Dict[date, int] = {}
+        failed_days: Set[date] = set()
+        rows_total = 0
+        days_done = 0
+
+        with ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="backfill") as pool:
+            running = {}
+
+            while pending or running:
+                # Заполняем пул окнами текущего размера
+                while pending and len(running) < max(1, max_parallel):
+                    window = _take_window(pending, sizer.next_size())
+                    mark_window(conn, backfill_id, window[0], window[1], "running")
+                    print(f"▶️  Окно {window[0]} - {window[1]} ({(window[1] - window[0]).days + 1} дн.)")
+                    running[pool.submit(contextvars.copy_context().run, _load_window, *window)] = window
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    window_from, window_to = running.pop(future)
+                    days = (window_to - window_from).days + 1
+
+                    try:
+                        rows, seconds = future.result()
+                    except Exception as e:
+                        mark_window(conn, backfill_id, window_from, window_to, "failed", error=str(e)[:2000])
+                        print(f"❌ Окно {window_from} - {window_to}: {e}")
+                        sizer.shrink()
+
+                        # Возвращаем дни окна в очередь, пока не исчерпаны попытки
+                        retry_days = set()
+                        for i in range(days):
+                            day = window_from + timedelta(days=i)
+                            attempts[day] = attempts.get(day, 0) + 1
+                            if attempts[day] < max_attempts:
+                                retry_days.add(day)
+                            else:
+                                failed_days.add(day)
+                        pending = deque(sorted(set(pending) | retry_days))
+                        continue
+
+                    mark_window(conn, backfill_id, window_from, window_to, "done",
+                                rows_loaded=rows, duration_seconds=round(seconds, 2))
+                    sizer.observe(days, rows, seconds)
+                    rows_total += rows
+                    days_done += days
+                    print(f"✅ Окно {window_from} - {window_to}: {rows} строк за {seconds:.1f} с, "
+                          f"следующее окно {sizer.next_size()} дн.")
+
+        summary = {
+            "days_loaded": days_done,
+            "days_skipped": days_skipped,
+            "days_failed": len(failed_days),
+            "rows_loaded": rows_total,
+        }
+        print(f"🗂  Backfill '{backfill_id}' завершен: {summary}")
+
+        if failed_days:
+            raise RuntimeError(
+                f"Не удалось загрузить {len(failed_days)} дн. (с {min(failed_days)} по {max(failed_days)}); "
+                f"повторный запуск с backfill_id='{backfill_id}' продолжит загрузку"
+            )
+
+        return summary
@@ -0,0 +1,257 @@
+"""
+Бенчмарк этапов ETL на синтетических данных (см. synthetic.py).
+
+Этапы:
+- parse:<отчет> - потоковый разбор ответа OLAP и преобразование строк;
+- load:<отчет> - загрузка строк в пустую таблицу, reload:<отчет> - повторная
+  загрузка тех же строк (без изменений, как в ежедневном запуске);
+- rollup:combined - разбор ответа сводного запроса и свертка в строки маржи
+  и нагрузки по часам (IIKO_OLAP_MODE=combined);
+- transform:sheets_<вид> и load:sheets_<вид> - преобразование выгрузки листа
+  и ее загрузка (с сохранением в raw_payloads);
+- refresh:<витрина> - полный пересчет витрины и ее агрегатов по неделям и
+  месяцам (refresh_mart.sql, refresh_rollups.sql).
+
+Каждый этап выполняется --repeat раз, берется лучшее время. Результат
+сохраняется в benchmarks/results/ вместе с ревизией git и сравнивается
+с базовым (--baseline): этап, ставший медленнее более чем на --threshold,
+считается регрессией (код выхода 1).
+
+Бенчмарк очищает таблицы iiko_raw_*, sheets_raw_*, mart_* и raw_payloads,
+поэтому запускается только на отдельной БД из BENCH_DATABASE_URL
+(например, локальный PostgreSQL); схема создается автоматически.
+
+Запуск:
+    python benchmarks/bench_etl.py --departments 10 --days 90
+    python benchmarks/bench_etl.py --departments 10 --days 90 --save-baseline
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import psycopg2
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import Scale, olap_response, sheet_frame  # noqa: E402
+from google_sheets.load import SHEET_TABLES, _load_frame, frame_to_rows  # noqa: E402
+from iiko.api.combined import rollup_rows  # noqa: E402
+from iiko.api.extract import _load_rows  # noqa: E402
+from iiko.api.olap_reports import STREAM_CHUNK_SIZE  # noqa: E402
+from iiko.api.report_specs import REPORT_SPECS, iter_converted_rows  # noqa: E402
+from iiko.api.stream import iter_report_rows  # noqa: E402
+from neon.db import close_pool  # noqa: E402
+from neon.partitions import ensure_partitions  # noqa: E402
+from neon.schema.init_schema import init_schema  # noqa: E402
+from neon.transforms.run_transforms import MART_ROLLUPS, MART_SOURCES, run_mart  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# Таблицы, очищаемые перед каждым повтором
+RESET_TABLES = (
+    *(spec.table for spec in REPORT_SPECS.values()),
+    *(table for table, _ in SHEET_TABLES.values()),
+    *MART_SOURCES,
+    *(table for tables in MART_ROLLUPS.values() for table in tables),
+    "raw_payloads",
+    "mart_refresh_state",
+)
+
+
+def git_revision() -> Tuple[str, bool]:
+    """Текущая ревизия git и признак незафиксированных изменений."""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return revision, bool(status.strip())
+
+
+def reset_tables(dsn: str):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(RESET_TABLES)}")
+    cur.close()
+    conn.close()
+
+
+def measure(func: Callable[[], int]) -> Tuple[float, int]:
+    """Время выполнения func и возвращенное ей число строк (вывод загрузчиков скрыт)."""
+    with redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - started
+    return elapsed, rows
+
+
+def run_once(scale: Scale, seed: int) -> Dict[str, Tuple[float, int]]:
+    """Выполнить все этапы один раз. Возвращает этап -> (секунды, строки)."""
+    timings: Dict[str, Tuple[float, int]] = {}
+    dates = scale.dates
+    date_from = datetime.combine(dates[0], datetime.min.time())
+    date_to = datetime.combine(dates[-1], datetime.min.time())
+    with redirect_stdout(io.StringIO()):
+        ensure_partitions(date_from, date_to)
+
+    for spec in REPORT_SPECS.values():
+        body = olap_response(spec.key, scale, seed)
+        chunks = [body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)]
+        rows: List[tuple] = []
+
+        def parse():
+            rows.extend(iter_converted_rows(spec, iter_report_rows(chunks), "0" * 64))
+            return len(rows)
+
+        timings[f"parse:{spec.key}"] = measure(parse)
+        timings[f"load:{spec.key}"] = measure(lambda: sum(_load_rows(spec, iter(rows)).values()))
+        timings[f"reload:{spec.key}"] = measure(lambda: sum(_load_rows(spec, iter(rows)).values()))
+
+    body = olap_response("combined", scale, seed)
+    chunks = [body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)]
+    timings["rollup:combined"] = measure(
+        lambda: sum(len(rows) for rows in rollup_rows(iter_report_rows(chunks)).values())
+    )
+
+    for kind, (table, patterns) in SHEET_TABLES.items():
+        df = sheet_frame(kind, scale, seed)
+        timings[f"transform:sheets_{kind}"] = measure(lambda: len(frame_to_rows(df, patterns, "0" * 64)))
+        timings[f"load:sheets_{kind}"] = measure(lambda: _load_frame(table, df, patterns, f"sheets:bench_{kind}"))
+
+    for mart in MART_SOURCES:
+        timings[f"refresh:{mart}"] = measure(lambda: run_mart(mart, full=True))
+
+    return timings
+
+
+def compare(result: dict, baseline: dict, threshold: float, min_seconds: float) -> List[str]:
+    """
+    Сравнить результат с базовым.
+
+    Returns:
+        list: Этапы с регрессией (медленнее базового более чем на threshold
+              и более чем на min_seconds)
+    """
+    regressions = []
+    print(f"\n📊 Сравнение с базовым ({baseline['revision'][:10]}, {baseline['created_at']}):")
+    print(f"{'этап':<36} {'база, с':>9} {'сейчас, с':>10} {'изменение':>10}")
+    for stage, seconds in result["seconds"].items():
+        base = baseline["seconds"].get(stage)
+        if base is None:
+            print(f"{stage:<36} {'-':>9} {seconds:>10.3f} {'новый':>10}")
+            continue
+        change = (seconds - base) / base if base else 0.0
+        regressed = change > threshold and seconds - base > min_seconds
+        mark = "  ⚠️ регрессия" if regressed else ""
+        print(f"{stage:<36} {base:>9.3f} {seconds:>10.3f} {change:>+9.0%}{mark}")
+        if regressed:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов ETL на синтетических данных")
+    parser.add_argument("--departments", type=int, default=2, help="Число предприятий")
+    parser.add_argument("--days", type=int, default=31, help="Число дней")
+    parser.add_argument("--hours", type=int, default=24, help="Часов в сутках в отчетах нагрузки")
+    parser.add_argument("--discount-types", type=int, default=5, help="Число типов скидок")
+    parser.add_argument("--seed", type=int, default=0, help="Вариант синтетических данных")
+    parser.add_argument("--repeat", type=int, default=3, help="Число повторов (берется лучшее время)")
+    parser.add_argument("--backend", choices=("values", "copy"), help="NEON_LOAD_BACKEND для загрузки")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Файл базового результата")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результат как базовый")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое замедление (0.2 = 20%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Замедление меньше этого числа секунд не считается регрессией")
+    args = parser.parse_args()
+
+    load_dotenv()
+    dsn = os.environ.get("BENCH_DATABASE_URL")
+    if not dsn:
+        raise ValueError("BENCH_DATABASE_URL не установлена (бенчмарк очищает таблицы, Neon не используется)")
+    # Загрузчики подключаются по NEON_DATABASE_URL
+    os.environ["NEON_DATABASE_URL"] = dsn
+    if args.backend:
+        os.environ["NEON_LOAD_BACKEND"] = args.backend
+
+    scale = Scale(args.departments, args.days, args.hours, args.discount_types)
+    with redirect_stdout(io.StringIO()):
+        init_schema()
+
+    print(f"🏁 Масштаб: {args.departments} предпр. × {args.days} дн. × {args.hours} ч. × "
+          f"{args.discount_types} типов скидок, повторов: {args.repeat}")
+
+    best: Dict[str, Tuple[float, int]] = {}
+    try:
+        for _ in range(max(1, args.repeat)):
+            reset_tables(dsn)
+            for stage, (seconds, rows) in run_once(scale, args.seed).items():
+                if stage not in best or seconds < best[stage][0]:
+                    best[stage] = (seconds, rows)
+    finally:
+        close_pool()
+
+    print(f"{'этап':<36} {'строк':>9} {'секунд':>9} {'строк/с':>10}")
+    for stage, (seconds, rows) in best.items():
+        print(f"{stage:<36} {rows:>9} {seconds:>9.3f} {rows / seconds if seconds else 0:>10.0f}")
+
+    revision, dirty = git_revision()
+    result = {
+        "revision": revision,
+        "dirty": dirty,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "scale": {**asdict(scale), "start": scale.start.isoformat()},
+        "seed": args.seed,
+        "backend": os.environ.get("NEON_LOAD_BACKEND", "values"),
+        "seconds": {stage: round(seconds, 6) for stage, (seconds, _) in best.items()},
+        "rows": {stage: rows for stage, (_, rows) in best.items()},
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{revision[:10]}{'-dirty' if dirty else ''}.json"
+    )
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результат: {result_path}")
+
+    regressions: List[str] = []
+    baseline: Optional[dict] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    if baseline is None:
+        print("ℹ️  Базового результата нет (сохранить: --save-baseline)")
+    elif (baseline["scale"], baseline["seed"], baseline["backend"]) != (result["scale"], result["seed"], result["backend"]):
+        print("⚠️  Базовый результат получен при другом масштабе или способе загрузки, сравнение пропущено")
+    else:
+        regressions = compare(result, baseline, args.threshold, args.min_seconds)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Сохранен как базовый: {args.baseline}")
+
+    if regressions:
+        print(f"\n❌ Регрессии производительности: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Сравнение способов загрузки строк в Neon: execute_values и COPY.
+
+Создает временную таблицу со структурой iiko_raw_load_orders, загружает в нее
+синтетические строки каждым способом (первый проход - вставка, второй -
+обновление тех же ключей, третий - повтор без изменений) и печатает время
+и скорость.
+
+Запуск (БД из BENCH_DATABASE_URL или NEON_DATABASE_URL):
+    python benchmarks/bench_loaders.py --rows 50000 --batch-size 1000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, timedelta
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from neon.loader import LOAD_BACKENDS, upsert_rows  # noqa: E402
+
+TABLE = "bench_raw_load_orders"
+COLUMNS = ("report_date", "department", "hour_open", "orders_count", "raw_data")
+KEY_COLUMNS = ("report_date", "department", "hour_open")
+
+
+def make_rows(count: int, pass_no: int) -> list:
+    """Синтетические строки отчета "Нагрузка по часам (заказы)"."""
+    departments = ["Домодедово", "Авиагородок", "Филиал 3", "Филиал 4"]
+    start = date(2020, 1, 1)
+    rows = []
+    for i in range(count):
+        report_date = start + timedelta(days=i // (24 * len(departments)))
+        department = departments[(i // 24) % len(departments)]
+        hour = i % 24
+        orders = (i * 7 + pass_no) % 50
+        raw = {"OpenDate.Typed": report_date.isoformat(), "Department": department,
+               "HourOpen": hour, "UniqOrderId.OrdersCount": orders}
+        rows.append((report_date, department, hour, orders, json.dumps(raw, ensure_ascii=False)))
+    return rows
+
+
+def bench(conn, backend: str, rows: list, batch_size: int) -> float:
+    cur = conn.cursor()
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        upsert_rows(cur, TABLE, COLUMNS, KEY_COLUMNS, rows[i:i + batch_size], backend=backend)
+    elapsed = time.perf_counter() - started
+    cur.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение execute_values и COPY при загрузке в Neon")
+    parser.add_argument("--rows", type=int, default=20000, help="Число строк")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Размер пачки")
+    args = parser.parse_args()
+
+    load_dotenv()
+    dsn = os.environ.get("BENCH_DATABASE_URL") or os.environ.get("NEON_DATABASE_URL")
+    if not dsn:
+        raise ValueError("BENCH_DATABASE_URL или NEON_DATABASE_URL не установлена")
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        CREATE TEMP TABLE {TABLE} (
+            report_date DATE NOT NULL,
+            department VARCHAR(255) NOT NULL,
+            hour_open INTEGER NOT NULL,
+            orders_count INTEGER,
+            raw_data JSONB,
+            row_hash CHAR(32),
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (report_date, department, hour_open)
+        )
+        """
+    )
+
+    print(f"🏁 {args.rows} строк, пачка {args.batch_size}")
+    print(f"{'способ':<8} {'проход':<10} {'секунд':>8} {'строк/с':>10}")
+
+    for backend in LOAD_BACKENDS:
+        cur.execute(f"TRUNCATE {TABLE}")
+        for pass_no, label in enumerate(("вставка", "обновление", "повтор")):
+            # Повтор загружает те же строки, что и обновление
+            elapsed = bench(conn, backend, make_rows(args.rows, min(pass_no, 1)), args.batch_size)
+            print(f"{backend:<8} {label:<10} {elapsed:>8.2f} {args.rows / elapsed:>10.0f}")
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
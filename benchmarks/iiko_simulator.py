@@ -0,0 +1,441 @@
+"""
+Локальный сервер, имитирующий iiko Server API, для нагрузочных тестов.
+
+Реализует /resto/api/auth, /resto/api/logout и /resto/api/v2/reports/olap
+для четырех отчетов REPORT_SPECS: сохраненных (по ID, со всеми колонками,
+включая extra_fields дополнительных) и запрошенных явными полями
+(groupByRowFields/aggregateFields - только эти поля), а также сводного
+запроса (iiko/api/combined.py). Данные отчетов синтетические
+(benchmarks/synthetic.py): детерминированы по дню, так что ответ за период
+совпадает с ответами за его дни (backfill окнами и ежедневная загрузка
+дают одинаковые строки).
+
+Поведение сервера настраивается (SimulatorConfig):
+- задержка ответа (latency + случайная добавка до jitter секунд);
+- 429 Too Many Requests с Retry-After - при превышении max_concurrent
+  одновременных запросов отчетов и с вероятностью throttle_rate;
+- 500/502/503 с вероятностью error_rate;
+- медленная отдача тела (drip_bytes байт каждые drip_interval секунд);
+- истечение токена через token_ttl секунд (401) и лимит лицензий
+  (max_tokens одновременно выданных токенов).
+
+Счетчики запросов доступны по GET /simulator/stats.
+
+Запуск:
+    python benchmarks/iiko_simulator.py --port 8080 --departments 10 --latency 0.5 --error-rate 0.05
+    IIKO_BASE_URL=http://127.0.0.1:8080 IIKO_LOGIN=bench IIKO_PASSWORD_SHA1=bench python etl.py
+
+Из кода:
+    with IikoSimulator(SimulatorConfig(max_concurrent=2)) as simulator:
+        os.environ["IIKO_BASE_URL"] = simulator.base_url
+        ...
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional, Sequence
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import Scale, iter_olap_rows  # noqa: E402
+from iiko.api.combined import COMBINED_AGGREGATE_FIELDS, COMBINED_ROW_FIELDS  # noqa: E402
+from iiko.api.report_specs import REPORT_SPECS  # noqa: E402
+
+# ID отчета в iiko -> ключ отчета
+REPORTS_BY_ID = {spec.report_id: spec.key for spec in REPORT_SPECS.values()}
+
+# Запрошенные поля -> ключ отчета
+REPORTS_BY_FIELDS = {
+    frozenset(spec.group_fields + spec.aggregate_fields): spec.key for spec in REPORT_SPECS.values()
+}
+REPORTS_BY_FIELDS[frozenset(COMBINED_ROW_FIELDS + COMBINED_AGGREGATE_FIELDS)] = "combined"
+
+# Формат дат в параметрах запроса OLAP ("01.02.2026 0:00:00")
+DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+# Строк отчета в одном чанке ответа (без медленной отдачи)
+ROWS_PER_CHUNK = 500
+
+
+@dataclass
+class SimulatorConfig:
+    """Параметры имитации сервера."""
+    departments: int = 2
+    hours: int = 24
+    discount_types: int = 5
+    seed: int = 0
+    latency: float = 0.0  # Задержка перед ответом на запрос отчета, секунд
+    jitter: float = 0.0  # Случайная добавка к задержке, до jitter секунд
+    max_concurrent: Optional[int] = None  # Больше одновременных запросов отчетов - 429
+    throttle_rate: float = 0.0  # Доля запросов отчетов с ответом 429
+    retry_after: int = 1  # Retry-After в ответе 429, секунд
+    error_rate: float = 0.0  # Доля запросов отчетов с ответом 5xx
+    drip_bytes: Optional[int] = None  # Отдавать тело по drip_bytes байт...
+    drip_interval: float = 0.0  # ...каждые drip_interval секунд
+    token_ttl: Optional[float] = None  # Срок жизни токена, секунд (None - бессрочный)
+    max_tokens: Optional[int] = None  # Лимит одновременно выданных токенов (лицензий)
+    fault_seed: Optional[int] = None  # Seed ошибок и задержек (None - случайные)
+    extra_fields: int = 0  # Дополнительных колонок в строках сохраненного отчета (по ID)
+
+
+class SimulatorState:
+    """Токены и счетчики сервера (общие для потоков обработки запросов)."""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.fault_seed)
+        self.tokens: Dict[str, float] = {}  # Токен -> время выдачи
+        self.in_flight = 0
+        self.stats: Dict[str, float] = {
+            "auth": 0,
+            "logout": 0,
+            "olap_requests": 0,
+            "olap_ok": 0,
+            "rows_sent": 0,
+            "bytes_sent": 0,
+            "status_401": 0,
+            "status_429": 0,
+            "status_5xx": 0,
+            "max_in_flight": 0,
+        }
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.stats[name] += value
+
+    def chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    def delay(self) -> float:
+        with self.lock:
+            return self.config.latency + self.rng.uniform(0, self.config.jitter)
+
+    def issue_token(self) -> Optional[str]:
+        """Выдать токен (None - исчерпан лимит лицензий)."""
+        with self.lock:
+            self._expire_tokens()
+            if self.config.max_tokens is not None and len(self.tokens) >= self.config.max_tokens:
+                return None
+            token = str(uuid.uuid4())
+            self.tokens[token] = time.monotonic()
+            self.stats["auth"] += 1
+            return token
+
+    def release_token(self, token: Optional[str]):
+        with self.lock:
+            if self.tokens.pop(token, None) is not None:
+                self.stats["logout"] += 1
+
+    def is_valid(self, token: Optional[str]) -> bool:
+        with self.lock:
+            self._expire_tokens()
+            return token in self.tokens
+
+    def _expire_tokens(self):
+        if self.config.token_ttl is None:
+            return
+        deadline = time.monotonic() - self.config.token_ttl
+        for token in [token for token, issued in self.tokens.items() if issued < deadline]:
+            del self.tokens[token]
+
+    def enter(self) -> bool:
+        """Начать обработку запроса отчета (False - превышен max_concurrent)."""
+        with self.lock:
+            if self.config.max_concurrent is not None and self.in_flight >= self.config.max_concurrent:
+                return False
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.strptime(value.strip(), DATE_FORMAT)
+
+
+def report_scale(config: SimulatorConfig, date_from: datetime, date_to: datetime) -> Scale:
+    """Масштаб отчета за период запроса (date_to не включается, как IncludeHigh: False в iiko)."""
+    days = max(0, (date_to.date() - date_from.date()).days)
+    return Scale(config.departments, days, config.hours, config.discount_types, date_from.date())
+
+
+def iter_report_body(
+    report: str,
+    scale: Scale,
+    seed: int = 0,
+    fields: Optional[Sequence[str]] = None,
+    extra_fields: int = 0
+) -> Iterator[bytes]:
+    """
+    Тело ответа OLAP по частям: {"data": [...], "summary": []}.
+
+    Args:
+        fields: Запрошенные поля (None - сохраненный отчет со всеми колонками)
+        extra_fields: Дополнительных колонок сохраненного отчета
+    """
+    extra = {f"Extra.Field{i + 1}": f"Значение колонки {i + 1}" for i in range(extra_fields)}
+    yield b'{"data": ['
+    rows = []
+    first = True
+    for row in iter_olap_rows(report, scale, seed):
+        if fields is not None:
+            row = {field: row.get(field) for field in fields}
+        elif extra:
+            row.update(extra)
+        rows.append(json.dumps(row, ensure_ascii=False))
+        if len(rows) >= ROWS_PER_CHUNK:
+            yield (("" if first else ", ") + ", ".join(rows)).encode("utf-8")
+            first = False
+            rows = []
+    if rows:
+        yield (("" if first else ", ") + ", ".join(rows)).encode("utf-8")
+    yield b'], "summary": []}'
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов iiko Server API."""
+    protocol_version = "HTTP/1.1"
+    server_version = "iiko-simulator"
+    state: SimulatorState  # Задается в IikoSimulator
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(
+        self,
+        status: int,
+        body: str = "",
+        headers: Optional[Dict[str, str]] = None,
+        content_type: str = "text/plain; charset=utf-8"
+    ):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/resto/api/auth":
+            if not query.get("login") or not query.get("pass"):
+                self._send(401, "Неверный логин или пароль")
+                return
+            token = self.state.issue_token()
+            if token is None:
+                self._send(403, "License enhancement is required: превышено число подключений")
+                return
+            self._send(200, token)
+        elif url.path == "/resto/api/logout":
+            self.state.release_token(query.get("key", [None])[0])
+            self._send(200)
+        elif url.path == "/simulator/stats":
+            with self.state.lock:
+                stats = {**self.state.stats, "tokens": len(self.state.tokens)}
+            self._send(200, json.dumps(stats), content_type="application/json")
+        else:
+            self._send(404, "Not found")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+
+        if url.path != "/resto/api/v2/reports/olap":
+            self._send(404, "Not found")
+            return
+
+        state = self.state
+        state.count("olap_requests")
+
+        if not state.is_valid(query.get("key", [None])[0]):
+            state.count("status_401")
+            self._send(401, "Token is expired or invalid")
+            return
+
+        try:
+            request = json.loads(body or b"{}")
+            fields = None
+            if "groupByRowFields" in request:
+                fields = request["groupByRowFields"] + request.get("aggregateFields", [])
+                report = REPORTS_BY_FIELDS[frozenset(fields)]
+            else:
+                report = REPORTS_BY_ID[request.get("id")]
+            date_from = _parse_date(query["dateFrom"][0])
+            date_to = _parse_date(query["dateTo"][0])
+        except (KeyError, ValueError) as e:
+            self._send(400, f"Некорректный запрос отчета: {e}")
+            return
+
+        if not state.enter():
+            state.count("status_429")
+            self._send(429, "Too many requests", {"Retry-After": str(state.config.retry_after)})
+            return
+
+        try:
+            delay = state.delay()
+            if delay > 0:
+                time.sleep(delay)
+
+            if state.chance(state.config.throttle_rate):
+                state.count("status_429")
+                self._send(429, "Too many requests", {"Retry-After": str(state.config.retry_after)})
+                return
+            if state.chance(state.config.error_rate):
+                with state.lock:
+                    status = state.rng.choice((500, 502, 503))
+                state.count("status_5xx")
+                self._send(status, "Internal server error")
+                return
+
+            self._send_report(report, date_from, date_to, fields)
+        finally:
+            state.leave()
+
+    def _send_report(
+        self,
+        report: str,
+        date_from: datetime,
+        date_to: datetime,
+        fields: Optional[Sequence[str]] = None
+    ):
+        """Отдать отчет с chunked transfer encoding (при drip_bytes - медленно)."""
+        config = self.state.config
+        scale = report_scale(config, date_from, date_to)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        sent = 0
+        for part in iter_report_body(report, scale, config.seed, fields, config.extra_fields):
+            pieces = [part]
+            if config.drip_bytes:
+                pieces = [part[i:i + config.drip_bytes] for i in range(0, len(part), config.drip_bytes)]
+            for piece in pieces:
+                self.wfile.write(f"{len(piece):X}\r\n".encode("ascii") + piece + b"\r\n")
+                sent += len(piece)
+                if config.drip_bytes and config.drip_interval:
+                    self.wfile.flush()
+                    time.sleep(config.drip_interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+        self.state.count("olap_ok")
+        self.state.count("rows_sent", scale.report_rows(report))
+        self.state.count("bytes_sent", sent)
+
+
+class IikoSimulator:
+    """Сервер-имитатор iiko в фоновом потоке."""
+
+    def __init__(self, config: Optional[SimulatorConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or SimulatorConfig()
+        self.state = SimulatorState(self.config)
+        handler = type("Handler", (SimulatorHandler,), {"state": self.state})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        with self.state.lock:
+            return {**self.state.stats, "tokens": len(self.state.tokens)}
+
+    def start(self) -> "IikoSimulator":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="iiko-simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "IikoSimulator":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный имитатор iiko Server API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--departments", type=int, default=2, help="Число предприятий")
+    parser.add_argument("--hours", type=int, default=24, help="Часов в сутках в отчетах нагрузки")
+    parser.add_argument("--discount-types", type=int, default=5, help="Число типов скидок")
+    parser.add_argument("--seed", type=int, default=0, help="Вариант синтетических данных")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа на отчет, секунд")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунд")
+    parser.add_argument("--max-concurrent", type=int, help="Больше одновременных запросов отчетов - 429")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After в ответе 429, секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 5xx")
+    parser.add_argument("--drip-bytes", type=int, help="Отдавать тело ответа по N байт...")
+    parser.add_argument("--drip-interval", type=float, default=0.0, help="...каждые N секунд")
+    parser.add_argument("--token-ttl", type=float, help="Срок жизни токена, секунд")
+    parser.add_argument("--max-tokens", type=int, help="Лимит одновременно выданных токенов")
+    parser.add_argument("--fault-seed", type=int, help="Seed ошибок и задержек")
+    parser.add_argument("--extra-fields", type=int, default=0,
+                        help="Дополнительных колонок в строках сохраненных отчетов")
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        departments=args.departments,
+        hours=args.hours,
+        discount_types=args.discount_types,
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        max_concurrent=args.max_concurrent,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        drip_bytes=args.drip_bytes,
+        drip_interval=args.drip_interval,
+        token_ttl=args.token_ttl,
+        max_tokens=args.max_tokens,
+        fault_seed=args.fault_seed,
+        extra_fields=args.extra_fields
+    )
+    simulator = IikoSimulator(config, args.host, args.port)
+    print(f"🧪 Имитатор iiko Server API: {simulator.base_url}")
+    print(f"   IIKO_BASE_URL={simulator.base_url} IIKO_LOGIN=bench IIKO_PASSWORD_SHA1=bench")
+    print(f"   Счетчики: {simulator.base_url}/simulator/stats")
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.server.server_close()
+        print(f"\n📊 {json.dumps(simulator.stats, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Синтетические данные источников для бенчмарков.
+
+Ответы OLAP отчетов iiko (в формате /resto/api/v2/reports/olap) и выгрузки
+листов Google Sheets (DataFrame, как после extract_sheet) заданного
+масштаба: предприятия × дни × часы × типы скидок. Значения детерминированы
+(зависят только от дня, масштаба и seed), так что прогоны разных ревизий
+сравнимы между собой, а ответ за период совпадает с ответами за его дни.
+"""
+import json
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List
+
+import pandas as pd
+
+# Реальные предприятия (нормализуются загрузчиком листов), затем - условные
+DEPARTMENTS = ("Домодедово", "Авиагородок")
+
+# Типы обслуживания заказов (None - заказ в зале)
+SERVICE_TYPES = (None, "COURIER", "PICKUP")
+
+DISCOUNT_TYPES = ("Бонусы", "Промокод", "Сотрудники", "День рождения", "Самовывоз", "Акция")
+
+
+@dataclass(frozen=True)
+class Scale:
+    """Масштаб синтетических данных."""
+    departments: int = 2
+    days: int = 31
+    hours: int = 24  # Часов работы в сутки (отчеты нагрузки)
+    discount_types: int = 5
+    start: date = date(2025, 1, 1)
+
+    @property
+    def dates(self) -> List[date]:
+        return [self.start + timedelta(days=i) for i in range(self.days)]
+
+    @property
+    def department_names(self) -> List[str]:
+        return [
+            DEPARTMENTS[i] if i < len(DEPARTMENTS) else f"Предприятие {i + 1}"
+            for i in range(self.departments)
+        ]
+
+    @property
+    def discount_type_names(self) -> List[str]:
+        return [
+            DISCOUNT_TYPES[i] if i < len(DISCOUNT_TYPES) else f"Скидка {i + 1}"
+            for i in range(self.discount_types)
+        ]
+
+    def report_rows(self, report: str) -> int:
+        """Число строк отчета iiko при этом масштабе."""
+        per_day = {
+            "margin": 1,
+            "load_orders": self.hours,
+            "load_revenue": self.hours,
+            "discount_types": self.discount_types,
+            # Сводный запрос: час × тип обслуживания
+            "combined": self.hours * len(SERVICE_TYPES),
+        }[report]
+        return self.days * self.departments * per_day
+
+
+def _money(rng: random.Random, low: float, high: float) -> float:
+    return round(rng.uniform(low, high), 2)
+
+
+def iter_olap_rows(report: str, scale: Scale, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Строки OLAP отчета iiko (поля как в ответе сервера).
+
+    Args:
+        report: Ключ отчета (margin, load_orders, load_revenue, discount_types)
+                или combined - сводный запрос (см. iiko/api/combined.py)
+        scale: Масштаб данных
+        seed: Вариант данных (другой seed - другие значения при тех же ключах)
+    """
+    first_hour = max(0, min(10, 24 - scale.hours))
+
+    for day in scale.dates:
+        # Значения дня не зависят от запрошенного периода
+        rng = random.Random(f"{report}:{seed}:{day}")
+        day_str = day.isoformat()
+        for department in scale.department_names:
+            if report == "margin":
+                dish_sum = _money(rng, 50_000, 400_000)
+                yield {
+                    "OpenDate.Typed": day_str,
+                    "Department": department,
+                    "DishSumInt": dish_sum,
+                    "DiscountSum": _money(rng, 0, dish_sum * 0.15),
+                    "ProductCostBase.Percent": round(rng.uniform(0.22, 0.38), 4),
+                }
+            elif report == "load_orders":
+                for hour in range(first_hour, first_hour + scale.hours):
+                    yield {
+                        "OpenDate.Typed": day_str,
+                        "Department": department,
+                        "HourOpen": hour,
+                        "UniqOrderId.OrdersCount": rng.randint(0, 60),
+                    }
+            elif report == "load_revenue":
+                for hour in range(first_hour, first_hour + scale.hours):
+                    yield {
+                        "OpenDate.Typed": day_str,
+                        "Department": department,
+                        "HourOpen": hour,
+                        "DishDiscountSumInt": _money(rng, 0, 40_000),
+                    }
+            elif report == "discount_types":
+                for discount_type in scale.discount_type_names:
+                    orders = rng.randint(1, 80)
+                    revenue = _money(rng, 500, 60_000)
+                    yield {
+                        "OpenDate.Typed": day_str,
+                        "Department": department,
+                        "OrderDiscount.Type": discount_type,
+                        "UniqOrderId.OrdersCount": orders,
+                        "DishDiscountSumInt": revenue,
+                        "DiscountSum": _money(rng, 0, revenue * 0.3),
+                        "DishDiscountSumInt.average": round(revenue / orders, 2),
+                    }
+            elif report == "combined":
+                for hour in range(first_hour, first_hour + scale.hours):
+                    for service_type in SERVICE_TYPES:
+                        dish_sum = _money(rng, 0, 8_000)
+                        discount = _money(rng, 0, dish_sum * 0.2)
+                        yield {
+                            "OpenDate.Typed": day_str,
+                            "Department": department,
+                            "HourOpen": hour,
+                            "Delivery.ServiceType": service_type,
+                            "UniqOrderId.OrdersCount": rng.randint(0, 12),
+                            "DishSumInt": dish_sum,
+                            "DishDiscountSumInt": round(dish_sum - discount, 2),
+                            "DiscountSum": discount,
+                            "ProductCostBase.ProductCost": _money(rng, dish_sum * 0.22, dish_sum * 0.38),
+                        }
+            else:
+                raise ValueError(f"Неизвестный отчет '{report}'")
+
+
+def olap_response(report: str, scale: Scale, seed: int = 0) -> bytes:
+    """Тело ответа OLAP отчета: {"data": [...], "summary": []} в UTF-8."""
+    body = {"data": list(iter_olap_rows(report, scale, seed)), "summary": []}
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def sheet_frame(kind: str, scale: Scale, seed: int = 0) -> pd.DataFrame:
+    """
+    Выгрузка листа Google Sheets (строка на дату и предприятие).
+
+    Args:
+        kind: Вид данных листа (direct или fot, см. google_sheets.sources)
+        scale: Масштаб данных (часы и типы скидок не используются)
+        seed: Вариант данных
+    """
+    records = []
+    for day in scale.dates:
+        rng = random.Random(f"sheets:{kind}:{seed}:{day}")
+        for department in scale.department_names:
+            record = {"Дата": day.strftime("%d.%m.%Y")}
+            if kind == "direct":
+                record["Рекламный бюджет"] = _money(rng, 0, 15_000)
+                record["ФОТ директ"] = _money(rng, 0, 5_000)
+            elif kind == "fot":
+                record["ФОТ курьеры"] = _money(rng, 5_000, 40_000)
+                record["ФОТ повара"] = _money(rng, 10_000, 50_000)
+                record["ФОТ уборщицы"] = _money(rng, 1_000, 6_000)
+            else:
+                raise ValueError(f"Неизвестный вид данных листа '{kind}'")
+            record["Торговое предприятие"] = department
+            records.append(record)
+    return pd.DataFrame.from_records(records)
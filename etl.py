@@ -2,25 +2,66 @@
 Главный ETL скрипт для запуска всех процессов выгрузки данных.
 """
 import os
+import argparse
+from contextlib import nullcontext
+from dataclasses import replace
 from datetime import datetime, timedelta
-from typing import Optional
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence
 from dotenv import load_dotenv
 
-from iiko.api.extract import run_iiko_etl
-from google_sheets.load import run_sheets_etl
+from iiko.api.client import close_clients
+from iiko.api import combined
+from iiko.api.extract import load_combined, load_report
+from iiko.api.report_specs import REPORT_SPECS
+from iiko.api.sources import get_iiko_sources
+from google_sheets.load import SHEET_TABLES, load_sheet
+from google_sheets.sources import get_sheet_sources
+from neon.db import close_pool, in_run_transaction, run_transaction, savepoint
+from neon.metrics import RunMetrics
+from neon.partitions import ensure_partitions
+from neon.transforms.run_transforms import MART_SOURCES, run_mart
+from backfill import run_backfill
+from pipeline import Pipeline, Task, load_last_run, save_last_run
 
 
-def main(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+def main(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    backfill: bool = False,
+    backfill_id: Optional[str] = None,
+    atomic: bool = False,
+    transforms: bool = False,
+    replay: bool = False,
+    only: Optional[Sequence[str]] = None,
+    rerun_failed: bool = False
+):
     """
     Запустить полный ETL процесс.
     
     Args:
         date_from: Дата начала периода (по умолчанию - вчера)
         date_to: Дата окончания периода (по умолчанию - вчера)
+        backfill: Загружать отчеты iiko окнами с журналом прогресса
+                  (для длинных периодов, см. backfill.run_backfill)
+        backfill_id: Идентификатор backfill для продолжения прерванной загрузки
+        atomic: Выполнить весь запуск в одной транзакции (данные попадают
+                в БД целиком или не попадают вовсе)
+        transforms: Обновить витрину (run_transforms) в том же запуске
+        replay: Перезагрузить отчеты iiko из локального кеша ответов без
+                обращения к API (Google Sheets при этом не загружается)
+        only: Выполнить только задачи по шаблонам имен и зависящие от них
+        rerun_failed: Выполнить только задачи, не выполненные в прошлом запуске,
+                      за период и с флагами прошлого запуска
     """
     # Загружаем переменные окружения из .env
     load_dotenv()
     
+    if rerun_failed:
+        date_from, date_to, backfill, backfill_id, transforms, replay = _restore_last_run(
+            date_from, date_to, backfill, backfill_id, transforms, replay
+        )
+    
     if date_from is None:
         date_from = datetime.now() - timedelta(days=1)
     if date_to is None:
@@ -37,43 +78,318 @@ def main(date_from: Optional[datetime] = None, date_to: Optional[datetime] = Non
         "NEON_DATABASE_URL"
     ]
     
+    if replay or os.environ.get("IIKO_SOURCES"):
+        # Без обращения к API нужна только БД; серверы IIKO_SOURCES
+        # проверяются при подключении к ним
+        required_vars = ["NEON_DATABASE_URL"]
+    
     missing_vars = [var for var in required_vars if not os.environ.get(var)]
     if missing_vars:
         raise ValueError(f"Отсутствуют переменные окружения: {', '.join(missing_vars)}")
     
+    if atomic and backfill:
+        raise ValueError("Backfill нельзя выполнять в одной транзакции: прогресс окон должен сохраняться")
+    
+    if replay and backfill:
+        raise ValueError("Replay не поддерживает backfill: окна backfill не совпадают с сохраненными запросами")
+    
+    # Метрики этапов запуска (etl_run_history, см. neon/metrics.py)
+    metrics = RunMetrics()
+    error = None
+    
     try:
-        # Загружаем данные из iiko API
-        print("\n📊 Этап 1: Загрузка данных из iiko Server API")
-        print("-" * 60)
-        try:
-            run_iiko_etl(date_from, date_to)
-            print("✅ Данные из iiko Server API загружены успешно")
-        except Exception as e:
-            print(f"❌ Ошибка при загрузке данных из iiko API: {e}")
-            raise
-        
-        # Загружаем данные из Google Sheets
-        print("\n📊 Этап 2: Загрузка данных из Google Sheets")
-        print("-" * 60)
-        if os.environ.get("GOOGLE_SHEETS_CREDENTIALS"):
-            try:
-                run_sheets_etl(date_from, date_to)
-                print("✅ Данные из Google Sheets загружены успешно")
-            except Exception as e:
-                print(f"⚠️  Ошибка при загрузке данных из Google Sheets: {e}")
-                print("⚠️  Продолжаем выполнение без данных из Google Sheets")
-        else:
-            print("⚠️  GOOGLE_SHEETS_CREDENTIALS не установлена, пропускаем загрузку из Google Sheets")
+        with run_transaction() if atomic else nullcontext():
+            run_stages(date_from, date_to, backfill, backfill_id, transforms, replay, only, rerun_failed, metrics=metrics)
         
         print("\n" + "=" * 60)
         print("✅ ETL процесс завершен успешно")
-        
+    
     except Exception as e:
+        error = str(e)
         print(f"\n❌ Критическая ошибка при выполнении ETL: {e}")
         import traceback
         traceback.print_exc()
         raise
+    finally:
+        metrics.write("failed" if error else "ok", error)
+        # Освобождаем токен iiko (слот лицензии) и подключения к Neon
+        close_clients()
+        close_pool()
+
+
+def _run_params(
+    date_from: datetime,
+    date_to: datetime,
+    backfill: bool,
+    backfill_id: Optional[str],
+    transforms: bool,
+    replay: bool
+) -> Dict[str, Any]:
+    """Параметры, от которых зависят период и состав задач (сохраняются для --rerun-failed)."""
+    return {
+        "date_from": date_from.date().isoformat(),
+        "date_to": date_to.date().isoformat(),
+        "backfill": backfill,
+        "backfill_id": backfill_id,
+        "transforms": transforms,
+        "replay": replay
+    }
+
+
+def _restore_last_run(
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    backfill: bool,
+    backfill_id: Optional[str],
+    transforms: bool,
+    replay: bool
+) -> tuple:
+    """
+    Период и флаги прошлого запуска для --rerun-failed.
+    
+    Незаданные параметры берутся из прошлого запуска, заданные явно должны
+    с ним совпадать: иначе повтор загрузил бы другой период или другие задачи.
+    
+    Raises:
+        ValueError: Если заданные параметры отличаются от прошлого запуска
+    """
+    saved = load_last_run().params
+    given = {
+        "date_from": date_from.date().isoformat() if date_from else None,
+        "date_to": date_to.date().isoformat() if date_to else None,
+        "backfill": backfill or None,
+        "backfill_id": backfill_id,
+        "transforms": transforms or None,
+        "replay": replay or None
+    }
+    differ = [key for key, value in given.items() if value is not None and value != saved[key]]
+    if differ:
+        raise ValueError(
+            f"Параметры повтора отличаются от прошлого запуска ({', '.join(differ)}): "
+            f"{', '.join(f'{key}={saved[key]}' for key in differ)}"
+        )
+    
+    print(f"🔁 Повтор невыполненных задач запуска за {saved['date_from']} - {saved['date_to']}")
+    return (
+        datetime.fromisoformat(saved["date_from"]),
+        datetime.fromisoformat(saved["date_to"]),
+        saved["backfill"],
+        saved["backfill_id"],
+        saved["transforms"],
+        saved["replay"]
+    )
+
+
+def _in_savepoint(name: str, func: Callable[[], Any]) -> Callable[[], Any]:
+    """Выполнить задачу в savepoint: ее ошибка не откатывает остальные данные запуска."""
+    def run():
+        with savepoint(name):
+            return func()
+    return run
+
+
+def _measured(metrics: RunMetrics, name: str, func: Callable[[], Any]) -> Callable[[], Any]:
+    """Выполнить задачу как этап метрик запуска."""
+    def run():
+        with metrics.stage(name):
+            return func()
+    return run
+
+
+def build_pipeline(
+    date_from: datetime,
+    date_to: datetime,
+    backfill: bool = False,
+    backfill_id: Optional[str] = None,
+    transforms: bool = False,
+    replay: bool = False,
+    sheets: bool = True,
+    metrics: Optional[RunMetrics] = None
+) -> Pipeline:
+    """
+    Построить DAG задач ETL.
+    
+    - neon:partitions - секции месяцев периода;
+    - iiko:<отчет> - по задаче на отчет REPORT_SPECS и сервер iiko
+      (iiko:<сервер>:<отчет> для серверов IIKO_SOURCES, кроме default;
+      iiko:combined - все отчеты сервера (маржа и нагрузка - сводным
+      запросом) при IIKO_OLAP_MODE=combined; iiko:backfill со всеми серверами при backfill);
+    - sheets:<лист> - по задаче на лист (sources.get_sheet_sources); ошибка
+      листа не останавливает запуск;
+    - mart:<витрина> - обновление витрины после загрузки всех ее сырых таблиц
+      (MART_SOURCES), если transforms=True.
+    
+    Если передан metrics, каждая задача учитывается в нем отдельным этапом.
+    """
+    partitions = "neon:partitions"
+    tasks = [Task(partitions, partial(ensure_partitions, date_from, date_to))]
+    # Сырая таблица -> задачи, которые ее загружают
+    table_tasks: Dict[str, List[str]] = {}
+    
+    if backfill:
+        tasks.append(Task(
+            "iiko:backfill",
+            partial(run_backfill, date_from, date_to, backfill_id=backfill_id),
+            (partitions,)
+        ))
+        for spec in REPORT_SPECS.values():
+            table_tasks.setdefault(spec.table, []).append("iiko:backfill")
+    elif combined.is_enabled():
+        for source in get_iiko_sources():
+            name = "iiko:combined" if source.is_default else f"iiko:{source.key}:combined"
+            tasks.append(Task(
+                name,
+                partial(load_combined, date_from, date_to, replay=replay, source=source),
+                (partitions,)
+            ))
+            for spec in REPORT_SPECS.values():
+                table_tasks.setdefault(spec.table, []).append(name)
+    else:
+        sources = get_iiko_sources()
+        # Задачи чередуются по серверам: первыми запускаются первые отчеты всех серверов
+        for spec in REPORT_SPECS.values():
+            for source in sources:
+                name = f"iiko:{spec.key}" if source.is_default else f"iiko:{source.key}:{spec.key}"
+                tasks.append(Task(
+                    name,
+                    partial(load_report, spec, date_from, date_to, replay=replay, source=source),
+                    (partitions,)
+                ))
+                table_tasks.setdefault(spec.table, []).append(name)
+    
+    if sheets:
+        for i, source in enumerate(get_sheet_sources()):
+            name = f"sheets:{source.key}"
+            tasks.append(Task(
+                name,
+                _in_savepoint(f"sheets_{i}", partial(load_sheet, source, date_from, date_to)),
+                (partitions,),
+                optional=True
+            ))
+            table_tasks.setdefault(SHEET_TABLES[source.kind][0], []).append(name)
+    
+    if transforms:
+        for mart, tables in MART_SOURCES.items():
+            deps = tuple(dict.fromkeys(name for table in tables for name in table_tasks.get(table, ())))
+            tasks.append(Task(f"mart:{mart}", partial(run_mart, mart), deps))
+    
+    if metrics is not None:
+        tasks = [replace(task, run=_measured(metrics, task.name, task.run)) for task in tasks]
+    
+    return Pipeline(tasks)
+
+
+def run_stages(
+    date_from: datetime,
+    date_to: datetime,
+    backfill: bool = False,
+    backfill_id: Optional[str] = None,
+    transforms: bool = False,
+    replay: bool = False,
+    only: Optional[Sequence[str]] = None,
+    rerun_failed: bool = False,
+    max_workers: Optional[int] = None,
+    metrics: Optional[RunMetrics] = None
+):
+    """
+    Выполнить задачи ETL: отчеты iiko, листы Google Sheets и (опционально) витрины.
+    
+    Независимые задачи выполняются параллельно (см. build_pipeline и
+    pipeline.Pipeline), каждая витрина обновляется сразу после загрузки своих
+    сырых таблиц.
+    
+    Args:
+        only: Шаблоны имен задач для частичного запуска (например, iiko:margin
+              или sheets:*); зависящие от них задачи выполняются тоже
+        rerun_failed: Выполнить только задачи, не выполненные в прошлом запуске
+                      (параметры должны совпадать с прошлым запуском)
+        max_workers: Число одновременно выполняемых задач (по умолчанию ETL_MAX_WORKERS
+                     или 8 на каждый сервер iiko)
+        metrics: Метрики запуска, в которых учитывается каждая задача
+    
+    Raises:
+        RuntimeError: Если не выполнена хотя бы одна обязательная задача
+    """
+    sheets = False
+    if replay:
+        print("⚠️  Режим replay, пропускаем загрузку из Google Sheets")
+    elif os.environ.get("GOOGLE_SHEETS_CREDENTIALS"):
+        sheets = True
+    else:
+        print("⚠️  GOOGLE_SHEETS_CREDENTIALS не установлена, пропускаем загрузку из Google Sheets")
+    
+    params = _run_params(date_from, date_to, backfill, backfill_id, transforms, replay)
+    pipeline = build_pipeline(date_from, date_to, backfill, backfill_id, transforms, replay, sheets, metrics)
+    
+    selected = None
+    if rerun_failed:
+        last_run = load_last_run()
+        if last_run.params != params:
+            raise ValueError(f"Параметры повтора {params} отличаются от прошлого запуска {last_run.params}")
+        failed = last_run.failed
+        if not failed:
+            print("✅ В прошлом запуске все задачи выполнены, повторять нечего")
+            return
+        missing = [name for name in failed if name not in pipeline.tasks]
+        if missing:
+            raise ValueError(
+                f"Задач прошлого запуска нет в текущем составе: {', '.join(missing)} "
+                "(изменились IIKO_OLAP_MODE, IIKO_SOURCES или листы Google Sheets)"
+            )
+        selected = pipeline.select(failed)
+    elif only:
+        selected = pipeline.select(only)
+    if selected is not None:
+        # Секции периода создаются при любом частичном запуске
+        selected.add("neon:partitions")
+    
+    if max_workers is None:
+        max_workers = int(os.environ.get("ETL_MAX_WORKERS", 8 * len(get_iiko_sources())))
+    if in_run_transaction():
+        # Одно подключение на запуск: savepoint задач не должны перемежаться
+        max_workers = 1
+    
+    names = [name for name in pipeline.tasks if selected is None or name in selected]
+    print(f"\n📋 Задачи ({len(names)}): {', '.join(names)}")
+    print("-" * 60)
+    
+    run = pipeline.run(selected, max_workers=max_workers)
+    pipeline.print_summary(run)
+    save_last_run(run, params)
+    
+    failed = [name for name in run.failed if not pipeline.tasks[name].optional]
+    if failed:
+        raise RuntimeError(f"Не выполнены задачи: {', '.join(failed)} (повтор: python etl.py --rerun-failed)")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Разобрать аргументы командной строки."""
+    def parse_date(value: str) -> datetime:
+        return datetime.strptime(value, "%Y-%m-%d")
+    
+    parser = argparse.ArgumentParser(description="ETL: iiko Server API и Google Sheets → Neon")
+    parser.add_argument("--date-from", type=parse_date, help="Дата начала периода, ГГГГ-ММ-ДД (по умолчанию - вчера)")
+    parser.add_argument("--date-to", type=parse_date, help="Дата окончания периода, ГГГГ-ММ-ДД (по умолчанию - вчера)")
+    parser.add_argument("--backfill", action="store_true", help="Историческая загрузка окнами с журналом в Neon")
+    parser.add_argument("--backfill-id", help="Идентификатор backfill для продолжения прерванной загрузки")
+    parser.add_argument("--atomic", action="store_true", help="Выполнить весь запуск в одной транзакции")
+    parser.add_argument("--transforms", action="store_true", help="Обновить витрину после загрузки")
+    parser.add_argument("--replay", action="store_true", help="Перезагрузить отчеты iiko из локального кеша без обращения к API")
+    parser.add_argument("--only", nargs="+", metavar="ЗАДАЧА", help="Выполнить только задачи по шаблонам имен (iiko:margin, sheets:*, mart:*) и зависящие от них")
+    parser.add_argument("--rerun-failed", action="store_true", help="Выполнить только задачи, не выполненные в прошлом запуске")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(
+        args.date_from,
+        args.date_to,
+        backfill=args.backfill,
+        backfill_id=args.backfill_id,
+        atomic=args.atomic,
+        transforms=args.transforms,
+        replay=args.replay,
+        only=args.only,
+        rerun_failed=args.rerun_failed
+    )
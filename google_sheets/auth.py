@@ -1,25 +1,46 @@
 """
 Настройка доступа к Google Sheets API.
+
+Клиент gspread создается один раз на процесс (для каждого сервисного
+аккаунта): access token переиспользуется до истечения срока и обновляется
+автоматически, HTTP соединения с API переиспользуются между запросами
+и потоками.
 """
 import os
 import json
-from typing import Optional
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
 from google.oauth2.service_account import Credentials
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
 import gspread
+import requests
+
+from neon.metrics import record
+
+# Размер пула HTTP соединений клиента (не меньше числа потоков загрузки листов)
+POOL_MAXSIZE = 10
+
+_clients: Dict[str, gspread.Client] = {}
+_sessions: Dict[str, AuthorizedSession] = {}  # HTTP сессии клиентов (для запросов к Drive API)
+_clients_lock = threading.Lock()
 
 
 def get_sheets_client(credentials_json: Optional[str] = None) -> gspread.Client:
     """
-    Получить клиент для работы с Google Sheets API.
+    Получить общий для процесса клиент для работы с Google Sheets API.
+    
+    Клиент создается при первом вызове для сервисного аккаунта и затем
+    переиспользуется; потоки могут обращаться к нему одновременно.
     
     Args:
         credentials_json: JSON строка с credentials сервисного аккаунта.
                          Если None, берется из переменной окружения GOOGLE_SHEETS_CREDENTIALS.
-                         
+    
     Returns:
         gspread.Client: Клиент для работы с Google Sheets
-        
+    
     Raises:
         ValueError: Если credentials не найдены
     """
@@ -32,6 +53,42 @@ def get_sheets_client(credentials_json: Optional[str] = None) -> gspread.Client:
             "Установите переменную окружения с JSON credentials сервисного аккаунта Google."
         )
     
+    cache_key = _client_key(credentials_json)
+    
+    with _clients_lock:
+        if cache_key not in _clients:
+            _clients[cache_key], _sessions[cache_key] = _create_client(credentials_json)
+        return _clients[cache_key]
+
+
+def get_sheets_session(credentials_json: Optional[str] = None) -> requests.Session:
+    """
+    HTTP сессия с авторизацией общего клиента Google Sheets (для запросов к другим API Google).
+    
+    Args:
+        credentials_json: См. get_sheets_client
+    
+    Returns:
+        requests.Session: Сессия клиента с пулом соединений и метриками запросов
+    """
+    if credentials_json is None:
+        credentials_json = os.environ.get("GOOGLE_SHEETS_CREDENTIALS")
+    
+    get_sheets_client(credentials_json)
+    return _sessions[_client_key(credentials_json)]
+
+
+def _client_key(credentials_json: str) -> str:
+    return hashlib.sha256(credentials_json.encode("utf-8")).hexdigest()
+
+
+def _record_response(resp: requests.Response, *args, **kwargs):
+    """Учесть запрос к Google API в метриках текущего этапа ETL."""
+    record(http_seconds=resp.elapsed.total_seconds(), http_requests=1, bytes_received=len(resp.content))
+
+
+def _create_client(credentials_json: str) -> Tuple[gspread.Client, AuthorizedSession]:
+    """Создать клиент gspread с общей HTTP сессией и полученным access token."""
     # Парсим JSON credentials
     creds_dict = json.loads(credentials_json)
     
@@ -44,10 +101,26 @@ def get_sheets_client(credentials_json: Optional[str] = None) -> gspread.Client:
         ]
     )
     
-    # Создаем клиент gspread
-    client = gspread.authorize(credentials)
+    # Сессия с пулом соединений на все потоки загрузки
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.hooks["response"].append(_record_response)
     
-    return client
+    # Получаем токен заранее, чтобы потоки не запрашивали его одновременно
+    credentials.refresh(Request())
+    
+    # Создаем клиент gspread
+    return gspread.authorize(credentials, session=session), session
+
+
+def spreadsheet_id_from_url(url: str) -> str:
+    """ID таблицы из URL Google Sheets (полного или только ID)."""
+    if "/spreadsheets/d/" in url:
+        return url.split("/spreadsheets/d/")[1].split("/")[0]
+    elif "/d/" in url:
+        return url.split("/d/")[1].split("/")[0]
+    return url  # Предполагаем, что это уже ID
 
 
 def get_sheet_by_url(client: gspread.Client, url: str, sheet_name: Optional[str] = None):
@@ -58,20 +131,12 @@ def get_sheet_by_url(client: gspread.Client, url: str, sheet_name: Optional[str]
         client: Клиент gspread
         url: URL Google Sheets (полный или только ID)
         sheet_name: Название вкладки (если None, берется первая вкладка)
-        
+    
     Returns:
         gspread.Worksheet: Объект листа
     """
-    # Извлекаем ID из URL
-    if "/spreadsheets/d/" in url:
-        sheet_id = url.split("/spreadsheets/d/")[1].split("/")[0]
-    elif "/d/" in url:
-        sheet_id = url.split("/d/")[1].split("/")[0]
-    else:
-        sheet_id = url  # Предполагаем, что это уже ID
-    
     # Открываем таблицу
-    spreadsheet = client.open_by_key(sheet_id)
+    spreadsheet = client.open_by_key(spreadsheet_id_from_url(url))
     
     # Получаем нужный лист
     if sheet_name:
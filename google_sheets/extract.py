@@ -5,6 +5,7 @@ from typing import List, Dict, Any
 from datetime import datetime
 import pandas as pd
 from .auth import get_sheets_client, get_sheet_by_url
+from .row_index import DATE_FORMAT, get_records_by_dates
 
 
 # URL таблиц
@@ -14,6 +15,48 @@ DIRECT_SHEET_NAME = "Директ"
 FOT_SHEET_URL = "https://docs.google.com/spreadsheets/d/1JXwkPQtLKUvuf7q9HAqxUcEN52xvMoLc0E7Cr5mQwm8/edit?gid=909952063#gid=909952063"
 
 
+def _records_to_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Преобразовать записи листа в DataFrame.
+    
+    Названия колонок нормализуются (без пробелов, в нижнем регистре),
+    колонки с датой преобразуются в datetime.
+    """
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    
+    df.columns = df.columns.str.strip().str.lower()
+    
+    date_columns = [col for col in df.columns if "дата" in col]
+    for col in date_columns:
+        df[col] = pd.to_datetime(df[col], format=DATE_FORMAT, errors="coerce")
+    
+    return df
+
+
+def _filter_by_date(df: pd.DataFrame, date_from: datetime, date_to: datetime) -> pd.DataFrame:
+    """Оставить строки периода по первой колонке с датой."""
+    date_columns = [col for col in df.columns if "дата" in col]
+    if date_columns:
+        date_col = date_columns[0]
+        df = df[(df[date_col] >= date_from) & (df[date_col] <= date_to)]
+    return df
+
+
+def extract_sheet(worksheet) -> pd.DataFrame:
+    """
+    Получить все строки листа.
+    
+    Args:
+        worksheet: Лист gspread
+    
+    Returns:
+        pd.DataFrame: Данные листа
+    """
+    return _records_to_frame(worksheet.get_all_records())
+
+
 def extract_direct_data() -> pd.DataFrame:
     """
     Извлечь данные из таблицы "Директ" (рекламный бюджет + ФОТ директ).
@@ -25,19 +68,7 @@ def extract_direct_data() -> pd.DataFrame:
     worksheet = get_sheet_by_url(client, DIRECT_SHEET_URL, DIRECT_SHEET_NAME)
     
     # Получаем все данные
-    data = worksheet.get_all_records()
-    
-    # Преобразуем в DataFrame
-    df = pd.DataFrame(data)
-    
-    # Нормализуем названия колонок (убираем пробелы, приводим к нижнему регистру)
-    df.columns = df.columns.str.strip().str.lower()
-    
-    # Преобразуем дату
-    if "дата" in df.columns:
-        df["дата"] = pd.to_datetime(df["дата"], format="%d.%m.%Y", errors="coerce")
-    
-    return df
+    return extract_sheet(worksheet)
 
 
 def extract_fot_data() -> pd.DataFrame:
@@ -51,20 +82,39 @@ def extract_fot_data() -> pd.DataFrame:
     worksheet = get_sheet_by_url(client, FOT_SHEET_URL)
     
     # Получаем все данные
-    data = worksheet.get_all_records()
+    return extract_sheet(worksheet)
+
+
+def extract_by_date_range(
+    worksheet,
+    date_from: datetime,
+    date_to: datetime
+) -> pd.DataFrame:
+    """
+    Получить строки листа за период.
     
-    # Преобразуем в DataFrame
-    df = pd.DataFrame(data)
+    Скачиваются только строки дат периода (по индексу строк, см. row_index.py);
+    лист без колонки с датой скачивается целиком.
     
-    # Нормализуем названия колонок
-    df.columns = df.columns.str.strip().str.lower()
+    Args:
+        worksheet: Лист gspread
+        date_from: Дата начала периода
+        date_to: Дата окончания периода
     
-    # Преобразуем дату, если есть
-    date_columns = [col for col in df.columns if "дата" in col.lower()]
-    for col in date_columns:
-        df[col] = pd.to_datetime(df[col], format="%d.%m.%Y", errors="coerce")
+    Returns:
+        pd.DataFrame: Данные за период
+    """
+    records = get_records_by_dates(worksheet, date_from, date_to)
+    if records is None:
+        print(f"⚠️  В листе '{worksheet.title}' нет колонки с датой, лист загружается целиком")
+        records = worksheet.get_all_records()
     
-    return df
+    df = _records_to_frame(records)
+    if df.empty:
+        return df
+    
+    # Граница периода может содержать время: сравниваем по дням
+    return _filter_by_date(df, pd.Timestamp(date_from).normalize(), pd.Timestamp(date_to).normalize())
 
 
 def get_direct_data_by_date_range(
@@ -77,16 +127,14 @@ def get_direct_data_by_date_range(
     Args:
         date_from: Дата начала периода
         date_to: Дата окончания периода
-        
+    
     Returns:
         pd.DataFrame: Отфильтрованные данные
     """
-    df = extract_direct_data()
-    
-    if "дата" in df.columns:
-        df = df[(df["дата"] >= date_from) & (df["дата"] <= date_to)]
+    client = get_sheets_client()
+    worksheet = get_sheet_by_url(client, DIRECT_SHEET_URL, DIRECT_SHEET_NAME)
     
-    return df
+    return extract_by_date_range(worksheet, date_from, date_to)
 
 
 def get_fot_data_by_date_range(
@@ -99,16 +147,11 @@ def get_fot_data_by_date_range(
     Args:
         date_from: Дата начала периода
         date_to: Дата окончания периода
-        
+    
     Returns:
         pd.DataFrame: Отфильтрованные данные
     """
-    df = extract_fot_data()
-    
-    # Ищем колонку с датой
-    date_columns = [col for col in df.columns if "дата" in col.lower()]
-    if date_columns:
-        date_col = date_columns[0]
-        df = df[(df[date_col] >= date_from) & (df[date_col] <= date_to)]
+    client = get_sheets_client()
+    worksheet = get_sheet_by_url(client, FOT_SHEET_URL)
     
-    return df
+    return extract_by_date_range(worksheet, date_from, date_to)
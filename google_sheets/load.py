@@ -2,27 +2,69 @@
 Загрузка данных из Google Sheets в Neon.
 """
 import os
-import json
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional
 import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_values
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-
-from .extract import (
-    extract_direct_data,
-    extract_fot_data,
-    get_direct_data_by_date_range,
-    get_fot_data_by_date_range
+
+from neon.db import connection
+from neon.loader import format_counts, upsert_rows
+from neon.metrics import record
+from neon.partitions import ensure_partitions
+from neon.payloads import save_payload
+from .auth import get_sheets_client, get_sheet_by_url, spreadsheet_id_from_url
+from .metadata import fetch_metadata
+from .row_index import DATE_FORMAT
+from .extract import extract_by_date_range, extract_sheet
+from .sources import DIRECT_SOURCE, FOT_SOURCE, SheetSource, get_sheet_sources
+from .sync_state import is_same_content, is_unchanged, load_state, save_state
+
+
+def sheet_payload(df: pd.DataFrame) -> bytes:
+    """
+    Выгрузка листа для raw_payloads.
+    
+    Строки сохраняются JSON массивом в порядке DataFrame; номер строки
+    в массиве - payload_pos строки сырой таблицы.
+    """
+    return df.to_json(orient="records", date_format="iso", force_ascii=False).encode("utf-8")
+
+
+def save_sheet_payload(source: str, df: pd.DataFrame) -> str:
+    """
+    Сохранить выгрузку листа целиком в raw_payloads.
+    
+    Returns:
+        str: payload_hash выгрузки
+    """
+    return save_payload(source, sheet_payload(df))
+
+
+# Колонки листов: роль -> варианты названия (колонка подходит, если содержит
+# все слова одного из вариантов). Колонка получает первую подходящую роль;
+# если роли подходят несколько колонок, берется последняя.
+DIRECT_COLUMNS = (
+    ("report_date", (("дата",),)),
+    ("ad_budget", (("реклам",), ("бюджет",))),
+    ("fot_direct", (("фот", "директ"),)),
+    ("department", (("торгов",), ("предприят",), ("филиал",))),
 )
 
+FOT_COLUMNS = (
+    ("report_date", (("дата",),)),
+    ("fot_couriers", (("курьер", "фот"),)),
+    ("fot_cooks", (("повар", "фот"),)),
+    ("fot_cleaners", (("уборщиц", "фот"),)),
+    ("department", (("торгов",), ("предприят",), ("филиал",))),
+)
 
-def get_db_connection():
-    """Получить подключение к Neon."""
-    conn = psycopg2.connect(os.environ["NEON_DATABASE_URL"])
-    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-    return conn
+# Вид данных листа -> (сырая таблица, роли колонок)
+SHEET_TABLES = {
+    "direct": ("sheets_raw_direct", DIRECT_COLUMNS),
+    "fot": ("sheets_raw_fot", FOT_COLUMNS),
+}
 
 
 def normalize_department_name(dept: str) -> str:
@@ -41,242 +83,311 @@ def normalize_department_name(dept: str) -> str:
     return dept.strip()
 
 
-def load_direct_data(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+def normalize_department_names(departments: pd.Series) -> pd.Series:
+    """Нормализовать колонку названий торговых предприятий (как normalize_department_name)."""
+    departments = departments.fillna("").astype(str).str.strip()
+    lower = departments.str.lower()
+    
+    departments = departments.mask(lower.str.contains("авиагородок|филиал 1"), "Авиагородок")
+    return departments.mask(lower.str.contains("домодедово|филиал 2"), "Домодедово")
+
+
+def resolve_columns(columns, patterns) -> Dict[str, Optional[str]]:
     """
-    Загрузить данные из таблицы "Директ" в БД.
+    Найти колонки DataFrame для ролей (один раз на DataFrame).
     
     Args:
-        date_from: Дата начала периода (если None, загружаются все данные)
-        date_to: Дата окончания периода (если None, загружаются все данные)
+        columns: Названия колонок
+        patterns: Роли и варианты названий (DIRECT_COLUMNS, FOT_COLUMNS)
+    
+    Returns:
+        dict: Роль -> название колонки (None, если не найдена)
+    """
+    resolved: Dict[str, Optional[str]] = {role: None for role, _ in patterns}
+    for col in columns:
+        col_lower = col.lower()
+        for role, variants in patterns:
+            if any(all(word in col_lower for word in words) for words in variants):
+                resolved[role] = col
+                break
+    return resolved
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """Колонка дат в datetime (строки - в формате ДД.ММ.ГГГГ)."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+
+
+def _parse_amounts(values: pd.Series, valid, column: str, sheet: Optional[str]) -> pd.Series:
     """
-    print("📊 Загрузка данных из таблицы 'Директ'")
+    Колонка сумм в float; пустые значения - ноль.
     
-    # Получаем данные из Google Sheets
-    if date_from and date_to:
-        df = get_direct_data_by_date_range(date_from, date_to)
-    else:
-        df = extract_direct_data()
-    
-    if df.empty:
-        print("⚠️  Нет данных для загрузки")
-        return
-    
-    # Подготавливаем данные для вставки
-    rows = []
-    for _, row in df.iterrows():
-        # Ищем колонки (могут быть разные названия)
-        date_col = None
-        ad_budget_col = None
-        fot_col = None
-        dept_col = None
-        
-        for col in df.columns:
-            col_lower = col.lower()
-            if "дата" in col_lower:
-                date_col = col
-            elif "реклам" in col_lower or "бюджет" in col_lower:
-                ad_budget_col = col
-            elif "фот" in col_lower and "директ" in col_lower:
-                fot_col = col
-            elif "торгов" in col_lower or "предприят" in col_lower or "филиал" in col_lower:
-                dept_col = col
-        
-        if not date_col:
-            print("⚠️  Не найдена колонка с датой")
-            continue
-        
-        report_date = row[date_col]
-        if pd.isna(report_date):
-            continue
-        
-        # Преобразуем дату
-        if isinstance(report_date, str):
-            try:
-                report_date = datetime.strptime(report_date, "%d.%m.%Y").date()
-            except:
-                continue
-        
-        department = normalize_department_name(row.get(dept_col, ""))
-        ad_budget = float(row.get(ad_budget_col, 0) or 0)
-        fot_direct = float(row.get(fot_col, 0) or 0)
-        
-        rows.append({
-            "report_date": report_date,
-            "department": department,
-            "ad_budget": ad_budget,
-            "fot_direct": fot_direct,
-            "raw_data": row.to_dict()
-        })
+    Raises:
+        ValueError: Если в строках с датой есть непустые нечисловые суммы
+    """
+    amounts = pd.to_numeric(values, errors="coerce")
+    blank = values.isna() | (values.astype(str).str.strip() == "")
+    invalid = (amounts.isna() & ~blank).to_numpy() & valid
+    if invalid.any():
+        positions = invalid.nonzero()[0]
+        examples = ", ".join(f"строка {pos}: {values.iloc[pos]!r}" for pos in positions[:5])
+        raise ValueError(
+            f"Нечисловые суммы в колонке '{column}'"
+            + (f" листа {sheet}" if sheet else "")
+            + f" ({len(positions)} шт., номера строк выгрузки): {examples}"
+        )
+    return amounts.fillna(0.0).astype(float)
+
+
+def frame_to_rows(
+    df: pd.DataFrame,
+    patterns,
+    payload_hash: str,
+    sheet: Optional[str] = None
+) -> List[tuple]:
+    """
+    Преобразовать DataFrame листа в строки сырой таблицы для upsert_rows.
+    
+    Строки без даты пропускаются, пустые суммы считаются нулем.
+    
+    Args:
+        df: Данные листа (в порядке выгрузки в raw_payloads)
+        patterns: Роли колонок; первая - дата, последняя - предприятие,
+                  остальные - суммы
+        payload_hash: Выгрузка листа в raw_payloads
+        sheet: Название листа для сообщений об ошибках
+    
+    Returns:
+        list: Кортежи (report_date, department, суммы..., raw_data, payload_hash, payload_pos)
+    
+    Raises:
+        ValueError: Если сумма в строке с датой не число (например, "1 234,56")
+    """
+    columns = resolve_columns(df.columns, patterns)
+    value_roles = [role for role, _ in patterns[1:-1]]
+    
+    if not columns["report_date"]:
+        print("⚠️  Не найдена колонка с датой")
+        return []
+    
+    dates = _parse_dates(df[columns["report_date"]])
+    valid = dates.notna().to_numpy()
+    
+    def column(role: str, default) -> pd.Series:
+        if columns[role] is None:
+            return pd.Series(default, index=df.index)
+        return df[columns[role]]
+    
+    departments = normalize_department_names(column("department", ""))
+    values = [
+        _parse_amounts(column(role, 0.0), valid, columns[role] or role, sheet)
+        for role in value_roles
+    ]
     
+    payload_positions = range(len(df))
+    return list(zip(
+        dates[valid].dt.date,
+        departments[valid],
+        *(series[valid] for series in values),
+        [None] * int(valid.sum()),
+        [payload_hash] * int(valid.sum()),
+        (pos for pos, keep in zip(payload_positions, valid) if keep)
+    ))
+
+
+def _load_frame(
+    table: str,
+    df: pd.DataFrame,
+    patterns,
+    source: str,
+    payload: Optional[bytes] = None
+) -> int:
+    """
+    Сохранить выгрузку листа в raw_payloads и загрузить ее строки в сырую таблицу.
+    
+    Args:
+        payload: Уже подготовленная выгрузка листа (sheet_payload)
+    
+    Returns:
+        int: Число загруженных строк
+    """
+    # Выгрузка листа целиком - в raw_payloads, строки ссылаются на нее
+    payload_hash = save_payload(source, payload if payload is not None else sheet_payload(df))
+    
+    rows = frame_to_rows(df, patterns, payload_hash, source)
     if not rows:
         print("⚠️  Нет валидных данных для загрузки")
-        return
+        return 0
     
-    # Загружаем в БД
-    conn = get_db_connection()
-    cur = conn.cursor()
+    columns = (
+        "report_date", "department", *(role for role, _ in patterns[1:-1]),
+        "raw_data", "payload_hash", "payload_pos"
+    )
     
-    try:
-        execute_values(
-            cur,
-            """
-            INSERT INTO sheets_raw_direct 
-            (report_date, department, ad_budget, fot_direct, raw_data)
-            VALUES %s
-            ON CONFLICT (report_date, department) 
-            DO UPDATE SET
-                ad_budget = EXCLUDED.ad_budget,
-                fot_direct = EXCLUDED.fot_direct,
-                raw_data = EXCLUDED.raw_data,
-                loaded_at = CURRENT_TIMESTAMP
-            """,
-            [
-                (
-                    row["report_date"],
-                    row["department"],
-                    row["ad_budget"],
-                    row["fot_direct"],
-                    json.dumps(row["raw_data"])
-                )
-                for row in rows
-            ]
-        )
-        print(f"✅ Загружено {len(rows)} строк")
-    finally:
-        cur.close()
-        conn.close()
+    # Загружаем в БД через общий пул подключений
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            counts = upsert_rows(cur, table, columns, ("report_date", "department"), rows)
+            print(f"✅ Загружено {len(rows)} строк ({format_counts(counts)})")
+        finally:
+            cur.close()
+    
+    return len(rows)
 
 
-def load_fot_data(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+def load_sheet(
+    source: SheetSource,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    force: bool = False
+) -> int:
     """
-    Загрузить данные ФОТ (курьеры, повара, уборщицы) в БД.
+    Загрузить лист Google Sheets в сырую таблицу его вида данных.
+    
+    Лист не скачивается, если таблица не менялась с прошлой загрузки и новых
+    данных за период в ней нет, и строки не загружаются, если не изменилось
+    содержимое листа за период (см. sync_state.py).
     
     Args:
+        source: Лист (см. sources.py)
         date_from: Дата начала периода (если None, загружаются все данные)
         date_to: Дата окончания периода (если None, загружаются все данные)
+        force: Скачать и загрузить лист без проверки изменений
+    
+    Returns:
+        int: Число загруженных строк
     """
-    print("📊 Загрузка данных ФОТ")
+    table, patterns = SHEET_TABLES[source.kind]
+    spreadsheet_id = spreadsheet_id_from_url(source.url)
+    
+    state = None if force else load_state(source.key)
+    metadata = fetch_metadata(spreadsheet_id)
+    if is_unchanged(state, metadata, date_from, date_to):
+        print(f"⏭️  Лист '{source.title}' не менялся с прошлой загрузки, пропускаем")
+        return 0
+    
+    print(f"📊 Загрузка данных из листа '{source.title}'")
     
     # Получаем данные из Google Sheets
+    worksheet = get_sheet_by_url(get_sheets_client(), source.url, source.sheet_name)
     if date_from and date_to:
-        df = get_fot_data_by_date_range(date_from, date_to)
+        df = extract_by_date_range(worksheet, date_from, date_to)
     else:
-        df = extract_fot_data()
-    
-    if df.empty:
-        print("⚠️  Нет данных для загрузки")
-        return
-    
-    # Подготавливаем данные для вставки
-    rows = []
-    for _, row in df.iterrows():
-        # Ищем колонки
-        date_col = None
-        fot_couriers_col = None
-        fot_cooks_col = None
-        fot_cleaners_col = None
-        dept_col = None
-        
-        for col in df.columns:
-            col_lower = col.lower()
-            if "дата" in col_lower:
-                date_col = col
-            elif "курьер" in col_lower and "фот" in col_lower:
-                fot_couriers_col = col
-            elif "повар" in col_lower and "фот" in col_lower:
-                fot_cooks_col = col
-            elif "уборщиц" in col_lower and "фот" in col_lower:
-                fot_cleaners_col = col
-            elif "торгов" in col_lower or "предприят" in col_lower or "филиал" in col_lower:
-                dept_col = col
-        
-        if not date_col:
-            continue
-        
-        report_date = row[date_col]
-        if pd.isna(report_date):
-            continue
-        
-        # Преобразуем дату
-        if isinstance(report_date, str):
-            try:
-                report_date = datetime.strptime(report_date, "%d.%m.%Y").date()
-            except:
-                continue
-        
-        department = normalize_department_name(row.get(dept_col, ""))
-        fot_couriers = float(row.get(fot_couriers_col, 0) or 0)
-        fot_cooks = float(row.get(fot_cooks_col, 0) or 0)
-        fot_cleaners = float(row.get(fot_cleaners_col, 0) or 0)
-        
-        rows.append({
-            "report_date": report_date,
-            "department": department,
-            "fot_couriers": fot_couriers,
-            "fot_cooks": fot_cooks,
-            "fot_cleaners": fot_cleaners,
-            "raw_data": row.to_dict()
-        })
+        df = extract_sheet(worksheet)
     
-    if not rows:
-        print("⚠️  Нет валидных данных для загрузки")
-        return
+    record(rows_parsed=len(df))
+    payload = sheet_payload(df)
+    content_hash = hashlib.sha256(payload).hexdigest()
+    
+    loaded = 0
+    if is_same_content(state, content_hash, date_from, date_to):
+        print(f"⏭️  Данные листа '{source.title}' за период не изменились, пропускаем загрузку строк")
+    elif df.empty:
+        print(f"⚠️  Нет данных для загрузки ({source.title})")
+    else:
+        loaded = _load_frame(table, df, patterns, f"sheets:{source.key}", payload)
     
-    # Загружаем в БД
-    conn = get_db_connection()
-    cur = conn.cursor()
+    save_state(source.key, spreadsheet_id, worksheet.id, metadata, content_hash, date_from, date_to)
+    return loaded
+
+
+def load_direct_data(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    force: bool = False
+):
+    """
+    Загрузить данные из таблицы "Директ" в БД.
     
-    try:
-        execute_values(
-            cur,
-            """
-            INSERT INTO sheets_raw_fot 
-            (report_date, department, fot_couriers, fot_cooks, fot_cleaners, raw_data)
-            VALUES %s
-            ON CONFLICT (report_date, department) 
-            DO UPDATE SET
-                fot_couriers = EXCLUDED.fot_couriers,
-                fot_cooks = EXCLUDED.fot_cooks,
-                fot_cleaners = EXCLUDED.fot_cleaners,
-                raw_data = EXCLUDED.raw_data,
-                loaded_at = CURRENT_TIMESTAMP
-            """,
-            [
-                (
-                    row["report_date"],
-                    row["department"],
-                    row["fot_couriers"],
-                    row["fot_cooks"],
-                    row["fot_cleaners"],
-                    json.dumps(row["raw_data"])
-                )
-                for row in rows
-            ]
-        )
-        print(f"✅ Загружено {len(rows)} строк")
-    finally:
-        cur.close()
-        conn.close()
+    Args:
+        date_from: Дата начала периода (если None, загружаются все данные)
+        date_to: Дата окончания периода (если None, загружаются все данные)
+        force: Загрузить лист без проверки изменений
+    """
+    load_sheet(DIRECT_SOURCE, date_from, date_to, force)
 
 
-def run_sheets_etl(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+def load_fot_data(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    force: bool = False
+):
+    """
+    Загрузить данные ФОТ (курьеры, повара, уборщицы) в БД.
+    
+    Args:
+        date_from: Дата начала периода (если None, загружаются все данные)
+        date_to: Дата окончания периода (если None, загружаются все данные)
+        force: Загрузить лист без проверки изменений
+    """
+    load_sheet(FOT_SOURCE, date_from, date_to, force)
+
+
+def run_sheets_etl(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    max_workers: Optional[int] = None,
+    force: bool = False
+):
     """
     Запустить полный ETL процесс для данных из Google Sheets.
     
+    Листы (см. sources.get_sheet_sources) скачиваются и загружаются
+    параллельно в пуле из max_workers потоков через общий клиент gspread.
+    Листы, не изменившиеся с прошлой загрузки, пропускаются (см. load_sheet).
+    
     Args:
         date_from: Дата начала периода (по умолчанию - вчера)
         date_to: Дата окончания периода (по умолчанию - вчера)
+        max_workers: Размер пула потоков (по умолчанию GOOGLE_SHEETS_MAX_WORKERS
+                     или число листов). 1 - последовательная загрузка.
+    
+    Returns:
+        dict: Число загруженных строк по каждому листу
     """
     if date_from is None:
         date_from = datetime.now() - timedelta(days=1)
     if date_to is None:
         date_to = datetime.now() - timedelta(days=1)
     
+    sources = get_sheet_sources()
+    if max_workers is None:
+        max_workers = int(os.environ.get("GOOGLE_SHEETS_MAX_WORKERS", len(sources)))
+    
+    # Секции месяцев периода (таблицы секционированы по report_date)
+    ensure_partitions(date_from, date_to)
+    
+    # Авторизуемся заранее: общий клиент и токен используют все потоки
+    get_sheets_client()
+    stats: Dict[str, int] = {}
+    
     try:
-        load_direct_data(date_from, date_to)
-        load_fot_data(date_from, date_to)
+        if max_workers <= 1:
+            for source in sources:
+                stats[source.title] = load_sheet(source, date_from, date_to, force)
+        else:
+            errors = []
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets") as pool:
+                futures = {
+                    pool.submit(contextvars.copy_context().run, load_sheet, source, date_from, date_to, force): source.title
+                    for source in sources
+                }
+                # Остальные листы догружаются даже при ошибке в одном из них
+                for future in as_completed(futures):
+                    try:
+                        stats[futures[future]] = future.result()
+                    except Exception as e:
+                        print(f"❌ Ошибка в листе '{futures[future]}': {e}")
+                        errors.append(futures[future])
+            
+            if errors:
+                raise RuntimeError(f"Не удалось загрузить листы: {', '.join(errors)}")
         
         print("✅ ETL процесс для Google Sheets завершен успешно")
+        return stats
     except Exception as e:
         print(f"❌ Ошибка при выполнении ETL: {e}")
         raise
@@ -0,0 +1,118 @@
+"""
+Метаданные таблиц Google Sheets: версия и время последнего изменения.
+
+По ним run_sheets_etl пропускает таблицы, которые не менялись с прошлой
+загрузки (см. sync_state.py). Источник метаданных подключаемый:
+
+- drive (по умолчанию) - Google Drive API v3 (files.get, поля version и
+  modifiedTime). Адрес API задается GOOGLE_DRIVE_API_URL, так что вместо
+  Drive можно использовать локальную заглушку с тем же ответом;
+- none - метаданные не запрашиваются, таблицы скачиваются всегда
+  (неизмененные строки по-прежнему не загружаются, см. отпечаток содержимого).
+
+Источник выбирается GOOGLE_SHEETS_METADATA или задается в коде через
+set_metadata_provider().
+"""
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import requests
+
+from .auth import get_sheets_session
+
+METADATA_PROVIDERS = ("drive", "none")
+
+DRIVE_API_URL = "https://www.googleapis.com/drive/v3"
+
+
+@dataclass(frozen=True)
+class SheetMetadata:
+    """Версия таблицы и время ее последнего изменения."""
+    version: Optional[str]  # Версия файла в Drive (растет при каждом изменении)
+    modified_time: Optional[datetime]
+
+
+class MetadataProvider:
+    """Источник метаданных таблиц (None - метаданные недоступны)."""
+    
+    def get_metadata(self, spreadsheet_id: str) -> Optional[SheetMetadata]:
+        return None
+
+
+class DriveMetadataProvider(MetadataProvider):
+    """Метаданные таблиц из Google Drive API v3."""
+    
+    def __init__(self, base_url: Optional[str] = None, session: Optional[requests.Session] = None):
+        """
+        Args:
+            base_url: Адрес Drive API (по умолчанию GOOGLE_DRIVE_API_URL или DRIVE_API_URL)
+            session: HTTP сессия с авторизацией (по умолчанию - сессия общего клиента gspread)
+        """
+        self.base_url = (base_url or os.environ.get("GOOGLE_DRIVE_API_URL") or DRIVE_API_URL).rstrip("/")
+        self._session = session
+    
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            self._session = get_sheets_session()
+        return self._session
+    
+    def get_metadata(self, spreadsheet_id: str) -> Optional[SheetMetadata]:
+        resp = self.session.get(
+            f"{self.base_url}/files/{spreadsheet_id}",
+            params={"fields": "version,modifiedTime", "supportsAllDrives": "true"},
+            timeout=30
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        
+        modified_time = data.get("modifiedTime")
+        return SheetMetadata(
+            version=data.get("version"),
+            modified_time=datetime.fromisoformat(modified_time) if modified_time else None
+        )
+
+
+_provider: Optional[MetadataProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_metadata_provider() -> MetadataProvider:
+    """
+    Получить источник метаданных процесса (GOOGLE_SHEETS_METADATA, по умолчанию drive).
+    
+    Raises:
+        ValueError: Если GOOGLE_SHEETS_METADATA задан неизвестный источник
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            name = os.environ.get("GOOGLE_SHEETS_METADATA", "drive").strip().lower()
+            if name not in METADATA_PROVIDERS:
+                raise ValueError(
+                    f"Неизвестный источник метаданных '{name}', доступны: {', '.join(METADATA_PROVIDERS)}"
+                )
+            _provider = DriveMetadataProvider() if name == "drive" else MetadataProvider()
+        return _provider
+
+
+def set_metadata_provider(provider: Optional[MetadataProvider]):
+    """Задать источник метаданных процесса (None - снова выбрать по GOOGLE_SHEETS_METADATA)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+
+def fetch_metadata(spreadsheet_id: str) -> Optional[SheetMetadata]:
+    """
+    Метаданные таблицы; при ошибке источника - None (таблица будет скачана).
+    """
+    provider = get_metadata_provider()
+    try:
+        return provider.get_metadata(spreadsheet_id)
+    except (requests.RequestException, ValueError) as e:
+        print(f"⚠️  Не удалось получить метаданные таблицы {spreadsheet_id}: {e}")
+        return None
@@ -0,0 +1,315 @@
+"""
+Индекс строк листов Google Sheets по датам.
+
+Для каждого листа в Neon хранится соответствие дата -> номера строк
+(schema/009_sheets_row_index.sql), поэтому за период скачиваются только
+строки нужных дат одним запросом values:batchGet, а не весь лист.
+
+Каждый запуск читает шапку листа и колонку дат начиная с последней
+проиндексированной строки (новые строки дописываются в индекс). Индекс
+строится заново, если изменилась шапка листа, дата в последней
+проиндексированной строке или строки, полученные по индексу, не
+соответствуют своим датам (строки вставлены, удалены или отсортированы).
+"""
+import hashlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from gspread.utils import numericise_all, rowcol_to_a1
+
+from neon.db import atomic, connection
+
+DATE_FORMAT = "%d.%m.%Y"
+
+# Первая строка данных (строка 1 - шапка)
+FIRST_DATA_ROW = 2
+
+
+def find_date_column(header: Sequence[str]) -> Optional[int]:
+    """Номер колонки с датой (с 1) - первой, в названии которой есть "дата"."""
+    for i, name in enumerate(header, start=1):
+        if "дата" in str(name).strip().lower():
+            return i
+    return None
+
+
+def _header_hash(header: Sequence[str]) -> str:
+    return hashlib.md5("\x1f".join(map(str, header)).encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def _column_letter(column: int) -> str:
+    return rowcol_to_a1(1, column)[:-1]
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    try:
+        return datetime.strptime(str(value).strip(), DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def _index_column(values: List[List[Any]], first_row: int) -> Dict[date, List[int]]:
+    """Номера строк для каждой даты из значений колонки дат, начиная со строки first_row."""
+    entries: Dict[date, List[int]] = {}
+    for offset, cells in enumerate(values):
+        report_date = _parse_date(cells[0]) if cells else None
+        if report_date is not None:
+            entries.setdefault(report_date, []).append(first_row + offset)
+    return entries
+
+
+def _row_ranges(row_numbers: Sequence[int]) -> List[Tuple[int, int]]:
+    """Объединить номера строк в непрерывные диапазоны (первая, последняя)."""
+    ranges: List[Tuple[int, int]] = []
+    for row in sorted(set(row_numbers)):
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    return ranges
+
+
+def _load_layout(spreadsheet_id: str, worksheet_id: int) -> Optional[tuple]:
+    """Сохраненная структура листа: (header_hash, date_column, indexed_rows, last_date)."""
+    with connection(isolated=True) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT header_hash, date_column, indexed_rows, last_date
+                FROM sheets_layout
+                WHERE spreadsheet_id = %s AND worksheet_id = %s
+                """,
+                (spreadsheet_id, worksheet_id)
+            )
+            return cur.fetchone()
+        finally:
+            cur.close()
+
+
+def _load_rows(
+    spreadsheet_id: str,
+    worksheet_id: int,
+    dates: Sequence[date]
+) -> Dict[date, List[int]]:
+    """Номера строк листа для дат из индекса."""
+    with connection(isolated=True) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT report_date, row_numbers
+                FROM sheets_row_index
+                WHERE spreadsheet_id = %s AND worksheet_id = %s AND report_date = ANY(%s)
+                """,
+                (spreadsheet_id, worksheet_id, list(dates))
+            )
+            return dict(cur.fetchall())
+        finally:
+            cur.close()
+
+
+def indexed_dates(spreadsheet_id: str, worksheet_id: int, dates: Sequence[date]) -> Optional[Set[date]]:
+    """
+    Даты, для которых в индексе листа есть строки.
+    
+    Returns:
+        set: Даты из dates со строками в листе или None, если индекс листа не построен
+    """
+    with connection(isolated=True) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT 1 FROM sheets_layout WHERE spreadsheet_id = %s AND worksheet_id = %s",
+                (spreadsheet_id, worksheet_id)
+            )
+            if cur.fetchone() is None:
+                return None
+        finally:
+            cur.close()
+    
+    return set(_load_rows(spreadsheet_id, worksheet_id, dates))
+
+
+def _save_index(
+    spreadsheet_id: str,
+    worksheet_id: int,
+    header_hash: str,
+    date_column: int,
+    indexed_rows: int,
+    last_date: Optional[date],
+    entries: Dict[date, List[int]],
+    rebuild: bool
+):
+    """
+    Сохранить индекс листа одной транзакцией, вне транзакции запуска.
+    
+    При rebuild=True индекс листа заменяется целиком, иначе номера строк
+    дописываются к уже сохраненным для тех же дат. Граница индекса
+    (indexed_rows, last_date) сдвигается после записи номеров строк.
+    """
+    with atomic(isolated=True) as conn:
+        cur = conn.cursor()
+        try:
+            if rebuild:
+                cur.execute(
+                    "DELETE FROM sheets_layout WHERE spreadsheet_id = %s AND worksheet_id = %s",
+                    (spreadsheet_id, worksheet_id)
+                )
+            # Новый лист - пустой индекс, граница выставляется ниже
+            cur.execute(
+                """
+                INSERT INTO sheets_layout
+                (spreadsheet_id, worksheet_id, header_hash, date_column, indexed_rows, last_date)
+                VALUES (%s, %s, %s, %s, %s, NULL)
+                ON CONFLICT (spreadsheet_id, worksheet_id) DO NOTHING
+                """,
+                (spreadsheet_id, worksheet_id, header_hash, date_column, FIRST_DATA_ROW - 1)
+            )
+            if entries:
+                cur.executemany(
+                    """
+                    INSERT INTO sheets_row_index (spreadsheet_id, worksheet_id, report_date, row_numbers)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (spreadsheet_id, worksheet_id, report_date)
+                    DO UPDATE SET
+                        row_numbers = sheets_row_index.row_numbers || EXCLUDED.row_numbers
+                    """,
+                    [
+                        (spreadsheet_id, worksheet_id, report_date, row_numbers)
+                        for report_date, row_numbers in entries.items()
+                    ]
+                )
+            cur.execute(
+                """
+                UPDATE sheets_layout
+                SET indexed_rows = %s, last_date = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE spreadsheet_id = %s AND worksheet_id = %s
+                """,
+                (indexed_rows, last_date, spreadsheet_id, worksheet_id)
+            )
+        finally:
+            cur.close()
+
+
+def _sync_index(worksheet, force_rebuild: bool = False) -> Optional[List[Any]]:
+    """
+    Дописать в индекс новые строки листа или построить его заново.
+    
+    Returns:
+        list: Шапка листа или None, если в листе нет колонки с датой
+    """
+    spreadsheet_id, worksheet_id = worksheet.spreadsheet_id, worksheet.id
+    layout = None if force_rebuild else _load_layout(spreadsheet_id, worksheet_id)
+    
+    # Шапка и колонка дат с последней проиндексированной строки - одним запросом
+    ranges = ["1:1"]
+    if layout is not None:
+        letter = _column_letter(layout[1])
+        ranges.append(f"{letter}{layout[2]}:{letter}")
+    value_ranges = worksheet.batch_get(ranges)
+    
+    header = value_ranges[0][0] if value_ranges[0] else []
+    date_column = find_date_column(header)
+    if date_column is None:
+        return None
+    header_hash = _header_hash(header)
+    
+    rebuild = layout is None or layout[0] != header_hash or layout[1] != date_column
+    if not rebuild and layout[2] >= FIRST_DATA_ROW:
+        # Дата в последней проиндексированной строке изменилась - строки сместились
+        boundary = value_ranges[1][0] if value_ranges[1] else []
+        rebuild = _parse_date(boundary[0] if boundary else "") != layout[3]
+    
+    if rebuild:
+        if layout is not None:
+            print("🔁 Изменилась структура листа, индекс строк строится заново")
+        letter = _column_letter(date_column)
+        first_row = FIRST_DATA_ROW
+        tail = list(worksheet.batch_get([f"{letter}{first_row}:{letter}"])[0])
+    else:
+        first_row = layout[2] + 1
+        tail = list(value_ranges[1])[1:]
+    
+    if not rebuild and not tail:
+        return header
+    
+    # Пустые строки в конце колонки API не возвращает: индексируются строки до последней непустой
+    indexed_rows = first_row - 1 + len(tail)
+    last_date = _parse_date(tail[-1][0] if tail and tail[-1] else "")
+    _save_index(
+        spreadsheet_id, worksheet_id, header_hash, date_column, indexed_rows, last_date,
+        _index_column(tail, first_row), rebuild
+    )
+    return header
+
+
+def _fetch_rows(worksheet, row_numbers: Sequence[int]) -> Dict[int, List[Any]]:
+    """Значения строк листа по номерам - одним запросом на все диапазоны."""
+    ranges = _row_ranges(row_numbers)
+    value_ranges = worksheet.batch_get([f"{first}:{last}" for first, last in ranges])
+    
+    rows: Dict[int, List[Any]] = {}
+    for (first, last), values in zip(ranges, value_ranges):
+        values = list(values)
+        for row in range(first, last + 1):
+            offset = row - first
+            rows[row] = values[offset] if offset < len(values) else []
+    return rows
+
+
+def get_records_by_dates(
+    worksheet,
+    date_from: datetime,
+    date_to: datetime
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Получить строки листа за период по индексу строк.
+    
+    Записи совпадают с результатом worksheet.get_all_records() для строк
+    с датами периода (в порядке строк листа).
+    
+    Args:
+        worksheet: Лист gspread
+        date_from: Дата начала периода
+        date_to: Дата окончания периода
+    
+    Returns:
+        list: Записи строк периода или None, если в листе нет колонки с датой
+    """
+    dates = [
+        date_from.date() + timedelta(days=i)
+        for i in range((date_to.date() - date_from.date()).days + 1)
+    ]
+    
+    for attempt in range(2):
+        header = _sync_index(worksheet, force_rebuild=attempt > 0)
+        if header is None:
+            return None
+        
+        row_dates = {
+            row: report_date
+            for report_date, row_numbers in _load_rows(worksheet.spreadsheet_id, worksheet.id, dates).items()
+            for row in row_numbers
+        }
+        if not row_dates:
+            return []
+        
+        rows = _fetch_rows(worksheet, list(row_dates))
+        date_index = find_date_column(header) - 1
+        stale = [
+            row for row, values in rows.items()
+            if _parse_date(values[date_index] if date_index < len(values) else "") != row_dates[row]
+        ]
+        if not stale:
+            break
+        print(f"🔁 Строки листа сместились ({len(stale)} не совпадают с индексом), индекс строится заново")
+    else:
+        raise RuntimeError(f"Индекс строк листа '{worksheet.title}' не совпадает с данными после перестроения")
+    
+    width = len(header)
+    values = [
+        numericise_all((rows[row] + [""] * width)[:width], default_blank="")
+        for row in sorted(rows)
+    ]
+    return [dict(zip(header, row)) for row in values]
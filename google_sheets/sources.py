@@ -0,0 +1,72 @@
+"""
+Листы Google Sheets, загружаемые в Neon.
+
+Каждый лист задается описанием SheetSource: таблица, вкладка и вид данных
+(direct - рекламный бюджет и ФОТ директ, fot - ФОТ курьеров, поваров и
+уборщиц), от которого зависят колонки листа и сырая таблица в Neon.
+
+Список листов по умолчанию - таблицы "Директ" и ФОТ. Другой список (например,
+отдельные таблицы филиалов) задается JSON массивом в GOOGLE_SHEETS_SOURCES:
+
+    [{"key": "direct_2", "title": "Директ (филиал 2)", "kind": "direct",
+      "url": "https://docs.google.com/spreadsheets/d/...", "sheet": "Директ"}]
+"""
+import os
+import json
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .extract import DIRECT_SHEET_URL, DIRECT_SHEET_NAME, FOT_SHEET_URL
+
+SHEET_KINDS = ("direct", "fot")
+
+
+@dataclass(frozen=True)
+class SheetSource:
+    """Лист Google Sheets и вид его данных."""
+    key: str  # Короткий ключ листа (источник в raw_payloads: sheets:<key>)
+    title: str  # Название для логов
+    kind: str  # Вид данных: direct или fot
+    url: str  # URL или ID таблицы
+    sheet_name: Optional[str] = None  # Вкладка (None - первая)
+
+
+DIRECT_SOURCE = SheetSource("direct", "Директ", "direct", DIRECT_SHEET_URL, DIRECT_SHEET_NAME)
+FOT_SOURCE = SheetSource("fot", "ФОТ", "fot", FOT_SHEET_URL)
+
+DEFAULT_SHEET_SOURCES: Tuple[SheetSource, ...] = (DIRECT_SOURCE, FOT_SOURCE)
+
+
+def get_sheet_sources() -> Tuple[SheetSource, ...]:
+    """
+    Листы для загрузки (GOOGLE_SHEETS_SOURCES или листы по умолчанию).
+    
+    Raises:
+        ValueError: Если в GOOGLE_SHEETS_SOURCES неизвестный вид данных или повторяется ключ
+    """
+    config = os.environ.get("GOOGLE_SHEETS_SOURCES")
+    if not config:
+        return DEFAULT_SHEET_SOURCES
+    
+    sources = tuple(
+        SheetSource(
+            key=item["key"],
+            title=item.get("title", item["key"]),
+            kind=item["kind"],
+            url=item["url"],
+            sheet_name=item.get("sheet")
+        )
+        for item in json.loads(config)
+    )
+    
+    for source in sources:
+        if source.kind not in SHEET_KINDS:
+            raise ValueError(
+                f"Неизвестный вид данных листа '{source.kind}' ({source.key}), "
+                f"доступны: {', '.join(SHEET_KINDS)}"
+            )
+    keys = [source.key for source in sources]
+    if len(set(keys)) != len(keys):
+        raise ValueError("Ключи листов в GOOGLE_SHEETS_SOURCES должны быть уникальными")
+    
+    return sources
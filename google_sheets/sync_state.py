@@ -0,0 +1,174 @@
+"""
+Состояние загрузки листов Google Sheets (таблица sheets_sync_state).
+
+Для каждого листа хранятся версия таблицы в Drive на момент последней
+успешной загрузки, загруженный период и отпечаток содержимого (SHA-256
+выгрузки листа за период, тот же, что payload_hash в raw_payloads).
+
+- Версия таблицы не изменилась, а даты периода запуска либо входят
+  в загруженный период, либо отсутствуют в листе (по индексу строк,
+  см. row_index.py) - лист не скачивается.
+- Лист скачан, но его содержимое за тот же период совпало с отпечатком
+  (например, изменилась другая вкладка таблицы) - строки не загружаются.
+
+Состояние пишется тем же подключением, что и строки листа: внутри
+run_transaction() оно откатывается вместе с ними.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from neon.db import connection
+from .metadata import SheetMetadata
+from .row_index import indexed_dates
+
+
+@dataclass(frozen=True)
+class SyncState:
+    """Последняя успешная загрузка листа."""
+    spreadsheet_id: str
+    worksheet_id: Optional[int]
+    version: Optional[str]
+    modified_time: Optional[datetime]
+    content_hash: str
+    date_from: Optional[date]  # None - загружен весь лист
+    date_to: Optional[date]
+
+
+def _period(date_from: Optional[datetime], date_to: Optional[datetime]):
+    if date_from and date_to:
+        return date_from.date(), date_to.date()
+    return None, None
+
+
+def load_state(source: str) -> Optional[SyncState]:
+    """Состояние последней загрузки листа (None - лист еще не загружался)."""
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT spreadsheet_id, worksheet_id, version, modified_time, content_hash, date_from, date_to
+                FROM sheets_sync_state
+                WHERE source = %s
+                """,
+                (source,)
+            )
+            row = cur.fetchone()
+        finally:
+            cur.close()
+    
+    return SyncState(*row) if row else None
+
+
+def is_unchanged(
+    state: Optional[SyncState],
+    metadata: Optional[SheetMetadata],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> bool:
+    """
+    Таблица не менялась с последней загрузки, а данных за период запуска,
+    которые еще не загружены, в листе нет.
+    """
+    if state is None or metadata is None:
+        return False
+    
+    if metadata.version is not None:
+        same_revision = metadata.version == state.version
+    else:
+        same_revision = metadata.modified_time is not None and metadata.modified_time == state.modified_time
+    if not same_revision:
+        return False
+    
+    # Загружен весь лист - подходит любой период
+    if state.date_from is None:
+        return True
+    period_from, period_to = _period(date_from, date_to)
+    if period_from is None:
+        return False
+    
+    missing = [
+        period_from + timedelta(days=i)
+        for i in range((period_to - period_from).days + 1)
+        if not state.date_from <= period_from + timedelta(days=i) <= state.date_to
+    ]
+    if not missing:
+        return True
+    
+    # Индекс строк построен при прошлой загрузке той же версии таблицы:
+    # строк с датами вне загруженного периода в листе нет - загружать нечего
+    if state.worksheet_id is None:
+        return False
+    indexed = indexed_dates(state.spreadsheet_id, state.worksheet_id, missing)
+    return indexed is not None and not indexed
+
+
+def is_same_content(
+    state: Optional[SyncState],
+    content_hash: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> bool:
+    """Содержимое листа за период совпадает с загруженным в прошлый раз."""
+    return (
+        state is not None
+        and state.content_hash == content_hash
+        and (state.date_from, state.date_to) == _period(date_from, date_to)
+    )
+
+
+def save_state(
+    source: str,
+    spreadsheet_id: str,
+    worksheet_id: int,
+    metadata: Optional[SheetMetadata],
+    content_hash: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    """
+    Записать состояние после успешной загрузки листа.
+    
+    Args:
+        source: Ключ листа (sources.SheetSource.key)
+        spreadsheet_id: ID таблицы
+        worksheet_id: gid листа
+        metadata: Метаданные таблицы, полученные перед скачиванием
+        content_hash: SHA-256 выгрузки листа за период
+        date_from: Дата начала загруженного периода (None - весь лист)
+        date_to: Дата окончания загруженного периода
+    """
+    period_from, period_to = _period(date_from, date_to)
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO sheets_sync_state
+                (source, spreadsheet_id, worksheet_id, version, modified_time, content_hash, date_from, date_to)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (source)
+                DO UPDATE SET
+                    spreadsheet_id = EXCLUDED.spreadsheet_id,
+                    worksheet_id = EXCLUDED.worksheet_id,
+                    version = EXCLUDED.version,
+                    modified_time = EXCLUDED.modified_time,
+                    content_hash = EXCLUDED.content_hash,
+                    date_from = EXCLUDED.date_from,
+                    date_to = EXCLUDED.date_to,
+                    synced_at = CURRENT_TIMESTAMP
+                """,
+                (
+                    source,
+                    spreadsheet_id,
+                    worksheet_id,
+                    metadata.version if metadata else None,
+                    metadata.modified_time if metadata else None,
+                    content_hash,
+                    period_from,
+                    period_to
+                )
+            )
+        finally:
+            cur.close()
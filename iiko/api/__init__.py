@@ -2,6 +2,10 @@
 Модуль для работы с iiko Server API.
 """
 from .auth import get_token
+from .client import IikoClient, get_client, close_clients
+from .policy import RequestPolicy
+from .report_specs import REPORT_SPECS, ReportSpec
+from .sources import IikoSource, get_iiko_sources
 from .olap_reports import (
     get_olap_report,
     get_margin_report,
@@ -12,6 +16,14 @@ from .olap_reports import (
 
 __all__ = [
     "get_token",
+    "IikoClient",
+    "get_client",
+    "close_clients",
+    "RequestPolicy",
+    "REPORT_SPECS",
+    "ReportSpec",
+    "IikoSource",
+    "get_iiko_sources",
     "get_olap_report",
     "get_margin_report",
     "get_load_orders_report",
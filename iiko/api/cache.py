@@ -0,0 +1,223 @@
+"""
+Локальный кеш сырых ответов OLAP отчетов iiko.
+
+Тело ответа сохраняется один раз в сжатом виде под своим SHA-256
+(blobs/ab/abcd....json.gz), а индекс (index/<ключ запроса>.json) связывает
+запрос - ID и название отчета, период - с содержимым и временем получения.
+
+Срок жизни записи зависит от периода отчета:
+- период заканчивается раньше, чем IIKO_CACHE_SETTLE_DAYS дней назад
+  (закрытые дни) - запись не устаревает;
+- период включает сегодняшний день - IIKO_CACHE_TTL_TODAY секунд;
+- остальные (недавние) дни - IIKO_CACHE_TTL_RECENT секунд.
+
+Ответ всегда сначала сохраняется на диск, а затем разбирается из файла, так
+что хеш содержимого известен до загрузки строк (см. neon/payloads.py).
+IIKO_CACHE=0 отключает повторное использование сохраненных ответов,
+IIKO_CACHE_DIR задает каталог (по умолчанию .cache/iiko).
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# Размер чанка при чтении ответа из кеша
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def is_enabled() -> bool:
+    """Использовать ли сохраненные ответы (IIKO_CACHE, по умолчанию 1)."""
+    return os.environ.get("IIKO_CACHE", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def cache_dir() -> str:
+    return os.environ.get("IIKO_CACHE_DIR", os.path.join(".cache", "iiko"))
+
+
+def request_key(
+    report_id: str,
+    report_name: Optional[str],
+    date_from: datetime,
+    date_to: datetime,
+    body: Optional[Dict[str, Any]] = None,
+    source: Optional[str] = None
+) -> str:
+    """
+    Ключ запроса: отчет, название, период (по дням), тело запроса и сервер.
+
+    Сервер (ключ из sources.py) входит в ключ, только если передан: ключи
+    запросов к серверу по умолчанию не меняются.
+    """
+    key = [report_id, report_name, date_from.date().isoformat(), date_to.date().isoformat(), body]
+    if source is not None:
+        key.append(source)
+    payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def entry_ttl(date_to: datetime, now: Optional[datetime] = None) -> Optional[float]:
+    """Срок жизни записи в секундах (None - бессрочно)."""
+    today = (now or datetime.now()).date()
+    settle_days = int(os.environ.get("IIKO_CACHE_SETTLE_DAYS", "1"))
+
+    if date_to.date() >= today:
+        return float(os.environ.get("IIKO_CACHE_TTL_TODAY", "600"))
+    if date_to.date() >= today - timedelta(days=settle_days):
+        return float(os.environ.get("IIKO_CACHE_TTL_RECENT", "21600"))
+    return None
+
+
+def _index_path(key: str) -> str:
+    return os.path.join(cache_dir(), "index", f"{key}.json")
+
+
+def _blob_path(sha256: str) -> str:
+    return os.path.join(cache_dir(), "blobs", sha256[:2], f"{sha256}.json.gz")
+
+
+def _read_index(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_index_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def lookup(key: str, date_to: datetime, ignore_ttl: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Найти сохраненный ответ по ключу запроса.
+
+    Args:
+        key: Ключ запроса (request_key)
+        date_to: Конец периода отчета - определяет срок жизни записи
+        ignore_ttl: Вернуть запись независимо от срока жизни (режим replay)
+
+    Returns:
+        dict: Запись индекса и путь к сжатому телу ответа (path) или None,
+              если записи нет или она устарела
+    """
+    entry = _read_index(key)
+    if entry is None:
+        return None
+
+    path = _blob_path(entry["sha256"])
+    if not os.path.exists(path):
+        return None
+
+    if not ignore_ttl:
+        ttl = entry_ttl(date_to)
+        if ttl is not None and time.time() - entry["fetched_at"] > ttl:
+            return None
+
+    return {**entry, "path": path}
+
+
+def iter_blob(path: str) -> Iterator[bytes]:
+    """Прочитать сохраненное тело ответа чанками."""
+    with gzip.open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def store(chunks: Iterable[bytes], key: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Сохранить тело ответа в кеш, читая его по частям.
+
+    Тело сжимается на лету в файл рядом с кешем; запись индекса создается
+    только если ответ прочитан полностью, при ошибке временный файл удаляется.
+
+    Args:
+        chunks: Тело ответа по частям
+        key: Ключ запроса (request_key)
+        meta: Описание запроса для индекса (отчет, период)
+
+    Returns:
+        dict: Запись индекса (sha256, size, fetched_at, ...) и путь к телу (path)
+    """
+    base = cache_dir()
+    os.makedirs(base, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=base, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as gz:
+            for chunk in chunks:
+                digest.update(chunk)
+                gz.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    sha256 = digest.hexdigest()
+    path = _blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp)  # Такое содержимое уже сохранено
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+
+    entry = {
+        **meta,
+        "sha256": sha256,
+        "size": size,
+        "fetched_at": time.time(),
+    }
+    _write_json_atomic(_index_path(key), entry)
+    return {**entry, "path": path}
+
+
+def prune() -> int:
+    """
+    Удалить устаревшие записи индекса и не используемые ими тела ответов.
+
+    Returns:
+        int: Число удаленных файлов
+    """
+    base = cache_dir()
+    index_dir = os.path.join(base, "index")
+    blobs_dir = os.path.join(base, "blobs")
+    removed = 0
+    referenced = set()
+
+    if os.path.isdir(index_dir):
+        for name in os.listdir(index_dir):
+            key = name[:-len(".json")]
+            entry = _read_index(key)
+            if entry is None:
+                continue
+            date_to = datetime.fromisoformat(entry["date_to"])
+            if lookup(key, date_to) is None:
+                os.remove(os.path.join(index_dir, name))
+                removed += 1
+            else:
+                referenced.add(entry["sha256"])
+
+    if os.path.isdir(blobs_dir):
+        for prefix in os.listdir(blobs_dir):
+            for name in os.listdir(os.path.join(blobs_dir, prefix)):
+                if name.split(".")[0] not in referenced:
+                    os.remove(os.path.join(blobs_dir, prefix, name))
+                    removed += 1
+
+    return removed
+
+
+if __name__ == "__main__":
+    print(f"🧹 Удалено файлов из кеша: {prune()}")
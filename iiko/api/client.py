@@ -0,0 +1,237 @@
+"""
+Клиент iiko Server API с пулом соединений и общим токеном.
+
+Один клиент на сервер разделяется всеми потоками процесса: HTTP соединения
+переиспользуются (keep-alive), токен кешируется с TTL и обновляется при 401,
+а при завершении работы выполняется logout, чтобы освободить слот лицензии.
+Повторы, число одновременных запросов и приостановка запросов к неотвечающему
+серверу - по общей политике клиента (см. policy.py). Клиенты нескольких
+серверов (sources.py) делят общий предел одновременных запросов
+IIKO_GLOBAL_CONCURRENCY.
+"""
+import os
+import atexit
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+from .policy import RequestPolicy
+from .sources import IikoSource, get_iiko_sources
+
+
+class IikoClient:
+    """
+    Клиент iiko Server API.
+
+    Args:
+        base_url: Адрес сервера (например, https://your-iiko-server.example:443)
+        login: Логин пользователя API
+        password_sha1: SHA1-хеш пароля
+        max_concurrency: Максимум одновременных запросов к серверу
+                         (по умолчанию IIKO_MAX_CONCURRENCY или 4)
+        token_ttl: Время жизни токена в секундах (по умолчанию IIKO_TOKEN_TTL или 900)
+        policy: Политика запросов (по умолчанию RequestPolicy.from_env)
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        login: str,
+        password_sha1: str,
+        max_concurrency: Optional[int] = None,
+        token_ttl: Optional[float] = None,
+        policy: Optional[RequestPolicy] = None
+    ):
+        if max_concurrency is None:
+            max_concurrency = int(os.environ.get("IIKO_MAX_CONCURRENCY", "4"))
+        if token_ttl is None:
+            token_ttl = float(os.environ.get("IIKO_TOKEN_TTL", "900"))
+
+        self.base = base_url.rstrip("/")
+        self.login = login
+        self.password_sha1 = password_sha1
+        self.token_ttl = token_ttl
+
+        # Повторы и адаптивное ограничение одновременных запросов к серверу
+        # для всех потоков процесса
+        self.policy = policy or RequestPolicy.from_env(max_concurrency)
+
+        # Пул keep-alive соединений: одно TCP+TLS соединение на поток-запрос
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency) + 1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip"
+
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def _auth(self) -> str:
+        resp = self.session.get(
+            f"{self.base}/resto/api/auth",
+            params={"login": self.login, "pass": self.password_sha1},
+            timeout=30
+        )
+        resp.raise_for_status()
+
+        token = resp.text.strip()
+        print(f"🔑 Token: {token[:6]}...")
+        return token
+
+    def _logout(self, token: str):
+        """Освободить токен (ошибки игнорируются: токен и так истечет)."""
+        try:
+            self.session.get(f"{self.base}/resto/api/logout", params={"key": token}, timeout=10)
+        except requests.RequestException:
+            pass
+
+    def get_token(self, force_refresh: bool = False) -> str:
+        """
+        Получить общий токен, авторизуясь при отсутствии или истечении TTL.
+
+        Raises:
+            requests.RequestException: При ошибке авторизации
+        """
+        with self._token_lock:
+            if force_refresh or self._token is None or time.monotonic() >= self._token_expires_at:
+                if self._token is not None:
+                    self._logout(self._token)
+                    self._token = None
+                self._token = self._auth()
+                self._token_expires_at = time.monotonic() + self.token_ttl
+            return self._token
+
+    def _refresh_token(self, rejected: str) -> str:
+        """Обновить токен после 401, если другой поток еще не сделал этого."""
+        with self._token_lock:
+            if self._token == rejected:
+                self._token = None
+        return self.get_token()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict] = None,
+        token: Optional[str] = None,
+        retry: bool = True,
+        consume: Optional[Callable[[requests.Response], Any]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Выполнить запрос к API с токеном в параметре key.
+
+        Если token не передан, используется общий токен клиента: при ответе
+        401 он обновляется и запрос повторяется один раз. Ответы 429 и 5xx
+        и ошибки соединения повторяются по политике клиента (self.policy).
+
+        Args:
+            retry: Повторять запрос по политике; False - одна попытка (повторы
+                   выполняет вызывающий код через self.policy.run, например,
+                   чтобы повторить и чтение тела ответа)
+            consume: Прочитать ответ, не освобождая место в лимите параллельности
+                     (см. RequestPolicy.send); возвращается его результат
+
+        Raises:
+            policy.RetryableStatusError: Ответ 429 или 5xx после всех попыток
+            policy.CircuitOpenError: Запросы к серверу приостановлены
+            requests.RequestException: Ошибка соединения после всех попыток
+        """
+        params = dict(params or {})
+        url = f"{self.base}{path}"
+        shared_token = token is None
+
+        def attempt() -> requests.Response:
+            request_token = self.get_token() if shared_token else token
+            resp = self.session.request(method, url, params={**params, "key": request_token}, **kwargs)
+
+            if resp.status_code == 401 and shared_token:
+                resp.close()
+                request_token = self._refresh_token(request_token)
+                resp = self.session.request(method, url, params={**params, "key": request_token}, **kwargs)
+            return resp
+
+        if not retry:
+            return self.policy.send(attempt, consume)
+        return self.policy.run(lambda: self.policy.send(attempt, consume), f"{method} {path}")
+
+    def logout(self):
+        """Выйти из API, освободив слот лицензии iiko Server."""
+        with self._token_lock:
+            if self._token is not None:
+                self._logout(self._token)
+                print("🔒 Logout из iiko Server API")
+            self._token = None
+            self._token_expires_at = 0.0
+
+    def close(self):
+        """Выполнить logout и закрыть пул соединений."""
+        self.logout()
+        self.session.close()
+
+
+_clients: Dict[str, IikoClient] = {}
+_clients_lock = threading.Lock()
+_atexit_registered = False
+_budget: Optional[threading.Semaphore] = None
+
+
+def _global_budget() -> Optional[threading.Semaphore]:
+    """Общий для всех серверов предел одновременных запросов (IIKO_GLOBAL_CONCURRENCY, 0 - нет)."""
+    global _budget
+    if _budget is None:
+        limit = int(os.environ.get("IIKO_GLOBAL_CONCURRENCY", "0"))
+        if limit > 0:
+            _budget = threading.BoundedSemaphore(limit)
+    return _budget
+
+
+def get_client(source: Optional[IikoSource] = None) -> IikoClient:
+    """
+    Получить общий для процесса клиент сервера iiko.
+
+    Args:
+        source: Сервер (по умолчанию - первый из sources.get_iiko_sources:
+                IIKO_BASE_URL, IIKO_LOGIN и IIKO_PASSWORD_SHA1, если
+                IIKO_SOURCES не задана)
+
+    При завершении процесса клиенты выполняют logout.
+
+    Raises:
+        ValueError: Если не задан адрес, логин или пароль сервера
+    """
+    global _atexit_registered
+    if source is None:
+        source = get_iiko_sources()[0]
+    if not (source.base_url and source.login and source.password_sha1):
+        raise ValueError(f"Не заданы адрес, логин или пароль сервера iiko '{source.key}'")
+
+    with _clients_lock:
+        if source.key not in _clients:
+            if not _atexit_registered:
+                atexit.register(close_clients)
+                _atexit_registered = True
+            name = "iiko" if source.is_default else f"iiko {source.title}"
+            _clients[source.key] = IikoClient(
+                base_url=source.base_url,
+                login=source.login,
+                password_sha1=source.password_sha1,  # SHA1-хеш
+                max_concurrency=source.max_concurrency,
+                policy=RequestPolicy.from_env(source.max_concurrency, name, _global_budget())
+            )
+        return _clients[source.key]
+
+
+def close_clients():
+    """Выполнить logout и закрыть все клиенты процесса."""
+    global _budget
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _budget = None
+
+    for client in clients:
+        client.close()
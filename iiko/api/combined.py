@@ -0,0 +1,128 @@
+"""
+Сводный OLAP запрос: отчеты маржи и нагрузки по часам одним запросом.
+
+Вместо трех сохраненных отчетов (margin, load_orders, load_revenue в
+REPORT_SPECS) запрашивается один OLAP отчет по продажам с явными полями
+группировки на самом мелком нужном уровне - дата × предприятие × час × тип
+обслуживания. Строки отчетов получаются из него локальной сверткой
+(rollup_rows), поэтому сервер выполняет одну агрегацию вместо трех, а
+отчеты гарантированно согласованы между собой.
+
+Все поля группировки - поля заказа, так что каждый заказ попадает ровно в
+одну строку ответа и суммы не завышаются. Маржа, как и сохраненный отчет,
+учитывает только доставку и самовывоз (MARGIN_SERVICE_TYPES) - фильтр
+применяется при свертке. Типы скидок в сводный запрос не входят: заказ с
+несколькими типами скидок попал бы в строки каждого из них, поэтому отчет
+"Типы скидок" загружается своим запросом (extract.load_combined).
+
+Режим включается IIKO_OLAP_MODE=combined (по умолчанию reports - запрос на
+каждый сохраненный отчет).
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+from .olap_reports import olap_request_body
+from .report_specs import NOT_DELETED_FILTERS, REPORT_SPECS
+
+COMBINED_KEY = "combined"
+COMBINED_TITLE = "Сводный OLAP (маржа и нагрузка)"
+
+# Отчеты, строки которых получаются сверткой сводного запроса
+COMBINED_REPORTS = ("margin", "load_orders", "load_revenue")
+
+# Поля группировки: самый мелкий уровень среди отчетов, только поля заказа
+COMBINED_ROW_FIELDS = ("OpenDate.Typed", "Department", "HourOpen", "Delivery.ServiceType")
+
+# Аддитивные показатели: проценты пересчитываются из сумм
+COMBINED_AGGREGATE_FIELDS = (
+    "UniqOrderId.OrdersCount",
+    "DishSumInt",
+    "DishDiscountSumInt",
+    "DiscountSum",
+    "ProductCostBase.ProductCost",
+)
+
+# Типы обслуживания в отчете "Маржа" (фильтр его спецификации)
+MARGIN_SERVICE_TYPES = frozenset(dict(REPORT_SPECS["margin"].filters)["Delivery.ServiceType"])
+
+
+def is_enabled() -> bool:
+    """Загружать ли отчеты сводным запросом (IIKO_OLAP_MODE=combined)."""
+    return os.environ.get("IIKO_OLAP_MODE", "reports").strip().lower() == COMBINED_KEY
+
+
+def combined_request_body(date_from: datetime, date_to: datetime) -> Dict[str, Any]:
+    """Тело сводного запроса /resto/api/v2/reports/olap (без удаленных заказов и блюд)."""
+    return olap_request_body(
+        COMBINED_ROW_FIELDS, COMBINED_AGGREGATE_FIELDS, date_from, date_to, NOT_DELETED_FILTERS
+    )
+
+
+def _number(row: Dict[str, Any], field: str) -> float:
+    value = row.get(field)
+    return value if value is not None else 0
+
+
+def rollup_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Свернуть строки сводного запроса в строки отчетов COMBINED_REPORTS.
+
+    Строки читаются один раз; суммы копятся по ключу каждого отчета.
+    Результат - строки с полями, как в ответах сохраненных отчетов, так что
+    они загружаются по тем же спецификациям (REPORT_SPECS):
+    - margin: выручка, скидка и себестоимость (% от выручки со скидкой) по
+      дням, только доставка и самовывоз (MARGIN_SERVICE_TYPES);
+    - load_orders, load_revenue: заказы и выручка со скидкой по часам (все
+      типы обслуживания).
+
+    Returns:
+        dict: Ключ отчета -> строки отчета
+    """
+    # (дата, предприятие) -> [выручка, скидка, выручка со скидкой, себестоимость]
+    margin: Dict[tuple, List[float]] = {}
+    # (дата, предприятие, час) -> [заказы, выручка со скидкой]
+    hourly: Dict[tuple, List[float]] = {}
+
+    for row in rows:
+        day = row.get("OpenDate.Typed")
+        department = row.get("Department")
+        hour = row.get("HourOpen")
+        revenue = _number(row, "DishDiscountSumInt")
+
+        if row.get("Delivery.ServiceType") in MARGIN_SERVICE_TYPES:
+            sums = margin.get((day, department))
+            if sums is None:
+                sums = margin[(day, department)] = [0, 0, 0, 0]
+            sums[0] += _number(row, "DishSumInt")
+            sums[1] += _number(row, "DiscountSum")
+            sums[2] += revenue
+            sums[3] += _number(row, "ProductCostBase.ProductCost")
+
+        if hour is not None:
+            sums = hourly.get((day, department, hour))
+            if sums is None:
+                sums = hourly[(day, department, hour)] = [0, 0]
+            sums[0] += _number(row, "UniqOrderId.OrdersCount")
+            sums[1] += revenue
+
+    return {
+        "margin": [
+            {
+                "OpenDate.Typed": day,
+                "Department": department,
+                "DishSumInt": round(dish_sum, 2),
+                "DiscountSum": round(discount, 2),
+                "ProductCostBase.Percent": round(cost / revenue, 4) if revenue else None,
+            }
+            for (day, department), (dish_sum, discount, revenue, cost) in margin.items()
+        ],
+        "load_orders": [
+            {"OpenDate.Typed": day, "Department": department, "HourOpen": hour, "UniqOrderId.OrdersCount": orders}
+            for (day, department, hour), (orders, _) in hourly.items()
+        ],
+        "load_revenue": [
+            {"OpenDate.Typed": day, "Department": department, "HourOpen": hour, "DishDiscountSumInt": round(revenue, 2)}
+            for (day, department, hour), (_, revenue) in hourly.items()
+        ],
+    }
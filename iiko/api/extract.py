@@ -2,405 +2,336 @@
 Основной ETL скрипт для выгрузки данных из iiko Server API в Neon.
 """
 import os
-import json
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from functools import partial
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import execute_values
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence
 
-from .auth import get_token
-from .olap_reports import (
-    get_margin_report,
-    get_load_orders_report,
-    get_load_revenue_report,
-    get_discount_types_report
-)
+from neon.db import connection
+from neon.loader import format_counts, upsert_rows
+from neon.metrics import record
+from neon.partitions import ensure_partitions
+from neon.payloads import save_payload_file
+from . import cache, combined
+from .olap_reports import fetch_olap_payload, report_request_body
+from .report_specs import REPORT_SPECS, ReportSpec, iter_converted_rows
+from .sources import IikoSource, get_iiko_sources
+from .stream import iter_batches, iter_report_rows, report_items
 
 
-def get_db_connection():
-    """Получить подключение к Neon."""
-    conn = psycopg2.connect(os.environ["NEON_DATABASE_URL"])
-    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-    return conn
-
-
-def parse_margin_report(data: Dict[str, Any]) -> list:
+def parse_report(spec: ReportSpec, data: Any) -> List[Dict[str, Any]]:
     """
-    Парсинг отчета "Маржа" и преобразование в формат для БД.
+    Парсинг полного ответа отчета и преобразование в формат для БД.
     
-    Структура данных может отличаться в зависимости от формата ответа API.
-    Нужно будет адаптировать под реальный формат.
+    Returns:
+        list: Строки в виде словарей {колонка: значение} по spec.column_names
     """
-    rows = []
-    
-    # Предполагаем, что данные приходят в виде массива строк отчета
-    # Точная структура зависит от формата ответа iiko API
-    if isinstance(data, dict):
-        # Если данные в формате JSON с полями
-        if "rows" in data:
-            for row in data["rows"]:
-                rows.append({
-                    "report_date": row.get("OpenDate.Typed") or row.get("date"),
-                    "department": row.get("Department") or row.get("department"),
-                    "dish_sum_int": row.get("DishSumInt") or row.get("dish_sum_int"),
-                    "discount_sum": row.get("DiscountSum") or row.get("discount_sum"),
-                    "product_cost_base_percent": row.get("ProductCostBase.Percent") or row.get("cost_percent"),
-                    "raw_data": json.dumps(row)
-                })
-        else:
-            # Альтернативный формат - плоская структура
-            rows.append({
-                "report_date": data.get("date") or data.get("OpenDate.Typed"),
-                "department": data.get("Department") or data.get("department"),
-                "dish_sum_int": data.get("DishSumInt") or data.get("dish_sum_int"),
-                "discount_sum": data.get("DiscountSum") or data.get("discount_sum"),
-                "product_cost_base_percent": data.get("ProductCostBase.Percent") or data.get("cost_percent"),
-                "raw_data": json.dumps(data)
-            })
-    elif isinstance(data, list):
-        for item in data:
-            rows.append({
-                "report_date": item.get("date") or item.get("OpenDate.Typed"),
-                "department": item.get("Department") or item.get("department"),
-                "dish_sum_int": item.get("DishSumInt") or item.get("dish_sum_int"),
-                "discount_sum": item.get("DiscountSum") or item.get("discount_sum"),
-                "product_cost_base_percent": item.get("ProductCostBase.Percent") or item.get("cost_percent"),
-                "raw_data": json.dumps(item)
-            })
-    
-    return rows
+    names = spec.column_names
+    return [dict(zip(names, values)) for values in iter_converted_rows(spec, report_items(data))]
+
+
+def parse_margin_report(data: Dict[str, Any]) -> list:
+    """Парсинг отчета "Маржа" и преобразование в формат для БД."""
+    return parse_report(REPORT_SPECS["margin"], data)
 
 
 def parse_load_orders_report(data: Dict[str, Any]) -> list:
     """Парсинг отчета "Нагрузка по часам (заказы)"."""
-    rows = []
-    
-    # Аналогично parse_margin_report, адаптируем под реальный формат
-    if isinstance(data, dict):
-        if "rows" in data:
-            for row in data["rows"]:
-                rows.append({
-                    "report_date": row.get("OpenDate.Typed") or row.get("date"),
-                    "department": row.get("Department") or row.get("department"),
-                    "hour_open": row.get("HourOpen") or row.get("hour"),
-                    "orders_count": row.get("UniqOrderId.OrdersCount") or row.get("orders_count"),
-                    "raw_data": json.dumps(row)
-                })
-        else:
-            rows.append({
-                "report_date": data.get("date") or data.get("OpenDate.Typed"),
-                "department": data.get("Department") or data.get("department"),
-                "hour_open": data.get("HourOpen") or data.get("hour"),
-                "orders_count": data.get("UniqOrderId.OrdersCount") or data.get("orders_count"),
-                "raw_data": json.dumps(data)
-            })
-    elif isinstance(data, list):
-        for item in data:
-            rows.append({
-                "report_date": item.get("date") or item.get("OpenDate.Typed"),
-                "department": item.get("Department") or item.get("department"),
-                "hour_open": item.get("HourOpen") or item.get("hour"),
-                "orders_count": item.get("UniqOrderId.OrdersCount") or item.get("orders_count"),
-                "raw_data": json.dumps(item)
-            })
-    
-    return rows
+    return parse_report(REPORT_SPECS["load_orders"], data)
 
 
 def parse_load_revenue_report(data: Dict[str, Any]) -> list:
     """Парсинг отчета "Нагрузка по часам (выручка)"."""
-    rows = []
-    
-    if isinstance(data, dict):
-        if "rows" in data:
-            for row in data["rows"]:
-                rows.append({
-                    "report_date": row.get("OpenDate.Typed") or row.get("date"),
-                    "department": row.get("Department") or row.get("department"),
-                    "hour_open": row.get("HourOpen") or row.get("hour"),
-                    "dish_discount_sum_int": row.get("DishDiscountSumInt") or row.get("revenue"),
-                    "raw_data": json.dumps(row)
-                })
-        else:
-            rows.append({
-                "report_date": data.get("date") or data.get("OpenDate.Typed"),
-                "department": data.get("Department") or data.get("department"),
-                "hour_open": data.get("HourOpen") or data.get("hour"),
-                "dish_discount_sum_int": data.get("DishDiscountSumInt") or data.get("revenue"),
-                "raw_data": json.dumps(data)
-            })
-    elif isinstance(data, list):
-        for item in data:
-            rows.append({
-                "report_date": item.get("date") or item.get("OpenDate.Typed"),
-                "department": item.get("Department") or item.get("department"),
-                "hour_open": item.get("HourOpen") or item.get("hour"),
-                "dish_discount_sum_int": item.get("DishDiscountSumInt") or item.get("revenue"),
-                "raw_data": json.dumps(item)
-            })
-    
-    return rows
+    return parse_report(REPORT_SPECS["load_revenue"], data)
 
 
 def parse_discount_types_report(data: Dict[str, Any]) -> list:
     """Парсинг отчета "Типы скидок"."""
-    rows = []
-    
-    if isinstance(data, dict):
-        if "rows" in data:
-            for row in data["rows"]:
-                rows.append({
-                    "report_date": row.get("OpenDate.Typed") or row.get("date"),
-                    "department": row.get("Department") or row.get("department"),
-                    "discount_type": row.get("OrderDiscount.Type") or row.get("discount_type"),
-                    "orders_count": row.get("UniqOrderId.OrdersCount") or row.get("orders_count"),
-                    "dish_discount_sum_int": row.get("DishDiscountSumInt") or row.get("revenue"),
-                    "discount_sum": row.get("DiscountSum") or row.get("discount_sum"),
-                    "average_order_sum": row.get("DishDiscountSumInt.average") or row.get("average_check"),
-                    "raw_data": json.dumps(row)
-                })
-        else:
-            rows.append({
-                "report_date": data.get("date") or data.get("OpenDate.Typed"),
-                "department": data.get("Department") or data.get("department"),
-                "discount_type": data.get("OrderDiscount.Type") or data.get("discount_type"),
-                "orders_count": data.get("UniqOrderId.OrdersCount") or data.get("orders_count"),
-                "dish_discount_sum_int": data.get("DishDiscountSumInt") or data.get("revenue"),
-                "discount_sum": data.get("DiscountSum") or data.get("discount_sum"),
-                "average_order_sum": data.get("DishDiscountSumInt.average") or data.get("average_check"),
-                "raw_data": json.dumps(data)
-            })
-    elif isinstance(data, list):
-        for item in data:
-            rows.append({
-                "report_date": item.get("date") or item.get("OpenDate.Typed"),
-                "department": item.get("Department") or item.get("department"),
-                "discount_type": item.get("OrderDiscount.Type") or item.get("discount_type"),
-                "orders_count": item.get("UniqOrderId.OrdersCount") or item.get("orders_count"),
-                "dish_discount_sum_int": item.get("DishDiscountSumInt") or item.get("revenue"),
-                "discount_sum": item.get("DiscountSum") or item.get("discount_sum"),
-                "average_order_sum": item.get("DishDiscountSumInt.average") or item.get("average_check"),
-                "raw_data": json.dumps(item)
-            })
-    
-    return rows
+    return parse_report(REPORT_SPECS["discount_types"], data)
 
 
-def load_margin_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
-    """Загрузить отчет "Маржа" в БД."""
-    print(f"📊 Загрузка отчета 'Маржа' за период {date_from.date()} - {date_to.date()}")
-    
-    # Получаем данные из API
-    data = get_margin_report(date_from, date_to, token)
+def _load_rows(spec: ReportSpec, rows: Iterable[tuple]) -> Counter:
+    """
+    Загрузить строки в таблицу отчета пачками по IIKO_BATCH_SIZE (по умолчанию 1000).
     
-    # Парсим данные
-    rows = parse_margin_report(data)
+    Строки читаются из итератора по мере поступления, поэтому объем памяти
+    не зависит от длины периода. Способ загрузки пачки - NEON_LOAD_BACKEND
+    (см. neon.loader).
     
-    if not rows:
-        print("⚠️  Нет данных для загрузки")
-        return
+    Returns:
+        Counter: Число строк inserted / updated / unchanged
+    """
+    batch_size = int(os.environ.get("IIKO_BATCH_SIZE", "1000"))
+    counts = Counter()
     
-    # Загружаем в БД
-    conn = get_db_connection()
-    cur = conn.cursor()
+    for batch in iter_batches(rows, batch_size):
+        # Подключение берется из общего пула только на время записи пачки
+        with connection() as conn:
+            cur = conn.cursor()
+            try:
+                counts += upsert_rows(cur, spec.table, spec.column_names, spec.key_columns, batch)
+            finally:
+                cur.close()
     
-    try:
-        execute_values(
-            cur,
-            """
-            INSERT INTO iiko_raw_margin 
-            (report_date, department, dish_sum_int, discount_sum, product_cost_base_percent, raw_data)
-            VALUES %s
-            ON CONFLICT (report_date, department) 
-            DO UPDATE SET
-                dish_sum_int = EXCLUDED.dish_sum_int,
-                discount_sum = EXCLUDED.discount_sum,
-                product_cost_base_percent = EXCLUDED.product_cost_base_percent,
-                raw_data = EXCLUDED.raw_data,
-                loaded_at = CURRENT_TIMESTAMP
-            """,
-            [
-                (
-                    row["report_date"],
-                    row["department"],
-                    row["dish_sum_int"],
-                    row["discount_sum"],
-                    row["product_cost_base_percent"],
-                    row["raw_data"]
-                )
-                for row in rows
-            ]
-        )
-        print(f"✅ Загружено {len(rows)} строк")
-    finally:
-        cur.close()
-        conn.close()
+    return counts
 
 
-def load_load_orders_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
-    """Загрузить отчет "Нагрузка по часам (заказы)" в БД."""
-    print(f"📊 Загрузка отчета 'Нагрузка по часам (заказы)' за период {date_from.date()} - {date_to.date()}")
+def load_report(
+    spec: ReportSpec,
+    date_from: datetime,
+    date_to: datetime,
+    token: Optional[str] = None,
+    replay: bool = False,
+    source: Optional[IikoSource] = None
+) -> int:
+    """
+    Загрузить отчет iiko в его таблицу по спецификации.
     
-    data = get_load_orders_report(date_from, date_to, token)
-    rows = parse_load_orders_report(data)
+    Запрашиваются только поля спецификации (или сохраненный отчет целиком
+    при IIKO_OLAP_PROFILE=full, см. olap_reports). Ответ API сохраняется на
+    диск (или берется из локального кеша ответов) и один раз - в raw_payloads;
+    затем строки разбираются из файла потоком и загружаются в БД пачками со
+    ссылкой на ответ и ключом сервера (source).
     
-    if not rows:
-        print("⚠️  Нет данных для загрузки")
-        return
+    Args:
+        replay: Взять ответ только из кеша, без обращения к API
+        source: Сервер iiko (по умолчанию - первый из sources.get_iiko_sources);
+                ID и название отчета берутся из его настроек
     
-    conn = get_db_connection()
-    cur = conn.cursor()
+    Returns:
+        int: Число загруженных строк
+    """
+    if source is None:
+        source = get_iiko_sources()[0]
+    spec = source.report_spec(spec)
+    server = "" if source.is_default else f" с сервера '{source.title}'"
+    print(f"📊 Загрузка отчета '{spec.title}'{server} за период {date_from.date()} - {date_to.date()}")
     
-    try:
-        execute_values(
-            cur,
-            """
-            INSERT INTO iiko_raw_load_orders 
-            (report_date, department, hour_open, orders_count, raw_data)
-            VALUES %s
-            ON CONFLICT (report_date, department, hour_open) 
-            DO UPDATE SET
-                orders_count = EXCLUDED.orders_count,
-                raw_data = EXCLUDED.raw_data,
-                loaded_at = CURRENT_TIMESTAMP
-            """,
-            [
-                (
-                    row["report_date"],
-                    row["department"],
-                    row["hour_open"],
-                    row["orders_count"],
-                    row["raw_data"]
-                )
-                for row in rows
-            ]
-        )
-        print(f"✅ Загружено {len(rows)} строк")
-    finally:
-        cur.close()
-        conn.close()
-
-
-def load_load_revenue_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
-    """Загрузить отчет "Нагрузка по часам (выручка)" в БД."""
-    print(f"📊 Загрузка отчета 'Нагрузка по часам (выручка)' за период {date_from.date()} - {date_to.date()}")
+    payload = fetch_olap_payload(
+        report_id=spec.report_id,
+        date_from=date_from,
+        date_to=date_to,
+        report_name=spec.report_name,
+        token=token,
+        replay=replay,
+        source=source,
+        body=report_request_body(spec, date_from, date_to)
+    )
+    label = f"iiko:{spec.key}" if source.is_default else f"iiko:{source.key}:{spec.key}"
+    save_payload_file(label, payload["sha256"], payload["path"], payload["size"])
     
-    data = get_load_revenue_report(date_from, date_to, token)
-    rows = parse_load_revenue_report(data)
+    rows = iter_report_rows(cache.iter_blob(payload["path"]))
+    counts = _load_rows(spec, iter_converted_rows(spec, rows, payload["sha256"], source.key))
+    loaded = sum(counts.values())
+    record(rows_parsed=loaded)
     
-    if not rows:
+    if not loaded:
         print("⚠️  Нет данных для загрузки")
-        return
+        return 0
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        execute_values(
-            cur,
-            """
-            INSERT INTO iiko_raw_load_revenue 
-            (report_date, department, hour_open, dish_discount_sum_int, raw_data)
-            VALUES %s
-            ON CONFLICT (report_date, department, hour_open) 
-            DO UPDATE SET
-                dish_discount_sum_int = EXCLUDED.dish_discount_sum_int,
-                raw_data = EXCLUDED.raw_data,
-                loaded_at = CURRENT_TIMESTAMP
-            """,
-            [
-                (
-                    row["report_date"],
-                    row["department"],
-                    row["hour_open"],
-                    row["dish_discount_sum_int"],
-                    row["raw_data"]
-                )
-                for row in rows
-            ]
-        )
-        print(f"✅ Загружено {len(rows)} строк")
-    finally:
-        cur.close()
-        conn.close()
+    print(f"✅ Загружено {loaded} строк ({format_counts(counts)})")
+    return loaded
+
+
+def load_margin_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
+    """Загрузить отчет "Маржа" в БД. Возвращает число загруженных строк."""
+    return load_report(REPORT_SPECS["margin"], date_from, date_to, token)
+
+
+def load_load_orders_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
+    """Загрузить отчет "Нагрузка по часам (заказы)" в БД. Возвращает число загруженных строк."""
+    return load_report(REPORT_SPECS["load_orders"], date_from, date_to, token)
+
+
+def load_load_revenue_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
+    """Загрузить отчет "Нагрузка по часам (выручка)" в БД. Возвращает число загруженных строк."""
+    return load_report(REPORT_SPECS["load_revenue"], date_from, date_to, token)
 
 
 def load_discount_types_report(date_from: datetime, date_to: datetime, token: Optional[str] = None):
-    """Загрузить отчет "Типы скидок" в БД."""
-    print(f"📊 Загрузка отчета 'Типы скидок' за период {date_from.date()} - {date_to.date()}")
+    """Загрузить отчет "Типы скидок" в БД. Возвращает число загруженных строк."""
+    return load_report(REPORT_SPECS["discount_types"], date_from, date_to, token)
+
+
+def load_combined(
+    date_from: datetime,
+    date_to: datetime,
+    token: Optional[str] = None,
+    replay: bool = False,
+    source: Optional[IikoSource] = None
+) -> Dict[str, int]:
+    """
+    Загрузить все отчеты iiko: маржу и нагрузку по часам - одним сводным
+    OLAP запросом (см. combined.py), типы скидок - отдельным запросом.
     
-    data = get_discount_types_report(date_from, date_to, token)
-    rows = parse_discount_types_report(data)
+    Ответ сводного запроса сохраняется в кеш и raw_payloads, как у
+    отдельного отчета; строки отчетов COMBINED_REPORTS получаются сверткой и
+    загружаются в таблицы REPORT_SPECS со ссылкой на сводный ответ
+    (payload_pos пуст: строка отчета - сумма нескольких строк ответа).
+    Типы скидок загружаются как обычный отчет (load_report): сверткой их не
+    получить без повторного счета заказов с несколькими скидками.
     
-    if not rows:
-        print("⚠️  Нет данных для загрузки")
-        return
+    Args:
+        replay: Взять ответ только из кеша, без обращения к API
+        source: Сервер iiko (по умолчанию - первый из sources.get_iiko_sources)
     
-    conn = get_db_connection()
-    cur = conn.cursor()
+    Returns:
+        dict: Число загруженных строк по ключу отчета
+    """
+    if source is None:
+        source = get_iiko_sources()[0]
+    server = "" if source.is_default else f" с сервера '{source.title}'"
+    print(f"📊 Загрузка отчетов сводным запросом{server} за период {date_from.date()} - {date_to.date()}")
     
-    try:
-        execute_values(
-            cur,
-            """
-            INSERT INTO iiko_raw_discount_types 
-            (report_date, department, discount_type, orders_count, dish_discount_sum_int, 
-             discount_sum, average_order_sum, raw_data)
-            VALUES %s
-            ON CONFLICT (report_date, department, discount_type) 
-            DO UPDATE SET
-                orders_count = EXCLUDED.orders_count,
-                dish_discount_sum_int = EXCLUDED.dish_discount_sum_int,
-                discount_sum = EXCLUDED.discount_sum,
-                average_order_sum = EXCLUDED.average_order_sum,
-                raw_data = EXCLUDED.raw_data,
-                loaded_at = CURRENT_TIMESTAMP
-            """,
-            [
-                (
-                    row["report_date"],
-                    row["department"],
-                    row["discount_type"],
-                    row["orders_count"],
-                    row["dish_discount_sum_int"],
-                    row["discount_sum"],
-                    row["average_order_sum"],
-                    row["raw_data"]
-                )
-                for row in rows
-            ]
-        )
-        print(f"✅ Загружено {len(rows)} строк")
-    finally:
-        cur.close()
-        conn.close()
+    payload = fetch_olap_payload(
+        report_id=combined.COMBINED_KEY,
+        date_from=date_from,
+        date_to=date_to,
+        report_name=combined.COMBINED_TITLE,
+        token=token,
+        replay=replay,
+        source=source,
+        body=combined.combined_request_body(date_from, date_to)
+    )
+    label = f"iiko:{combined.COMBINED_KEY}" if source.is_default else f"iiko:{source.key}:{combined.COMBINED_KEY}"
+    save_payload_file(label, payload["sha256"], payload["path"], payload["size"])
+    
+    parsed = 0
+    
+    def counted(rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        nonlocal parsed
+        for row in rows:
+            parsed += 1
+            yield row
+    
+    reports = combined.rollup_rows(counted(iter_report_rows(cache.iter_blob(payload["path"]))))
+    record(rows_parsed=parsed)
+    
+    stats: Dict[str, int] = {}
+    for key, rows in reports.items():
+        spec = REPORT_SPECS[key]
+        converted = iter_converted_rows(spec, rows, payload["sha256"], source.key)
+        counts = _load_rows(spec, ((*values[:-1], None) for values in converted))
+        stats[key] = sum(counts.values())
+        print(f"✅ {spec.title}: загружено {stats[key]} строк ({format_counts(counts)})")
+    
+    if not parsed:
+        print("⚠️  Нет данных для загрузки")
+    
+    for key in REPORT_SPECS:
+        if key not in combined.COMBINED_REPORTS:
+            stats[key] = load_report(REPORT_SPECS[key], date_from, date_to, token, replay=replay, source=source)
+    return stats
 
 
-def run_iiko_etl(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+def run_iiko_etl(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    max_workers: Optional[int] = None,
+    replay: bool = False,
+    sources: Optional[Sequence[IikoSource]] = None
+):
     """
-    Запустить полный ETL процесс для всех отчетов iiko.
+    Запустить полный ETL процесс для всех отчетов iiko (см. REPORT_SPECS)
+    со всех серверов (см. sources.get_iiko_sources).
+    
+    При IIKO_OLAP_MODE=combined маржа и нагрузка сервера загружаются одним
+    сводным запросом (load_combined) вместо запроса на каждый отчет.
+    
+    У каждого сервера свой пул из max_workers потоков, пулы серверов работают
+    одновременно, так что запуск длится примерно столько, сколько загрузка с
+    самого медленного сервера. Каждый отчет парсится и загружается в БД сразу
+    после получения. Число одновременных запросов к одному серверу
+    дополнительно ограничено IIKO_MAX_CONCURRENCY (или max_concurrency
+    сервера) и снижается, если сервер не справляется, а ко всем серверам
+    вместе - IIKO_GLOBAL_CONCURRENCY; ошибки сервера повторяются (см. policy.py).
     
     Args:
         date_from: Дата начала периода (по умолчанию - вчера)
         date_to: Дата окончания периода (по умолчанию - вчера)
+        max_workers: Размер пула потоков сервера (по умолчанию IIKO_MAX_WORKERS
+                     или число отчетов). 1 - последовательная загрузка.
+        replay: Перезагрузить отчеты из локального кеша ответов без обращения
+                к API (например, после изменения парсинга или схемы)
+        sources: Серверы iiko (по умолчанию - все из get_iiko_sources)
+    
+    Returns:
+        dict: Число загруженных строк по каждому отчету (при нескольких
+              серверах - "<сервер>: <отчет>")
     """
     if date_from is None:
         date_from = datetime.now() - timedelta(days=1)
     if date_to is None:
         date_to = datetime.now() - timedelta(days=1)
+    if max_workers is None:
+        max_workers = int(os.environ.get("IIKO_MAX_WORKERS", len(REPORT_SPECS)))
+    if sources is None:
+        sources = get_iiko_sources()
+    
+    # Секции месяцев периода (таблицы секционированы по report_date)
+    ensure_partitions(date_from, date_to)
+    
+    multiple = len(sources) > 1
+    
+    def name(source: IikoSource, title: str) -> str:
+        return f"{source.title}: {title}" if multiple else title
     
-    # Получаем токен один раз для всех запросов
-    token = get_token()
+    def load_source_report(source: IikoSource, spec: ReportSpec) -> Dict[str, int]:
+        return {name(source, spec.title): load_report(spec, date_from, date_to, replay=replay, source=source)}
+    
+    def load_source_combined(source: IikoSource) -> Dict[str, int]:
+        counts = load_combined(date_from, date_to, replay=replay, source=source)
+        return {name(source, REPORT_SPECS[key].title): rows for key, rows in counts.items()}
+    
+    # Запросы всех серверов: по отчету или один сводный; токен сервера получает
+    # первый запрос к нему, остальные потоки используют его же (см. client.IikoClient)
+    if combined.is_enabled():
+        jobs = [
+            (source, name(source, combined.COMBINED_TITLE), partial(load_source_combined, source))
+            for source in sources
+        ]
+    else:
+        jobs = [
+            (source, name(source, spec.title), partial(load_source_report, source, spec))
+            for source in sources
+            for spec in REPORT_SPECS.values()
+        ]
+    stats: Dict[str, int] = {}
     
     try:
-        # Загружаем все отчеты
-        load_margin_report(date_from, date_to, token)
-        load_load_orders_report(date_from, date_to, token)
-        load_load_revenue_report(date_from, date_to, token)
-        load_discount_types_report(date_from, date_to, token)
+        if max_workers <= 1:
+            for _, _, job in jobs:
+                stats.update(job())
+        else:
+            errors = []
+            with ExitStack() as stack:
+                pools = {
+                    source.key: stack.enter_context(
+                        ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"iiko-{source.key}")
+                    )
+                    for source in sources
+                }
+                # Контекст вызывающего потока (этап метрик) передается в потоки пула
+                futures = {
+                    pools[source.key].submit(contextvars.copy_context().run, job): title
+                    for source, title, job in jobs
+                }
+                # Остальные отчеты (и серверы) догружаются даже при ошибке в одном из них
+                for future in as_completed(futures):
+                    try:
+                        stats.update(future.result())
+                    except Exception as e:
+                        print(f"❌ Ошибка в отчете '{futures[future]}': {e}")
+                        errors.append(futures[future])
+            
+            if errors:
+                raise RuntimeError(f"Не удалось загрузить отчеты: {', '.join(errors)}")
         
         print("✅ ETL процесс завершен успешно")
+        return stats
     except Exception as e:
         print(f"❌ Ошибка при выполнении ETL: {e}")
         raise
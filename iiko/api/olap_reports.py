@@ -1,39 +1,136 @@
 """
 Получение OLAP отчетов из iiko Server API.
+
+Профиль запроса отчета (IIKO_OLAP_PROFILE):
+- projected (по умолчанию) - запрос с явными полями группировки, показателями
+  и фильтрами из спецификации отчета (report_specs.py): ответ содержит только
+  загружаемые колонки;
+- full - сохраненный отчет по ID целиком, со всеми колонками, настроенными
+  в iiko (например, чтобы сохранить полный ответ в raw_payloads).
 """
 import os
+import time
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 from datetime import datetime, timedelta
-from .auth import get_token
+from neon.metrics import record
+from . import cache
+from .client import get_client
+from .report_specs import REPORT_SPECS, ReportSpec
+from .sources import IikoSource
+from .stream import iter_report_rows
 
 
-def get_olap_report(
-    report_id: str,
+# Размер чанка при потоковом чтении ответа
+STREAM_CHUNK_SIZE = 64 * 1024
+
+OLAP_PROFILES = ("projected", "full")
+
+
+def olap_profile() -> str:
+    """
+    Профиль запроса отчетов (IIKO_OLAP_PROFILE, по умолчанию projected).
+    
+    Raises:
+        ValueError: Если профиль неизвестен
+    """
+    profile = os.environ.get("IIKO_OLAP_PROFILE", "projected").strip().lower()
+    if profile not in OLAP_PROFILES:
+        raise ValueError(f"Неизвестный профиль IIKO_OLAP_PROFILE '{profile}', доступны: {', '.join(OLAP_PROFILES)}")
+    return profile
+
+
+def olap_request_body(
+    group_fields: Iterable[str],
+    aggregate_fields: Iterable[str],
     date_from: datetime,
     date_to: datetime,
-    report_name: Optional[str] = None,
-    token: Optional[str] = None
+    filters: Iterable[Tuple[str, Iterable[str]]] = ()
 ) -> Dict[str, Any]:
     """
-    Получить OLAP отчет по ID из iiko Server API.
+    Тело OLAP запроса по продажам с явными полями.
+    
+    Период - с начала дня date_from до начала дня после date_to (как у
+    сохраненных отчетов, IncludeHigh: False).
     
     Args:
-        report_id: ID отчета (например, '906ba511-1717-485c-aa60-2b47d03c49ec')
-        date_from: Дата начала периода
-        date_to: Дата окончания периода
-        token: Токен авторизации (если None, будет получен автоматически)
-        
+        group_fields: Поля группировки (groupByRowFields)
+        aggregate_fields: Показатели (aggregateFields)
+        filters: Пары (поле, включаемые значения)
+    """
+    date_to_next = date_to + timedelta(days=1)
+    body_filters: Dict[str, Any] = {
+        "OpenDate.Typed": {
+            "filterType": "DateRange",
+            "periodType": "CUSTOM",
+            "from": date_from.strftime("%Y-%m-%d"),
+            "to": date_to_next.strftime("%Y-%m-%d"),
+            "includeLow": True,
+            "includeHigh": False,
+        },
+    }
+    for field, values in filters:
+        body_filters[field] = {"filterType": "IncludeValues", "values": list(values)}
+    
+    return {
+        "reportType": "SALES",
+        "buildSummary": "false",
+        "groupByRowFields": list(group_fields),
+        "groupByColFields": [],
+        "aggregateFields": list(aggregate_fields),
+        "filters": body_filters,
+    }
+
+
+def report_request_body(
+    spec: ReportSpec,
+    date_from: datetime,
+    date_to: datetime,
+    profile: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Тело запроса отчета по профилю.
+    
+    Args:
+        profile: projected или full (по умолчанию - olap_profile())
+    
     Returns:
-        dict: Данные отчета в формате JSON
-        
-    Raises:
-        requests.RequestException: При ошибке запроса к API
+        dict: Тело запроса только полей спецификации (projected) или None -
+              сохраненный отчет spec.report_id целиком (full)
+    """
+    if (profile or olap_profile()) == "full":
+        return None
+    return olap_request_body(spec.group_fields, spec.aggregate_fields, date_from, date_to, spec.filters)
+
+
+def _request_olap_report(
+    report_id: str,
+    date_from: datetime,
+    date_to: datetime,
+    report_name: Optional[str] = None,
+    token: Optional[str] = None,
+    stream: bool = False,
+    retry: bool = True,
+    source: Optional[IikoSource] = None,
+    body: Optional[Dict[str, Any]] = None,
+    consume: Optional[Callable[[requests.Response], Any]] = None
+) -> Any:
     """
-    if token is None:
-        token = get_token()
+    Выполнить запрос OLAP отчета и проверить статус ответа.
+    
+    Ответы 429/5xx и ошибки соединения повторяются по политике клиента
+    (retry=False - одна попытка, см. IikoClient.request).
     
-    base = os.environ["IIKO_BASE_URL"].rstrip("/")
+    Args:
+        body: Тело запроса с явными полями группировки и агрегации (см.
+              combined.py) вместо сохраненного отчета report_id
+        consume: Прочитать ответ после проверки статуса, не освобождая место
+                 в лимите параллельности (потоковое тело, см. fetch_olap_payload)
+    
+    Returns:
+        Ответ или результат consume
+    """
+    client = get_client(source)
     
     # Убеждаемся, что date_from - начало дня, date_to - начало следующего дня (IncludeHigh: False)
     # Если запрашиваем 01.01.2026, то To должен быть 02.01.2026 0:00:00
@@ -45,9 +142,6 @@ def get_olap_report(
     date_from_str = date_from_start.strftime("%d.%m.%Y %H:%M:%S").replace(" 00:", " 0:")
     date_to_str = date_to_start.strftime("%d.%m.%Y %H:%M:%S").replace(" 00:", " 0:")
     
-    # Эндпоинт для получения OLAP отчета
-    url = f"{base}/resto/api/v2/reports/olap"
-    
     # iiko Server API требует POST запрос с JSON телом
     # Согласно ошибке API, reportType должен быть одним из: STOCK, SALES, TRANSACTIONS, DELIVERIES
     # Для отчетов о продажах (Маржа, Нагрузка, Типы скидок) используем SALES
@@ -68,29 +162,173 @@ def get_olap_report(
     if report_name:
         json_data["name"] = report_name
     
-    # Токен и даты передаются как query параметры
+    # Явный запрос (поля и фильтры в теле) вместо сохраненного отчета
+    if body is not None:
+        json_data = body
+    
+    # Токен (добавляется клиентом) и даты передаются как query параметры
     params = {
-        "key": token,
         "dateFrom": date_from_str,
         "dateTo": date_to_str
     }
     
-    # Выполняем POST запрос
-    resp = requests.post(url, json=json_data, params=params, timeout=60)
+    def check(resp: requests.Response) -> Any:
+        # Если получили ошибку, выводим детали для диагностики
+        if resp.status_code != 200:
+            error_detail = resp.text[:500] if resp.text else "Нет деталей ошибки"
+            resp.close()
+            raise requests.HTTPError(
+                f"{resp.status_code} {resp.reason} для url: {resp.url}\n"
+                f"Детали: {error_detail}\n"
+                f"Параметры запроса: id={report_id}, dateFrom={date_from_str}, dateTo={date_to_str}"
+            )
+        return resp if consume is None else consume(resp)
     
-    # Если получили ошибку, выводим детали для диагностики
-    if resp.status_code != 200:
-        error_detail = resp.text[:500] if resp.text else "Нет деталей ошибки"
-        raise requests.HTTPError(
-            f"{resp.status_code} {resp.reason} для url: {resp.url}\n"
-            f"Детали: {error_detail}\n"
-            f"Параметры запроса: id={report_id}, dateFrom={date_from_str}, dateTo={date_to_str}"
-        )
+    # Выполняем POST запрос через общий пул соединений клиента
+    return client.request(
+        "POST",
+        "/resto/api/v2/reports/olap",
+        params=params,
+        token=token,
+        json=json_data,
+        timeout=60,
+        stream=stream,
+        retry=retry,
+        consume=check
+    )
+
+
+def get_olap_report(
+    report_id: str,
+    date_from: datetime,
+    date_to: datetime,
+    report_name: Optional[str] = None,
+    token: Optional[str] = None,
+    source: Optional[IikoSource] = None,
+    spec: Optional[ReportSpec] = None,
+    profile: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Получить OLAP отчет по ID из iiko Server API.
     
-    resp.raise_for_status()
+    Args:
+        report_id: ID отчета (например, '906ba511-1717-485c-aa60-2b47d03c49ec')
+        date_from: Дата начала периода
+        date_to: Дата окончания периода
+        token: Токен авторизации (если None, используется общий токен клиента)
+        source: Сервер iiko (по умолчанию - см. client.get_client)
+        spec: Спецификация отчета: если передана, запрос строится из ее полей
+              (см. report_request_body)
+        profile: Профиль запроса для spec: projected или full (по умолчанию
+                 IIKO_OLAP_PROFILE)
+    
+    Returns:
+        dict: Данные отчета в формате JSON
+    
+    Raises:
+        requests.RequestException: При ошибке запроса к API
+    """
+    body = report_request_body(spec, date_from, date_to, profile) if spec is not None else None
+    resp = _request_olap_report(report_id, date_from, date_to, report_name, token, source=source, body=body)
     return resp.json()
 
 
+def fetch_olap_payload(
+    report_id: str,
+    date_from: datetime,
+    date_to: datetime,
+    report_name: Optional[str] = None,
+    token: Optional[str] = None,
+    replay: bool = False,
+    source: Optional[IikoSource] = None,
+    body: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Получить тело ответа OLAP отчета в локальный кеш (см. cache).
+    
+    Ответ читается чанками по STREAM_CHUNK_SIZE байт и сохраняется на диск
+    в сжатом виде, не загружаясь в память целиком. Пока сохраненный ответ
+    не устарел, он используется без обращения к API. Ошибка сервера или
+    обрыв соединения (в том числе во время чтения тела) повторяются по
+    политике клиента (см. policy.py).
+    
+    Args:
+        replay: Взять ответ только из кеша, независимо от срока жизни записи
+                (без обращения к API)
+        source: Сервер iiko (по умолчанию - см. client.get_client)
+        body: Тело явного запроса вместо сохраненного отчета (входит в ключ кеша)
+    
+    Returns:
+        dict: Запись кеша: sha256 (хеш тела ответа), size, path (сжатое тело)
+    
+    Raises:
+        requests.RequestException: При ошибке запроса к API
+        LookupError: В режиме replay, если ответа нет в кеше
+    """
+    source_key = None if source is None or source.is_default else source.key
+    key = cache.request_key(report_id, report_name, date_from, date_to, body, source_key)
+    
+    if replay or cache.is_enabled():
+        entry = cache.lookup(key, date_to, ignore_ttl=replay)
+        if entry is not None:
+            print(f"💾 Отчет '{report_name or report_id}' прочитан из кеша")
+            return entry
+        if replay:
+            raise LookupError(
+                f"Нет сохраненного ответа для отчета '{report_name or report_id}' "
+                f"за период {date_from.date()} - {date_to.date()}"
+            )
+    
+    def store(resp: requests.Response) -> Dict[str, Any]:
+        with resp:
+            return cache.store(resp.iter_content(chunk_size=STREAM_CHUNK_SIZE), key, {
+                "source": source_key,
+                "report_id": report_id,
+                "report_name": report_name,
+                "date_from": date_from.date().isoformat(),
+                "date_to": date_to.date().isoformat(),
+            })
+    
+    def download() -> Dict[str, Any]:
+        # Тело читается в том же месте лимита параллельности, что и запрос:
+        # IIKO_MAX_CONCURRENCY и время ответа учитывают всю передачу
+        return _request_olap_report(
+            report_id, date_from, date_to, report_name, token,
+            stream=True, retry=False, source=source, body=body, consume=store
+        )
+    
+    started = time.perf_counter()
+    entry = get_client(source).policy.run(download, f"Отчет '{report_name or report_id}'")
+    record(http_seconds=time.perf_counter() - started, http_requests=1, bytes_received=entry["size"])
+    return entry
+
+
+def stream_olap_report(
+    report_id: str,
+    date_from: datetime,
+    date_to: datetime,
+    report_name: Optional[str] = None,
+    token: Optional[str] = None,
+    replay: bool = False,
+    source: Optional[IikoSource] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Получить строки OLAP отчета потоком, не загружая ответ в память целиком.
+    
+    Ответ сохраняется в кеш (fetch_olap_payload) и разбирается из файла
+    инкрементально (см. stream.iter_report_rows).
+    
+    Yields:
+        dict: Строка отчета
+    
+    Raises:
+        requests.RequestException: При ошибке запроса к API
+        LookupError: В режиме replay, если ответа нет в кеше
+    """
+    entry = fetch_olap_payload(report_id, date_from, date_to, report_name, token, replay, source)
+    yield from iter_report_rows(cache.iter_blob(entry["path"]))
+
+
 def get_margin_report(
     date_from: datetime,
     date_to: datetime,
@@ -102,11 +340,12 @@ def get_margin_report(
     ID отчета: 906ba511-1717-485c-aa60-2b47d03c49ec
     """
     return get_olap_report(
-        report_id="906ba511-1717-485c-aa60-2b47d03c49ec",
+        report_id=REPORT_SPECS["margin"].report_id,
         date_from=date_from,
         date_to=date_to,
-        report_name="Маржа (выручка, % скидки, % себестоимости)",
-        token=token
+        report_name=REPORT_SPECS["margin"].report_name,
+        token=token,
+        spec=REPORT_SPECS["margin"]
     )
 
 
@@ -121,11 +360,12 @@ def get_load_orders_report(
     ID отчета: cd0c03aa-6ac8-433a-8d60-823d515ab968
     """
     return get_olap_report(
-        report_id="cd0c03aa-6ac8-433a-8d60-823d515ab968",
+        report_id=REPORT_SPECS["load_orders"].report_id,
         date_from=date_from,
         date_to=date_to,
-        report_name="Нагрузка по часам (заказы)",
-        token=token
+        report_name=REPORT_SPECS["load_orders"].report_name,
+        token=token,
+        spec=REPORT_SPECS["load_orders"]
     )
 
 
@@ -140,11 +380,12 @@ def get_load_revenue_report(
     ID отчета: 6c37631c-5cc5-4644-b25e-3411a3492e37
     """
     return get_olap_report(
-        report_id="6c37631c-5cc5-4644-b25e-3411a3492e37",
+        report_id=REPORT_SPECS["load_revenue"].report_id,
         date_from=date_from,
         date_to=date_to,
-        report_name="нагрузка по часам (выручка)",
-        token=token
+        report_name=REPORT_SPECS["load_revenue"].report_name,
+        token=token,
+        spec=REPORT_SPECS["load_revenue"]
     )
 
 
@@ -159,9 +400,10 @@ def get_discount_types_report(
     ID отчета: 8ac9c323-034e-4b21-9eb6-60de5e05fbea
     """
     return get_olap_report(
-        report_id="8ac9c323-034e-4b21-9eb6-60de5e05fbea",
+        report_id=REPORT_SPECS["discount_types"].report_id,
         date_from=date_from,
         date_to=date_to,
-        report_name="Типы скидок (data lens)",
-        token=token
+        report_name=REPORT_SPECS["discount_types"].report_name,
+        token=token,
+        spec=REPORT_SPECS["discount_types"]
     )
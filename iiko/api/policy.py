@@ -0,0 +1,407 @@
+"""
+Политика запросов к iiko Server API: повторы, адаптивная параллельность
+и автоматический выключатель (circuit breaker).
+
+- Повторы (RetryPolicy): ответы 429 и 5xx, обрывы соединения и таймауты
+  повторяются с экспоненциальной задержкой со случайной составляющей
+  (full jitter) или по Retry-After, но не дольше срока запроса (deadline).
+- Параллельность (AdaptiveLimiter, AIMD): лимит одновременных запросов
+  растет на 1 за каждые "лимит" успешных ответов и уменьшается вдвое при
+  429/5xx/таймаутах или росте времени ответа сервера относительно обычного.
+  Верхняя граница - IIKO_MAX_CONCURRENCY.
+- Выключатель (CircuitBreaker): после IIKO_CIRCUIT_FAILURES ошибок сервера
+  подряд запросы не отправляются IIKO_CIRCUIT_RESET секунд, затем проходит
+  один пробный запрос; его успех возвращает обычный режим.
+
+Политика одна на сервер (см. client.IikoClient) и общая для всех потоков.
+При загрузке с нескольких серверов запросы ко всем серверам дополнительно
+ограничены общим пределом IIKO_GLOBAL_CONCURRENCY (RequestPolicy.budget).
+"""
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, TypeVar, Union
+import requests
+
+T = TypeVar("T")
+
+# Ответы, после которых запрос повторяется
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Ошибки транспорта, после которых запрос повторяется
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class RetryableStatusError(requests.HTTPError):
+    """Ответ сервера, после которого запрос можно повторить (429, 5xx)."""
+
+    def __init__(self, message: str, status: int, retry_after: Optional[float] = None, **kwargs):
+        super().__init__(message, **kwargs)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(requests.RequestException):
+    """Выключатель разомкнут: сервер недавно не отвечал, запрос не отправлен."""
+
+    def __init__(self, message: str, retry_in: float):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    """Задержка из заголовка Retry-After (только в секундах)."""
+    value = resp.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """Параметры повторов запроса."""
+    max_attempts: int = 5
+    base_delay: float = 1.0  # Задержка перед первым повтором (верхняя граница jitter)
+    max_delay: float = 30.0  # Максимальная задержка между попытками
+    deadline: float = 600.0  # Срок запроса со всеми повторами, секунд
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """IIKO_RETRY_ATTEMPTS, IIKO_RETRY_BASE_DELAY, IIKO_RETRY_MAX_DELAY, IIKO_RETRY_DEADLINE."""
+        return cls(
+            max_attempts=max(1, int(os.environ.get("IIKO_RETRY_ATTEMPTS", cls.max_attempts))),
+            base_delay=_env_float("IIKO_RETRY_BASE_DELAY", cls.base_delay),
+            max_delay=_env_float("IIKO_RETRY_MAX_DELAY", cls.max_delay),
+            deadline=_env_float("IIKO_RETRY_DEADLINE", cls.deadline)
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Задержка перед повтором номер attempt (с 1): full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class AdaptiveLimiter:
+    """
+    Лимит одновременных запросов к серверу с адаптацией AIMD.
+
+    Args:
+        max_limit: Верхняя граница (и начальное значение) лимита
+        min_limit: Нижняя граница лимита
+        backoff_ratio: Множитель лимита при перегрузке сервера
+        latency_factor: Перегрузкой считается и время ответа, в latency_factor
+                        раз превышающее обычное (долгое скользящее среднее)
+        name: Название сервера для логов
+    """
+
+    # Сглаживание времени ответа: текущее и обычное
+    FAST_ALPHA = 0.3
+    SLOW_ALPHA = 0.02
+    # Ответов до начала сравнения времени ответа с обычным
+    WARMUP = 10
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        backoff_ratio: float = 0.5,
+        latency_factor: float = 2.0,
+        name: str = "iiko"
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.latency_factor = latency_factor
+        self.name = name
+
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._fast_latency: Optional[float] = None
+        self._slow_latency: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._lowest_reported = self.max_limit
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Занять место среди одновременных запросов на время блока."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        """Успешный ответ за latency секунд: аддитивное увеличение лимита."""
+        with self._condition:
+            self._samples += 1
+            if self._fast_latency is None:
+                self._fast_latency = self._slow_latency = latency
+            else:
+                self._fast_latency += self.FAST_ALPHA * (latency - self._fast_latency)
+                self._slow_latency += self.SLOW_ALPHA * (latency - self._slow_latency)
+
+            if self._samples >= self.WARMUP and self._fast_latency > self.latency_factor * self._slow_latency:
+                self._decrease("время ответа выросло")
+                return
+
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_overload(self, reason: str):
+        """Признак перегрузки сервера (429, 5xx, таймаут): мультипликативное уменьшение лимита."""
+        with self._condition:
+            self._decrease(reason)
+
+    def _decrease(self, reason: str):
+        # Одна перегрузка дает много ошибок почти одновременно - уменьшаем
+        # лимит не чаще раза за обычное время ответа
+        now = time.monotonic()
+        if now - self._last_decrease < (self._slow_latency or 0.0):
+            return
+        self._last_decrease = now
+
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        # В логе - только новые минимумы лимита
+        if int(self.limit) < self._lowest_reported:
+            self._lowest_reported = int(self.limit)
+            print(f"🐢 {self.name}: {reason}, одновременных запросов не более {int(self.limit)}")
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель запросов к серверу.
+
+    Args:
+        failure_threshold: Ошибок сервера подряд до размыкания
+        reset_timeout: Секунд до пробного запроса после размыкания
+        name: Название сервера для логов
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "iiko"):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.name = name
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None  # Пробный запрос в полуразомкнутом состоянии
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        Проверить, можно ли отправить запрос.
+
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут (или пробный запрос уже отправлен)
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            retry_in = self._opened_at + self.reset_timeout - now
+            if self.state == self.OPEN and retry_in <= 0:
+                self.state = self.HALF_OPEN
+                self._probe_started = None
+            # Пробный запрос, не завершившийся за reset_timeout, не блокирует следующий
+            if self.state == self.HALF_OPEN and (
+                self._probe_started is None or now - self._probe_started > self.reset_timeout
+            ):
+                self._probe_started = now
+                return
+            raise CircuitOpenError(
+                f"iiko Server не отвечает: запросы приостановлены (повтор через {max(retry_in, 0):.0f}s)",
+                retry_in=max(retry_in, 1.0)
+            )
+
+    def on_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"🔌 {self.name}: сервер снова отвечает, запросы возобновлены")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_started = None
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"⛔ {self.name}: {self._failures} ошибок сервера подряд, "
+                          f"запросы приостановлены на {self.reset_timeout:g}s")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+
+class RequestPolicy:
+    """
+    Повторы, адаптивная параллельность и выключатель для запросов к одному серверу.
+
+    Args:
+        budget: Общий для нескольких серверов предел одновременных запросов
+                (семафор, см. client.get_client); занимается после места в
+                лимите сервера, время ожидания в нем не входит во время ответа
+    """
+
+    def __init__(
+        self,
+        retry: Optional[RetryPolicy] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[threading.Semaphore] = None
+    ):
+        self.retry = retry or RetryPolicy()
+        self.limiter = limiter or AdaptiveLimiter(4)
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget
+
+    @classmethod
+    def from_env(
+        cls,
+        max_concurrency: Optional[int] = None,
+        name: str = "iiko",
+        budget: Optional[threading.Semaphore] = None
+    ) -> "RequestPolicy":
+        """
+        Политика из переменных окружения.
+
+        Args:
+            max_concurrency: Верхняя граница параллельности (по умолчанию
+                             IIKO_MAX_CONCURRENCY или 4)
+            name: Название сервера для логов
+            budget: Общий предел одновременных запросов к нескольким серверам
+        """
+        if max_concurrency is None:
+            max_concurrency = int(os.environ.get("IIKO_MAX_CONCURRENCY", "4"))
+        return cls(
+            retry=RetryPolicy.from_env(),
+            limiter=AdaptiveLimiter(
+                max_limit=max_concurrency,
+                min_limit=int(os.environ.get("IIKO_MIN_CONCURRENCY", "1")),
+                name=name
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("IIKO_CIRCUIT_FAILURES", "5")),
+                reset_timeout=_env_float("IIKO_CIRCUIT_RESET", 30.0),
+                name=name
+            ),
+            budget=budget
+        )
+
+    def send(
+        self,
+        func: Callable[[], requests.Response],
+        consume: Optional[Callable[[requests.Response], T]] = None
+    ) -> Union[requests.Response, T]:
+        """
+        Выполнить одну попытку запроса с учетом выключателя и лимита параллельности.
+
+        Args:
+            func: Отправка запроса
+            consume: Чтение ответа (кроме 429 и 5xx), например, потокового тела:
+                     выполняется, не освобождая место в лимите, и его время
+                     входит во время ответа
+
+        Returns:
+            Результат consume или ответ, кроме 429 и 5xx (в том числе 4xx - их
+            обрабатывает вызывающий код)
+
+        Raises:
+            RetryableStatusError: Ответ 429 или 5xx (ответ закрыт)
+            CircuitOpenError: Выключатель разомкнут
+            requests.RequestException: Ошибка транспорта (в том числе при чтении тела)
+        """
+        self.breaker.before_request()
+        with self.limiter.slot(), self.budget or nullcontext():
+            started = time.monotonic()
+            try:
+                resp = func()
+                result = resp
+                if consume is not None and resp.status_code not in RETRY_STATUSES:
+                    result = consume(resp)
+            except RETRY_EXCEPTIONS:
+                self.limiter.on_overload("нет ответа сервера")
+                self.breaker.on_failure()
+                raise
+            latency = time.monotonic() - started
+
+        if resp.status_code not in RETRY_STATUSES:
+            self.limiter.on_success(latency)
+            self.breaker.on_success()
+            return result
+
+        detail = resp.text[:500] if resp.text else "Нет деталей ошибки"
+        resp.close()
+        if resp.status_code == 429:
+            # Сервер отвечает, но просит снизить нагрузку: выключатель не размыкается
+            self.limiter.on_overload("сервер ограничивает запросы (429)")
+            self.breaker.on_success()
+        else:
+            self.limiter.on_overload(f"ошибка сервера ({resp.status_code})")
+            self.breaker.on_failure()
+        raise RetryableStatusError(
+            f"{resp.status_code} {resp.reason} для url: {resp.url}\nДетали: {detail}",
+            status=resp.status_code,
+            retry_after=_retry_after(resp),
+            response=resp
+        )
+
+    def run(self, func: Callable[[], T], description: str = "запрос") -> T:
+        """
+        Выполнить func, повторяя его после RetryableStatusError, CircuitOpenError
+        и ошибок транспорта, пока есть попытки и не истек срок.
+
+        Args:
+            func: Попытка (обычно вызывает send и читает ответ)
+            description: Описание запроса для логов
+
+        Raises:
+            Последнюю ошибку попытки, если запрос так и не выполнен
+        """
+        deadline = time.monotonic() + self.retry.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func()
+            except (RetryableStatusError, CircuitOpenError, *RETRY_EXCEPTIONS) as e:
+                if isinstance(e, CircuitOpenError):
+                    # Ожидание выключателя не расходует попытки
+                    attempt -= 1
+                    delay = e.retry_in
+                elif attempt >= self.retry.max_attempts:
+                    print(f"❌ {description}: не выполнен за {attempt} попыток")
+                    raise
+                else:
+                    delay = self.retry.backoff(attempt)
+                    if isinstance(e, RetryableStatusError) and e.retry_after is not None:
+                        delay = max(delay, e.retry_after)
+
+                if time.monotonic() + delay > deadline:
+                    print(f"❌ {description}: истек срок запроса ({self.retry.deadline:.0f}s)")
+                    raise
+                print(f"🔁 {description}: {str(e).splitlines()[0]}, повтор через {delay:.1f}s")
+                time.sleep(delay)
@@ -0,0 +1,194 @@
+"""
+Описания OLAP отчетов iiko: откуда берутся данные и куда они загружаются.
+
+Каждый отчет задается спецификацией ReportSpec: ID и название отчета в iiko,
+целевая таблица Neon, ключ уникальности и соответствие колонок таблицы полям
+iiko. Добавление отчета сводится к новой записи в REPORT_SPECS и таблице в
+схеме БД.
+
+По спецификации строится и запрос только нужных полей (group_fields,
+aggregate_fields и filters, см. olap_reports.report_request_body): ответ
+содержит только загружаемые колонки, а не все колонки сохраненного отчета.
+"""
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Column:
+    """Колонка таблицы и поля iiko, из которых она заполняется (по приоритету)."""
+    name: str
+    fields: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ReportSpec:
+    """Спецификация OLAP отчета iiko и его таблицы в Neon."""
+    key: str  # Короткий ключ отчета (margin, load_orders, ...)
+    title: str  # Название для логов
+    report_id: str  # ID сохраненного отчета в iiko
+    report_name: str  # Название отчета в iiko (должно точно совпадать)
+    table: str  # Таблица сырых данных в Neon
+    key_columns: Tuple[str, ...]  # Колонки ключа уникальности (ON CONFLICT)
+    columns: Tuple[Column, ...]  # Колонки таблицы со значениями из полей iiko
+    # Фильтры сохраненного отчета: поле iiko -> включаемые значения (кроме периода)
+    filters: Tuple[Tuple[str, Tuple[str, ...]], ...] = ()
+
+    @property
+    def group_fields(self) -> Tuple[str, ...]:
+        """Поля группировки запроса (groupByRowFields): поля iiko колонок ключа."""
+        return tuple(column.fields[0] for column in self.columns if column.name in self.key_columns)
+
+    @property
+    def aggregate_fields(self) -> Tuple[str, ...]:
+        """Показатели запроса (aggregateFields): поля iiko остальных колонок."""
+        return tuple(column.fields[0] for column in self.columns if column.name not in self.key_columns)
+
+    @property
+    def column_names(self) -> Tuple[str, ...]:
+        """
+        Колонки для загрузки в порядке значений строки.
+
+        После колонок отчета - source (ключ сервера iiko, см. sources.py),
+        raw_data (всегда NULL: очищает копию строки, сохраненную до появления
+        raw_payloads) и ссылка на ответ (payload_hash, payload_pos, см.
+        neon.payloads).
+        """
+        return tuple(column.name for column in self.columns) + ("source", "raw_data", "payload_hash", "payload_pos")
+
+
+_REPORT_DATE = Column("report_date", ("OpenDate.Typed", "date"))
+_DEPARTMENT = Column("department", ("Department", "department"))
+_HOUR_OPEN = Column("hour_open", ("HourOpen", "hour"))
+_ORDERS_COUNT = Column("orders_count", ("UniqOrderId.OrdersCount", "orders_count"))
+_DISCOUNT_SUM = Column("discount_sum", ("DiscountSum", "discount_sum"))
+_DISH_DISCOUNT_SUM_INT = Column("dish_discount_sum_int", ("DishDiscountSumInt", "revenue"))
+
+# Удаленные заказы и блюда не учитываются ни одним отчетом
+NOT_DELETED_FILTERS = (
+    ("DeletedWithWriteoff", ("NOT_DELETED",)),
+    ("OrderDeleted", ("NOT_DELETED",)),
+)
+
+
+REPORT_SPECS: Dict[str, ReportSpec] = {
+    spec.key: spec
+    for spec in (
+        ReportSpec(
+            key="margin",
+            title="Маржа",
+            report_id="906ba511-1717-485c-aa60-2b47d03c49ec",
+            report_name="Маржа (выручка, % скидки, % себестоимости)",
+            table="iiko_raw_margin",
+            key_columns=("report_date", "source", "department"),
+            columns=(
+                _REPORT_DATE,
+                _DEPARTMENT,
+                Column("dish_sum_int", ("DishSumInt", "dish_sum_int")),
+                _DISCOUNT_SUM,
+                Column("product_cost_base_percent", ("ProductCostBase.Percent", "cost_percent")),
+            ),
+            filters=NOT_DELETED_FILTERS + (("Delivery.ServiceType", ("COURIER", "PICKUP")),),
+        ),
+        ReportSpec(
+            key="load_orders",
+            title="Нагрузка по часам (заказы)",
+            report_id="cd0c03aa-6ac8-433a-8d60-823d515ab968",
+            report_name="Нагрузка по часам (заказы)",
+            table="iiko_raw_load_orders",
+            key_columns=("report_date", "source", "department", "hour_open"),
+            columns=(_REPORT_DATE, _DEPARTMENT, _HOUR_OPEN, _ORDERS_COUNT),
+            filters=NOT_DELETED_FILTERS,
+        ),
+        ReportSpec(
+            key="load_revenue",
+            title="Нагрузка по часам (выручка)",
+            report_id="6c37631c-5cc5-4644-b25e-3411a3492e37",
+            report_name="нагрузка по часам (выручка)",
+            table="iiko_raw_load_revenue",
+            key_columns=("report_date", "source", "department", "hour_open"),
+            columns=(_REPORT_DATE, _DEPARTMENT, _HOUR_OPEN, _DISH_DISCOUNT_SUM_INT),
+            filters=NOT_DELETED_FILTERS,
+        ),
+        ReportSpec(
+            key="discount_types",
+            title="Типы скидок",
+            report_id="8ac9c323-034e-4b21-9eb6-60de5e05fbea",
+            report_name="Типы скидок (data lens)",
+            table="iiko_raw_discount_types",
+            key_columns=("report_date", "source", "department", "discount_type"),
+            columns=(
+                _REPORT_DATE,
+                _DEPARTMENT,
+                Column("discount_type", ("OrderDiscount.Type", "discount_type")),
+                _ORDERS_COUNT,
+                _DISH_DISCOUNT_SUM_INT,
+                _DISCOUNT_SUM,
+                Column("average_order_sum", ("DishDiscountSumInt.average", "average_check")),
+            ),
+            filters=NOT_DELETED_FILTERS,
+        ),
+    )
+}
+
+
+def _resolve_fields(spec: ReportSpec, row: Dict[str, Any]) -> Tuple[str, ...]:
+    """
+    Выбрать для каждой колонки первое поле iiko, присутствующее в строке.
+
+    Выбор идет по наличию ключа, а не по значению, поэтому законный 0
+    не подменяется значением альтернативного поля.
+    """
+    return tuple(
+        next((field for field in column.fields if field in row), column.fields[0])
+        for column in spec.columns
+    )
+
+
+def compile_row_converter(spec: ReportSpec, sample: Dict[str, Any]) -> Callable[[Dict[str, Any]], tuple]:
+    """
+    Скомпилировать преобразование строки iiko в кортеж значений для БД.
+
+    Имена полей определяются один раз по образцу строки ответа; значения
+    извлекаются одним вызовом itemgetter. Строки с другим набором полей
+    обрабатываются медленным путем с разрешением полей для каждой строки.
+
+    Returns:
+        Callable: row -> (значения колонок spec.columns...)
+    """
+    fields = _resolve_fields(spec, sample)
+    getter = itemgetter(*fields)
+    single = len(fields) == 1
+
+    def convert(row: Dict[str, Any]) -> tuple:
+        try:
+            values = getter(row)
+        except KeyError:
+            return tuple(row.get(field) for field in _resolve_fields(spec, row))
+        return (values,) if single else values
+
+    return convert
+
+
+def iter_converted_rows(
+    spec: ReportSpec,
+    rows: Iterable[Dict[str, Any]],
+    payload_hash: Optional[str] = None,
+    source: str = "default"
+) -> Iterator[tuple]:
+    """
+    Преобразовать строки отчета, скомпилировав конвертер по первой строке.
+
+    Args:
+        source: Ключ сервера iiko, с которого получен отчет
+
+    Yields:
+        tuple: Значения по spec.column_names: колонки отчета, source,
+               raw_data (None), payload_hash и номер строки в ответе
+    """
+    convert: Optional[Callable[[Dict[str, Any]], tuple]] = None
+    for pos, row in enumerate(rows):
+        if convert is None:
+            convert = compile_row_converter(spec, row)
+        yield (*convert(row), source, None, payload_hash, pos)
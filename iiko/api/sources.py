@@ -0,0 +1,115 @@
+"""
+Серверы iiko, с которых загружаются отчеты.
+
+Каждый сервер задается описанием IikoSource: адрес, учетные данные, свой
+предел одновременных запросов и, при необходимости, свои ID и названия
+сохраненных отчетов (у разных серверов ID отчетов различаются). Строки всех
+серверов загружаются в одни сырые таблицы с ключом сервера в колонке source.
+
+По умолчанию сервер один - IIKO_BASE_URL, IIKO_LOGIN и IIKO_PASSWORD_SHA1
+(ключ default). Несколько серверов задаются JSON массивом в IIKO_SOURCES:
+
+    [{"key": "msk", "title": "Москва", "base_url": "https://msk.iiko.example:443",
+      "login": "api", "password_sha1_env": "IIKO_MSK_PASSWORD_SHA1",
+      "max_concurrency": 4,
+      "reports": {"margin": "906ba511-...", "load_orders": {"id": "...", "name": "..."}}}]
+
+Пароль задается SHA1-хешем в password_sha1 или именем переменной окружения
+с ним в password_sha1_env (чтобы не хранить хеш в JSON).
+"""
+import os
+import json
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Optional, Tuple
+
+from .report_specs import REPORT_SPECS, ReportSpec
+
+DEFAULT_SOURCE_KEY = "default"
+
+
+@dataclass(frozen=True)
+class IikoSource:
+    """Сервер iiko и его отчеты."""
+    key: str  # Короткий ключ сервера (колонка source, источник в raw_payloads: iiko:<key>:<отчет>)
+    title: str  # Название для логов
+    base_url: str  # Адрес сервера
+    login: str  # Логин пользователя API
+    password_sha1: str  # SHA1-хеш пароля
+    max_concurrency: Optional[int] = None  # Предел одновременных запросов (None - IIKO_MAX_CONCURRENCY)
+    reports: Dict[str, Tuple[str, str]] = field(default_factory=dict)  # Отчет -> (ID, название) на этом сервере
+
+    @property
+    def is_default(self) -> bool:
+        return self.key == DEFAULT_SOURCE_KEY
+
+    def report_spec(self, spec: ReportSpec) -> ReportSpec:
+        """Спецификация отчета с ID и названием отчета на этом сервере."""
+        if spec.key not in self.reports:
+            return spec
+        report_id, report_name = self.reports[spec.key]
+        return replace(spec, report_id=report_id, report_name=report_name)
+
+
+def _parse_reports(key: str, config: Dict[str, Any]) -> Dict[str, Tuple[str, str]]:
+    reports = {}
+    for report, value in config.items():
+        if report not in REPORT_SPECS:
+            raise ValueError(
+                f"Неизвестный отчет '{report}' у сервера iiko '{key}', "
+                f"доступны: {', '.join(REPORT_SPECS)}"
+            )
+        if isinstance(value, str):
+            value = {"id": value}
+        reports[report] = (value["id"], value.get("name", REPORT_SPECS[report].report_name))
+    return reports
+
+
+def _parse_source(item: Dict[str, Any]) -> IikoSource:
+    key = item["key"]
+    password_sha1 = item.get("password_sha1")
+    if password_sha1 is None and item.get("password_sha1_env"):
+        password_sha1 = os.environ.get(item["password_sha1_env"], "")
+
+    return IikoSource(
+        key=key,
+        title=item.get("title", key),
+        base_url=item["base_url"].rstrip("/"),
+        login=item["login"],
+        password_sha1=password_sha1 or "",
+        max_concurrency=item.get("max_concurrency"),
+        reports=_parse_reports(key, item.get("reports", {}))
+    )
+
+
+def get_iiko_sources() -> Tuple[IikoSource, ...]:
+    """
+    Серверы iiko для загрузки (IIKO_SOURCES или сервер из IIKO_BASE_URL).
+
+    Параметры подключения проверяются при создании клиента (client.get_client),
+    так что для replay из кеша они не нужны.
+
+    Raises:
+        ValueError: Если в IIKO_SOURCES неизвестный отчет или повторяется ключ
+    """
+    config = os.environ.get("IIKO_SOURCES")
+    if not config:
+        return (IikoSource(
+            key=DEFAULT_SOURCE_KEY,
+            title="iiko",
+            base_url=os.environ.get("IIKO_BASE_URL", "").rstrip("/"),
+            login=os.environ.get("IIKO_LOGIN", ""),
+            password_sha1=os.environ.get("IIKO_PASSWORD_SHA1", "")
+        ),)
+
+    sources = tuple(_parse_source(item) for item in json.loads(config))
+
+    keys = [source.key for source in sources]
+    if len(set(keys)) != len(keys):
+        raise ValueError("Ключи серверов в IIKO_SOURCES должны быть уникальными")
+    for key in keys:
+        # Ключ входит в источник raw_payloads (iiko:<ключ>:<отчет>, до 64 символов)
+        if len(key) > 32 or ":" in key:
+            raise ValueError(f"Ключ сервера iiko '{key}' должен быть не длиннее 32 символов и без ':'")
+
+    return sources
+
@@ -0,0 +1,171 @@
+"""
+Потоковый разбор JSON ответов OLAP отчетов iiko.
+
+Тело ответа читается чанками, а строки отчета извлекаются по одной, так что
+в памяти одновременно находится только текущий чанк и текущая строка.
+"""
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator, List, TypeVar
+
+# Ключи, под которыми iiko возвращает массив строк отчета
+ROW_KEYS = ("data", "rows")
+
+_WHITESPACE = " \t\n\r"
+
+T = TypeVar("T")
+
+
+class _JsonStream:
+    """Буфер поверх потока байт с пошаговым извлечением JSON значений."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _more(self) -> bool:
+        """Дочитать следующий чанк. Возвращает False, если поток закончился."""
+        if self.eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self._text_decoder.decode(b"", final=True)
+            self.pos = 0
+            return False
+        # Отбрасываем уже разобранную часть буфера
+        self.buf = self.buf[self.pos:] + self._text_decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Вернуть следующий значимый символ ("" в конце потока)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Некорректный JSON ответа: ожидался '{char}', получено '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Извлечь следующее JSON значение целиком."""
+        if not self.peek():
+            raise ValueError("Некорректный JSON ответа: неожиданный конец")
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._more():
+                    continue
+                raise
+            # Число на границе чанка может быть обрезано - дочитываем
+            if end == len(self.buf) and self._more():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_array(stream: _JsonStream) -> Iterator[Any]:
+    """Выдать элементы массива; открывающая скобка уже прочитана."""
+    while True:
+        char = stream.peek()
+        if char == "]":
+            stream.pos += 1
+            return
+        if char == ",":
+            stream.pos += 1
+            continue
+        yield stream.value()
+
+
+def report_items(data: Any) -> List[Dict[str, Any]]:
+    """
+    Получить строки отчета из полного (уже разобранного) JSON ответа.
+
+    Форматы те же, что у iter_report_rows: объект с массивом строк под
+    ключом ROW_KEYS, массив строк или плоский объект - одна строка.
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in ROW_KEYS:
+            if isinstance(data.get(key), list):
+                return data[key]
+        # Альтернативный формат - плоская структура
+        return [data]
+    return []
+
+
+def iter_report_rows(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Инкрементально разобрать ответ OLAP отчета и выдать строки по одной.
+
+    Поддерживаются те же форматы, что и при разборе полного ответа:
+    объект с массивом строк под ключом "data" или "rows", массив строк
+    верхнего уровня, либо плоский объект - одна строка отчета.
+
+    Args:
+        chunks: Тело ответа по частям (например, resp.iter_content())
+
+    Yields:
+        dict: Строка отчета
+    """
+    stream = _JsonStream(chunks)
+    first = stream.peek()
+
+    if first == "[":
+        stream.pos += 1
+        yield from _iter_array(stream)
+        return
+
+    stream.expect("{")
+    flat: Dict[str, Any] = {}
+    found_rows = False
+
+    while True:
+        char = stream.peek()
+        if char == "}":
+            break
+        if char == ",":
+            stream.pos += 1
+            continue
+
+        key = stream.value()
+        stream.expect(":")
+
+        if key in ROW_KEYS and not found_rows and stream.peek() == "[":
+            stream.pos += 1
+            found_rows = True
+            flat.clear()
+            yield from _iter_array(stream)
+        else:
+            value = stream.value()
+            if not found_rows:
+                flat[key] = value
+
+    if not found_rows and flat:
+        yield flat
+
+
+def iter_batches(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """Сгруппировать элементы в списки фиксированного размера."""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
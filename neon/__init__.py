@@ -0,0 +1,3 @@
+"""
+Работа с БД Neon: схема, трансформации витрины и загрузка данных.
+"""
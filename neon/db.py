@@ -0,0 +1,174 @@
+"""
+Подключения к Neon, общие для всех загрузчиков и трансформаций процесса.
+
+По умолчанию подключения выдаются из пула (режим AUTOCOMMIT), так что SSL
+соединение с Neon устанавливается один раз на поток, а не на каждый отчет.
+В режиме run_transaction() весь запуск выполняется в одной транзакции на
+одном подключении: данные попадают в БД целиком или не попадают вовсе.
+"""
+import os
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_slots: Optional[threading.BoundedSemaphore] = None
+_pool_lock = threading.Lock()
+_atexit_registered = False
+
+# Подключение и блокировка режима одной транзакции на запуск
+_run_conn = None
+_run_lock = threading.RLock()
+
+
+def _get_pool():
+    global _pool, _pool_slots, _atexit_registered
+    with _pool_lock:
+        if _pool is None:
+            size = max(1, int(os.environ.get("NEON_POOL_SIZE", "8")))
+            _pool = ThreadedConnectionPool(1, size, os.environ["NEON_DATABASE_URL"])
+            # ThreadedConnectionPool не ждет освобождения подключения, а падает - ждем сами
+            _pool_slots = threading.BoundedSemaphore(size)
+            if not _atexit_registered:
+                atexit.register(close_pool)
+                _atexit_registered = True
+        return _pool, _pool_slots
+
+
+@contextmanager
+def connection(isolated: bool = False) -> Iterator:
+    """
+    Выдать подключение к Neon на время блока.
+
+    Внутри run_transaction() возвращается общее подключение транзакции запуска
+    (доступ из потоков сериализуется), иначе - подключение из пула в режиме
+    AUTOCOMMIT. Размер пула - NEON_POOL_SIZE (по умолчанию 8).
+
+    Args:
+        isolated: Всегда брать подключение из пула, минуя транзакцию запуска
+                  (для служебных записей, которые не должны откатываться)
+    """
+    if _run_conn is not None and not isolated:
+        with _run_lock:
+            yield _run_conn
+        return
+
+    pool, slots = _get_pool()
+    slots.acquire()
+    conn = pool.getconn()
+    broken = False
+    try:
+        if not conn.autocommit:
+            conn.autocommit = True
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken or conn.closed != 0)
+        slots.release()
+
+
+@contextmanager
+def atomic(isolated: bool = False) -> Iterator:
+    """
+    Выдать подключение, изменения через которое применяются атомарно.
+
+    Вне run_transaction() открывается отдельная транзакция (commit в конце
+    блока, rollback при ошибке); внутри - изменения становятся частью
+    транзакции запуска.
+
+    Args:
+        isolated: Всегда открывать отдельную транзакцию на подключении пула,
+                  минуя транзакцию запуска (см. connection)
+    """
+    with connection(isolated=isolated) as conn:
+        if not conn.autocommit:
+            yield conn
+            return
+
+        conn.autocommit = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+
+
+def _execute(sql: str):
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql)
+        finally:
+            cur.close()
+
+
+@contextmanager
+def savepoint(name: str) -> Iterator:
+    """
+    Откатить изменения блока при ошибке, не прерывая транзакцию запуска.
+
+    Вне run_transaction() блок выполняется как есть (AUTOCOMMIT).
+    """
+    if _run_conn is None:
+        yield
+        return
+
+    _execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except Exception:
+        _execute(f"ROLLBACK TO SAVEPOINT {name}")
+        raise
+    _execute(f"RELEASE SAVEPOINT {name}")
+
+
+def in_run_transaction() -> bool:
+    """Выполняется ли запуск в одной транзакции (run_transaction)."""
+    return _run_conn is not None
+
+
+@contextmanager
+def run_transaction() -> Iterator:
+    """
+    Выполнить весь запуск ETL в одной транзакции.
+
+    Все загрузчики и трансформации внутри блока пишут через одно подключение;
+    при успешном завершении изменения фиксируются одним COMMIT, при ошибке
+    откатываются полностью. Вложенный вызов продолжает внешнюю транзакцию.
+    """
+    global _run_conn
+    if _run_conn is not None:
+        yield _run_conn
+        return
+
+    conn = psycopg2.connect(os.environ["NEON_DATABASE_URL"])
+    _run_conn = conn
+    try:
+        yield conn
+        conn.commit()
+        print("✅ Транзакция запуска зафиксирована")
+    except Exception:
+        conn.rollback()
+        print("↩️  Транзакция запуска откачена")
+        raise
+    finally:
+        _run_conn = None
+        conn.close()
+
+
+def close_pool():
+    """Закрыть все подключения пула."""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _pool_slots = None
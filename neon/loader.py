@@ -0,0 +1,243 @@
+"""
+Загрузка строк в таблицы Neon с UPSERT по ключу уникальности.
+
+Доступны два способа загрузки (NEON_LOAD_BACKEND):
+- values - INSERT ... VALUES ... ON CONFLICT через execute_values
+  (одна команда на каждые 100 строк);
+- copy - COPY FROM STDIN во временную таблицу и один INSERT ... SELECT
+  ... ON CONFLICT на всю пачку.
+
+При высокой задержке до БД copy требует одного обмена данными на пачку
+вместо одного на каждые 100 строк. Сравнение - benchmarks/bench_loaders.py.
+
+К каждой строке добавляется хеш ее значений (колонка row_hash, см.
+schema/005_row_hash.sql); существующая строка обновляется только если хеш
+изменился, так что повторная загрузка тех же данных не пишет в таблицу.
+Ссылка на сырой ответ (payload_hash, payload_pos) в хеш не входит: если
+содержимое строки не изменилось, она продолжает ссылаться на прежний ответ.
+"""
+import io
+import os
+import hashlib
+from collections import Counter
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from psycopg2.extras import execute_values
+
+from .metrics import record, timed
+
+LOAD_BACKENDS = ("values", "copy")
+
+# Колонка с MD5 значений строки
+HASH_COLUMN = "row_hash"
+
+# Колонки, не входящие в хеш строки (ссылка на ответ в neon.payloads)
+UNHASHED_COLUMNS = ("payload_hash", "payload_pos")
+
+# Шаблоны execute_values с приведением типов ключа: (таблица, ключ) -> "(%s::date, ...)"
+_key_templates: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+
+# Экранирование для текстового формата COPY
+_COPY_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+
+def get_load_backend(backend: Optional[str] = None) -> str:
+    """Определить способ загрузки (аргумент или NEON_LOAD_BACKEND, по умолчанию values)."""
+    if backend is None:
+        backend = os.environ.get("NEON_LOAD_BACKEND", "values")
+    backend = backend.strip().lower()
+    if backend not in LOAD_BACKENDS:
+        raise ValueError(f"Неизвестный способ загрузки '{backend}', доступны: {', '.join(LOAD_BACKENDS)}")
+    return backend
+
+
+def _hash_value(value) -> str:
+    return "\\N" if value is None else str(value)
+
+
+def row_hash(row: Sequence) -> str:
+    """MD5 значений строки (None и пустая строка различаются)."""
+    data = "\x1f".join(map(_hash_value, row)).encode("utf-8")
+    return hashlib.md5(data, usedforsecurity=False).hexdigest()
+
+
+def _update_clause(table: str, columns: Sequence[str], key_columns: Sequence[str]) -> str:
+    """SET ... WHERE для ON CONFLICT: строка обновляется только при изменении хеша."""
+    updates = [f"{column} = EXCLUDED.{column}" for column in columns if column not in key_columns]
+    updates.append("loaded_at = CURRENT_TIMESTAMP")
+    return (
+        ",\n            ".join(updates)
+        + f"\n        WHERE {table}.{HASH_COLUMN} IS DISTINCT FROM EXCLUDED.{HASH_COLUMN}"
+    )
+
+
+def build_upsert_sql(table: str, columns: Sequence[str], key_columns: Sequence[str]) -> str:
+    """
+    Построить INSERT ... VALUES %s ON CONFLICT для execute_values.
+
+    columns должны включать HASH_COLUMN. Запрос возвращает строку на каждую
+    вставленную или обновленную запись.
+    """
+    return f"""
+        INSERT INTO {table}
+        ({", ".join(columns)})
+        VALUES %s
+        ON CONFLICT ({", ".join(key_columns)})
+        DO UPDATE SET
+            {_update_clause(table, columns, key_columns)}
+        RETURNING 1
+        """
+
+
+def _key_template(cur, table: str, key_columns: Sequence[str]) -> str:
+    """Шаблон строки ключа для VALUES с типами колонок таблицы."""
+    cache_key = (table, tuple(key_columns))
+    if cache_key not in _key_templates:
+        cur.execute(
+            """
+            SELECT attname, format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attname = ANY(%s)
+            """,
+            (table, list(key_columns))
+        )
+        types = dict(cur.fetchall())
+        _key_templates[cache_key] = "(" + ", ".join(f"%s::{types[column]}" for column in key_columns) + ")"
+    return _key_templates[cache_key]
+
+
+def _count_existing(cur, table: str, key_columns: Sequence[str], keys: Iterable[tuple]) -> int:
+    """Число ключей пачки, уже присутствующих в таблице."""
+    key_list = ", ".join(key_columns)
+    pages = execute_values(
+        cur,
+        f"SELECT count(*) FROM {table} WHERE ({key_list}) IN (VALUES %s)",
+        list(keys),
+        template=_key_template(cur, table, key_columns),
+        fetch=True
+    )
+    return sum(count for (count,) in pages)
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy_upsert(
+    cur,
+    table: str,
+    columns: Sequence[str],
+    key_columns: Sequence[str],
+    rows: Sequence[tuple]
+) -> Tuple[int, int]:
+    """
+    Загрузить пачку через COPY во временную таблицу и один set-based UPSERT.
+
+    Returns:
+        tuple: (ключей пачки, уже присутствовавших в таблице; записанных строк)
+    """
+    staging = f"_stage_{table}"
+    column_list = ", ".join(columns)
+    key_list = ", ".join(key_columns)
+
+    # Временная таблица живет до конца сессии и переиспользуется между пачками;
+    # _ord сохраняет порядок строк, чтобы при дублях ключа победила последняя
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS "
+        f"SELECT {column_list}, NULL::BIGINT AS _ord FROM {table} WITH NO DATA"
+    )
+    cur.execute(f"TRUNCATE {staging}")
+
+    buf = io.StringIO()
+    for ord_, row in enumerate(rows):
+        buf.write("\t".join(map(_copy_value, row)))
+        buf.write(f"\t{ord_}\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {staging} ({column_list}, _ord) FROM STDIN", buf)
+
+    cur.execute(
+        f"""
+        SELECT count(*) FROM {table}
+        WHERE ({key_list}) IN (SELECT {key_list} FROM {staging})
+        """
+    )
+    existing = cur.fetchone()[0]
+
+    cur.execute(
+        f"""
+        INSERT INTO {table} ({column_list})
+        SELECT DISTINCT ON ({key_list}) {column_list}
+        FROM {staging}
+        ORDER BY {key_list}, _ord DESC
+        ON CONFLICT ({key_list})
+        DO UPDATE SET
+            {_update_clause(table, columns, key_columns)}
+        """
+    )
+    return existing, cur.rowcount
+
+
+def upsert_rows(
+    cur,
+    table: str,
+    columns: Sequence[str],
+    key_columns: Sequence[str],
+    rows: Sequence[tuple],
+    backend: Optional[str] = None
+) -> Counter:
+    """
+    Загрузить пачку строк в таблицу с обновлением существующих по ключу.
+
+    К строкам добавляется row_hash; строки, содержимое которых не изменилось,
+    не перезаписываются.
+
+    Args:
+        cur: Курсор psycopg2
+        table: Целевая таблица (например, iiko_raw_margin)
+        columns: Колонки в порядке значений строки (без row_hash)
+        key_columns: Колонки ключа уникальности (ON CONFLICT)
+        rows: Строки - кортежи значений
+        backend: values или copy (по умолчанию NEON_LOAD_BACKEND)
+
+    Returns:
+        Counter: Число строк inserted / updated / unchanged
+    """
+    if not rows:
+        return Counter()
+
+    hashed = [i for i, column in enumerate(columns) if column not in UNHASHED_COLUMNS]
+    if len(hashed) == len(columns):
+        rows = [(*row, row_hash(row)) for row in rows]
+    else:
+        rows = [(*row, row_hash([row[i] for i in hashed])) for row in rows]
+    columns = (*columns, HASH_COLUMN)
+    key_positions = [columns.index(column) for column in key_columns]
+    keys = {tuple(row[i] for i in key_positions) for row in rows}
+
+    # Вставленные и обновленные строки различаются по числу ключей, которые
+    # уже были в таблице (xmax в RETURNING недоступен для секционированных таблиц)
+    with timed("db_seconds"):
+        if get_load_backend(backend) == "copy":
+            existing, written = _copy_upsert(cur, table, columns, key_columns, rows)
+        else:
+            existing = _count_existing(cur, table, key_columns, keys)
+            written = len(execute_values(cur, build_upsert_sql(table, columns, key_columns), rows, fetch=True))
+
+    inserted = len(keys) - existing
+    updated = written - inserted
+    record(rows_written=written)
+    return Counter(inserted=inserted, updated=updated, unchanged=existing - updated)
+
+
+def format_counts(counts: Counter) -> str:
+    """Описание результата upsert_rows для логов."""
+    return (
+        f"новых: {counts['inserted']}, изменено: {counts['updated']}, "
+        f"без изменений: {counts['unchanged']}"
+    )
@@ -0,0 +1,199 @@
+"""
+Метрики запуска ETL по этапам.
+
+Для каждого этапа (задачи etl.py: отчет iiko, лист Google Sheets, витрина)
+собираются длительность, время и число HTTP запросов, объем ответов, число
+разобранных и записанных строк, время запросов к БД и пиковая память
+процесса. Загрузчики сообщают значения через record()/timed(); значения
+относятся к этапу, открытому в текущем потоке (RunMetrics.stage), вне этапа
+они не учитываются.
+
+По завершении запуска метрики записываются:
+- в таблицу etl_run_history в Neon (schema/011_etl_run_history.sql);
+- в textfile для node_exporter Prometheus, если задан ETL_METRICS_PROMETHEUS;
+- строками JSON в файл ETL_METRICS_JSONL, если он задан.
+"""
+import os
+import json
+import time
+import resource
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from psycopg2.extras import execute_values
+
+from .db import connection
+
+# Накапливаемые значения этапа
+COUNTERS = ("http_seconds", "http_requests", "bytes_received", "rows_parsed", "rows_written", "db_seconds")
+
+
+@dataclass
+class StageMetrics:
+    """Метрики одного этапа запуска."""
+    stage: str
+    started_at: datetime
+    wall_seconds: float = 0.0
+    http_seconds: float = 0.0
+    http_requests: int = 0
+    bytes_received: int = 0
+    rows_parsed: int = 0
+    rows_written: int = 0
+    db_seconds: float = 0.0
+    peak_rss_kb: int = 0
+    status: str = "ok"
+    error: Optional[str] = None
+
+
+_current: ContextVar[Optional[StageMetrics]] = ContextVar("etl_stage", default=None)
+_lock = threading.Lock()
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss - в килобайтах (Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def record(**values):
+    """Добавить значения (http_seconds=..., rows_written=..., ...) к текущему этапу."""
+    stage = _current.get()
+    if stage is None:
+        return
+    with _lock:
+        for name, value in values.items():
+            setattr(stage, name, getattr(stage, name) + value)
+
+
+@contextmanager
+def timed(counter: str = "db_seconds", **values) -> Iterator:
+    """Добавить к текущему этапу время блока (и значения values)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(**{counter: time.perf_counter() - started}, **values)
+
+
+class RunMetrics:
+    """Метрики одного запуска ETL."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.started_at = datetime.now()
+        self.run_id = run_id or self.started_at.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        self.stages: List[StageMetrics] = []
+        self._started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """Учитывать метрики блока (и вызванных в нем загрузчиков) в этапе name."""
+        stage = StageMetrics(name, datetime.now())
+        token = _current.set(stage)
+        started = time.monotonic()
+        try:
+            yield stage
+        except Exception as e:
+            stage.status = "failed"
+            stage.error = str(e)
+            raise
+        finally:
+            _current.reset(token)
+            stage.wall_seconds = time.monotonic() - started
+            stage.peak_rss_kb = _peak_rss_kb()
+            with _lock:
+                self.stages.append(stage)
+
+    def total(self, status: str = "ok", error: Optional[str] = None) -> StageMetrics:
+        """Строка run: запуск целиком (суммы значений этапов)."""
+        total = StageMetrics(
+            "run",
+            self.started_at,
+            wall_seconds=time.monotonic() - self._started,
+            peak_rss_kb=_peak_rss_kb(),
+            status=status,
+            error=error
+        )
+        for stage in self.stages:
+            for name in COUNTERS:
+                setattr(total, name, getattr(total, name) + getattr(stage, name))
+        return total
+
+    def write(self, status: str = "ok", error: Optional[str] = None):
+        """
+        Записать метрики запуска в etl_run_history и файлы экспорта.
+
+        Ошибка записи метрик не прерывает ETL, а только печатается.
+        """
+        stages = self.stages + [self.total(status, error)]
+
+        try:
+            write_history(self.run_id, stages)
+        except Exception as e:
+            print(f"⚠️  Не удалось записать метрики запуска в etl_run_history: {e}")
+
+        prometheus_path = os.environ.get("ETL_METRICS_PROMETHEUS")
+        if prometheus_path:
+            write_prometheus(prometheus_path, self.run_id, stages)
+
+        jsonl_path = os.environ.get("ETL_METRICS_JSONL")
+        if jsonl_path:
+            write_jsonl(jsonl_path, self.run_id, stages)
+
+        print(f"📈 Метрики запуска {self.run_id} сохранены ({len(stages)} этапов)")
+
+
+def write_history(run_id: str, stages: List[StageMetrics]):
+    """Записать метрики этапов в etl_run_history (вне транзакции запуска)."""
+    columns = [field.name for field in fields(StageMetrics)]
+    with connection(isolated=True) as conn:
+        cur = conn.cursor()
+        try:
+            execute_values(
+                cur,
+                f"""
+                INSERT INTO etl_run_history (run_id, {", ".join(columns)})
+                VALUES %s
+                ON CONFLICT (run_id, stage) DO NOTHING
+                """,
+                [(run_id, *(getattr(stage, column) for column in columns)) for stage in stages]
+            )
+        finally:
+            cur.close()
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def write_prometheus(path: str, run_id: str, stages: List[StageMetrics]):
+    """
+    Записать метрики в textfile формата Prometheus (для textfile collector
+    node_exporter). Файл заменяется атомарно.
+    """
+    lines = []
+    for name in ("wall_seconds", "peak_rss_kb", *COUNTERS):
+        metric = f"etl_stage_{name}"
+        lines.append(f"# TYPE {metric} gauge")
+        for stage in stages:
+            lines.append(f'{metric}{{stage="{_label(stage.stage)}"}} {getattr(stage, name)}')
+    lines.append("# TYPE etl_stage_success gauge")
+    for stage in stages:
+        lines.append(f'etl_stage_success{{stage="{_label(stage.stage)}"}} {int(stage.status == "ok")}')
+    lines.append("# TYPE etl_last_run_timestamp_seconds gauge")
+    lines.append(f'etl_last_run_timestamp_seconds{{run_id="{_label(run_id)}"}} {time.time():.0f}')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def write_jsonl(path: str, run_id: str, stages: List[StageMetrics]):
+    """Дописать метрики этапов в файл JSON lines (строка на этап)."""
+    with open(path, "a", encoding="utf-8") as f:
+        for stage in stages:
+            f.write(json.dumps({"run_id": run_id, **asdict(stage)}, ensure_ascii=False, default=str) + "\n")
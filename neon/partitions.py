@@ -0,0 +1,55 @@
+"""
+Секции по месяцам для таблиц, секционированных по report_date.
+
+Секции создает функция ensure_month_partitions (schema/007_partitions.sql).
+Загрузчики вызывают ensure_partitions для периода запуска, чтобы строки
+попадали в секции своих месяцев, а не в секцию DEFAULT.
+"""
+from datetime import datetime
+from typing import Sequence
+
+from neon.db import connection
+
+PARTITIONED_TABLES = (
+    "iiko_raw_margin",
+    "iiko_raw_load_orders",
+    "iiko_raw_load_revenue",
+    "iiko_raw_discount_types",
+    "sheets_raw_direct",
+    "sheets_raw_fot",
+    "mart_daily_metrics",
+    "mart_hourly_load",
+    "mart_discount_types",
+)
+
+
+def ensure_partitions(
+    date_from: datetime,
+    date_to: datetime,
+    tables: Sequence[str] = PARTITIONED_TABLES
+) -> int:
+    """
+    Создать недостающие секции месяцев периода.
+
+    Args:
+        date_from: Дата начала периода
+        date_to: Дата окончания периода
+        tables: Секционированные таблицы (по умолчанию все)
+
+    Returns:
+        int: Число созданных секций
+    """
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT COALESCE(sum(ensure_month_partitions(t, %s, %s)), 0) FROM unnest(%s) AS t",
+                (date_from.date(), date_to.date(), list(tables))
+            )
+            created = cur.fetchone()[0]
+        finally:
+            cur.close()
+
+    if created:
+        print(f"🗂️  Создано секций таблиц: {created}")
+    return created
@@ -0,0 +1,170 @@
+"""
+Хранилище сырых ответов источников (таблица raw_payloads).
+
+Каждый ответ OLAP отчета iiko или выгрузка листа Google Sheets хранится один
+раз в сжатом виде (gzip) под SHA-256 несжатого содержимого. Строки сырых
+таблиц ссылаются на ответ (payload_hash) и свое место в нем (payload_pos)
+вместо копии строки в raw_data.
+
+Просмотр исходной строки:
+    python -m neon.payloads <payload_hash> <payload_pos>
+"""
+import gzip
+import json
+import binascii
+import hashlib
+from typing import Any, BinaryIO, Dict, Optional
+
+from iiko.api.stream import report_items
+from neon.db import connection
+from neon.metrics import timed
+
+# Размер чанка файла ответа при передаче в БД
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def save_compressed_payload(
+    source: str,
+    payload_hash: str,
+    compressed: bytes,
+    size: Optional[int] = None
+) -> str:
+    """
+    Сохранить уже сжатый (gzip) ответ, если его еще нет в raw_payloads.
+
+    Args:
+        source: Источник ответа (например, iiko:margin, sheets:direct)
+        payload_hash: SHA-256 несжатого содержимого
+        compressed: Содержимое, сжатое gzip
+        size: Размер несжатого содержимого в байтах
+
+    Returns:
+        str: payload_hash
+    """
+    with connection() as conn, timed("db_seconds"):
+        cur = conn.cursor()
+        try:
+            # Проверка перед вставкой: повторный ответ не передается в БД
+            cur.execute("SELECT 1 FROM raw_payloads WHERE payload_hash = %s", (payload_hash,))
+            if cur.fetchone() is None:
+                cur.execute(
+                    """
+                    INSERT INTO raw_payloads (payload_hash, source, content, size_bytes)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (payload_hash) DO NOTHING
+                    """,
+                    (payload_hash, source, compressed, size)
+                )
+        finally:
+            cur.close()
+
+    return payload_hash
+
+
+class _ByteaCopyStream:
+    """Содержимое файла как одно значение BYTEA для COPY (текстовый формат, hex)."""
+
+    def __init__(self, f: BinaryIO):
+        self._file = f
+        self._prefix = b"\\\\x"
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        if self._prefix:
+            prefix, self._prefix = self._prefix, b""
+            return prefix
+        if self._done:
+            return b""
+        # Каждый байт файла - две hex цифры
+        chunk = self._file.read(max(1, size // 2) if size > 0 else COPY_CHUNK_SIZE)
+        if not chunk:
+            self._done = True
+            return b"\n"
+        return binascii.hexlify(chunk)
+
+
+def save_payload_file(
+    source: str,
+    payload_hash: str,
+    path: str,
+    size: Optional[int] = None
+) -> str:
+    """
+    Сохранить файл, уже сжатый gzip (ответ из кеша), если его еще нет в raw_payloads.
+
+    Файл передается в БД через COPY чанками по COPY_CHUNK_SIZE, не
+    загружаясь в память целиком; если ответ уже сохранен, файл не читается.
+
+    Args:
+        source: Источник ответа (например, iiko:margin)
+        payload_hash: SHA-256 несжатого содержимого
+        path: Путь к файлу, сжатому gzip
+        size: Размер несжатого содержимого в байтах
+
+    Returns:
+        str: payload_hash
+    """
+    with connection() as conn, timed("db_seconds"):
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1 FROM raw_payloads WHERE payload_hash = %s", (payload_hash,))
+            if cur.fetchone() is not None:
+                return payload_hash
+
+            # Временная таблица живет до конца сессии и переиспользуется
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS _stage_raw_payloads (content BYTEA NOT NULL)")
+            cur.execute("TRUNCATE _stage_raw_payloads")
+            with open(path, "rb") as f:
+                cur.copy_expert("COPY _stage_raw_payloads (content) FROM STDIN", _ByteaCopyStream(f), size=COPY_CHUNK_SIZE)
+            cur.execute(
+                """
+                INSERT INTO raw_payloads (payload_hash, source, content, size_bytes)
+                SELECT %s, %s, content, %s FROM _stage_raw_payloads
+                ON CONFLICT (payload_hash) DO NOTHING
+                """,
+                (payload_hash, source, size)
+            )
+            cur.execute("TRUNCATE _stage_raw_payloads")
+        finally:
+            cur.close()
+
+    return payload_hash
+
+
+def save_payload(source: str, data: bytes) -> str:
+    """
+    Сжать и сохранить ответ в raw_payloads.
+
+    Returns:
+        str: SHA-256 содержимого (payload_hash)
+    """
+    payload_hash = hashlib.sha256(data).hexdigest()
+    return save_compressed_payload(source, payload_hash, gzip.compress(data, compresslevel=6), len(data))
+
+
+def load_payload(payload_hash: str) -> Any:
+    """Прочитать ответ из raw_payloads и разобрать JSON."""
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT content FROM raw_payloads WHERE payload_hash = %s", (payload_hash,))
+            row = cur.fetchone()
+        finally:
+            cur.close()
+
+    if row is None:
+        raise LookupError(f"Ответ {payload_hash} не найден в raw_payloads")
+    return json.loads(gzip.decompress(bytes(row[0])))
+
+
+def load_payload_row(payload_hash: str, payload_pos: int) -> Dict[str, Any]:
+    """Исходная строка источника для строки сырой таблицы."""
+    return report_items(load_payload(payload_hash))[payload_pos]
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    print(json.dumps(load_payload_row(sys.argv[1], int(sys.argv[2])), ensure_ascii=False, indent=2))
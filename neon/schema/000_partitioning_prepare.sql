@@ -0,0 +1,43 @@
+-- Подготовка к переходу на секционированные таблицы (выполняется первым).
+--
+-- Таблицы, созданные до секционирования (обычные heap таблицы), переименовываются
+-- в <таблица>_legacy; их индексы и ограничения удаляются, чтобы не занимать
+-- имена. 001-003 создают на их месте секционированные таблицы, а
+-- 007_partitions.sql переносит в них данные и удаляет *_legacy.
+-- На новой или уже секционированной БД файл ничего не делает.
+
+DO $$
+DECLARE
+    tbl TEXT;
+    idx RECORD;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY[
+        'iiko_raw_margin', 'iiko_raw_load_orders', 'iiko_raw_load_revenue', 'iiko_raw_discount_types',
+        'sheets_raw_direct', 'sheets_raw_fot',
+        'mart_daily_metrics', 'mart_hourly_load', 'mart_discount_types'
+    ] LOOP
+        -- relkind 'r' - обычная таблица, 'p' - секционированная
+        IF EXISTS (
+            SELECT 1 FROM pg_class
+            WHERE oid = to_regclass(tbl) AND relkind = 'r'
+        ) THEN
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, tbl || '_legacy');
+
+            FOR idx IN
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = to_regclass(tbl || '_legacy') AND contype IN ('p', 'u')
+            LOOP
+                EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', tbl || '_legacy', idx.conname);
+            END LOOP;
+
+            FOR idx IN
+                SELECT indexrelid::regclass::text AS name FROM pg_index
+                WHERE indrelid = to_regclass(tbl || '_legacy')
+            LOOP
+                EXECUTE format('DROP INDEX %s', idx.name);
+            END LOOP;
+
+            RAISE NOTICE 'Таблица % переименована в %_legacy для переноса данных', tbl, tbl;
+        END IF;
+    END LOOP;
+END $$;
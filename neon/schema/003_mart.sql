@@ -1,7 +1,8 @@
 -- Витрина данных для DataLens со всеми 15 метриками
+-- Таблицы секционированы по месяцам report_date; секции создает
+-- ensure_month_partitions (см. 007_partitions.sql)
 
 CREATE TABLE IF NOT EXISTS mart_daily_metrics (
-    id SERIAL PRIMARY KEY,
     report_date DATE NOT NULL,
     department VARCHAR(255) NOT NULL,  -- Торговое предприятие (Домодедово/Авиагородок)
     
@@ -33,31 +34,27 @@ CREATE TABLE IF NOT EXISTS mart_daily_metrics (
     
     -- Метаданные
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(report_date, department)
-);
+    PRIMARY KEY (report_date, department)
+) PARTITION BY RANGE (report_date);
 
-CREATE INDEX idx_mart_daily_metrics_date ON mart_daily_metrics(report_date);
-CREATE INDEX idx_mart_daily_metrics_department ON mart_daily_metrics(department);
+CREATE INDEX IF NOT EXISTS idx_mart_daily_metrics_department ON mart_daily_metrics(department);
 
 -- Таблица нагрузки по часам (п.13, 14)
 CREATE TABLE IF NOT EXISTS mart_hourly_load (
-    id SERIAL PRIMARY KEY,
     report_date DATE NOT NULL,
     department VARCHAR(255) NOT NULL,
     hour_open INTEGER NOT NULL,  -- Час (0-23)
     orders_count INTEGER,  -- 13) Нагрузка по дням и по часам по кол-ву заказов
     revenue NUMERIC(15, 2),  -- 14) Нагрузка по дням и по часам по выручке
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(report_date, department, hour_open)
-);
+    PRIMARY KEY (report_date, department, hour_open)
+) PARTITION BY RANGE (report_date);
 
-CREATE INDEX idx_mart_hourly_load_date ON mart_hourly_load(report_date);
-CREATE INDEX idx_mart_hourly_load_department ON mart_hourly_load(department);
-CREATE INDEX idx_mart_hourly_load_hour ON mart_hourly_load(hour_open);
+CREATE INDEX IF NOT EXISTS idx_mart_hourly_load_department ON mart_hourly_load(department);
+CREATE INDEX IF NOT EXISTS idx_mart_hourly_load_hour ON mart_hourly_load(hour_open);
 
 -- Таблица типов скидок (п.15)
 CREATE TABLE IF NOT EXISTS mart_discount_types (
-    id SERIAL PRIMARY KEY,
     report_date DATE NOT NULL,
     department VARCHAR(255) NOT NULL,
     discount_type VARCHAR(255) NOT NULL,  -- Тип скидки
@@ -66,9 +63,8 @@ CREATE TABLE IF NOT EXISTS mart_discount_types (
     discount_sum NUMERIC(15, 2),  -- Сумма общей по скидке
     average_check NUMERIC(15, 2),  -- Средний чек по заказам со скидкой
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(report_date, department, discount_type)
-);
+    PRIMARY KEY (report_date, department, discount_type)
+) PARTITION BY RANGE (report_date);
 
-CREATE INDEX idx_mart_discount_types_date ON mart_discount_types(report_date);
-CREATE INDEX idx_mart_discount_types_department ON mart_discount_types(department);
-CREATE INDEX idx_mart_discount_types_type ON mart_discount_types(discount_type);
+CREATE INDEX IF NOT EXISTS idx_mart_discount_types_department ON mart_discount_types(department);
+CREATE INDEX IF NOT EXISTS idx_mart_discount_types_type ON mart_discount_types(discount_type);
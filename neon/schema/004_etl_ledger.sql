@@ -0,0 +1,20 @@
+-- Служебные таблицы ETL процесса
+
+-- Журнал окон исторической загрузки (backfill).
+-- Каждая строка - одно окно дат; по строкам со статусом 'done'
+-- прерванная загрузка продолжается с места остановки.
+CREATE TABLE IF NOT EXISTS etl_backfill_ledger (
+    id SERIAL PRIMARY KEY,
+    backfill_id VARCHAR(64) NOT NULL,  -- Идентификатор загрузки (по умолчанию - диапазон дат)
+    window_from DATE NOT NULL,  -- Первый день окна
+    window_to DATE NOT NULL,  -- Последний день окна (включительно)
+    status VARCHAR(16) NOT NULL,  -- running / done / failed
+    rows_loaded INTEGER,  -- Строк загружено по всем отчетам iiko
+    duration_seconds NUMERIC(10, 2),  -- Длительность загрузки окна
+    error TEXT,  -- Текст ошибки для статуса failed
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    UNIQUE(backfill_id, window_from)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_backfill_ledger_status ON etl_backfill_ledger(backfill_id, status);
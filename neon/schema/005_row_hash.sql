@@ -0,0 +1,11 @@
+-- Хеш содержимого строк сырых таблиц.
+-- Загрузчики (neon/loader.py) передают MD5 значений строки и обновляют
+-- существующую строку только если хеш изменился: повторная загрузка
+-- тех же данных не переписывает строки, индексы и loaded_at.
+
+ALTER TABLE iiko_raw_margin ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+ALTER TABLE iiko_raw_load_orders ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+ALTER TABLE iiko_raw_load_revenue ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+ALTER TABLE iiko_raw_discount_types ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+ALTER TABLE sheets_raw_direct ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+ALTER TABLE sheets_raw_fot ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
@@ -0,0 +1,18 @@
+-- Инкрементальное обновление витрины
+
+-- Отметка последнего обновления каждой витрины.
+-- run_transforms пересчитывает срезы (report_date, department), строки
+-- которых в сырых таблицах изменились (loaded_at) после этой отметки.
+CREATE TABLE IF NOT EXISTS mart_refresh_state (
+    mart VARCHAR(64) PRIMARY KEY,  -- Таблица витрины (mart_daily_metrics, ...)
+    watermark TIMESTAMP NOT NULL,  -- Начало последнего обновления (или более ранней открытой тогда транзакции)
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Поиск измененных строк по loaded_at без полного чтения сырых таблиц
+CREATE INDEX IF NOT EXISTS idx_iiko_raw_margin_loaded_at ON iiko_raw_margin(loaded_at);
+CREATE INDEX IF NOT EXISTS idx_iiko_raw_load_orders_loaded_at ON iiko_raw_load_orders(loaded_at);
+CREATE INDEX IF NOT EXISTS idx_iiko_raw_load_revenue_loaded_at ON iiko_raw_load_revenue(loaded_at);
+CREATE INDEX IF NOT EXISTS idx_iiko_raw_discount_types_loaded_at ON iiko_raw_discount_types(loaded_at);
+CREATE INDEX IF NOT EXISTS idx_sheets_raw_direct_loaded_at ON sheets_raw_direct(loaded_at);
+CREATE INDEX IF NOT EXISTS idx_sheets_raw_fot_loaded_at ON sheets_raw_fot(loaded_at);
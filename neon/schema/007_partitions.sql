@@ -0,0 +1,98 @@
+-- Секции по месяцам для таблиц iiko_raw_*, sheets_raw_* и mart_*
+
+-- Создать секции <таблица>_pГГГГ_ММ для всех месяцев периода.
+-- У каждой таблицы есть секция <таблица>_default для строк вне созданных
+-- месяцев; при создании секции месяца такие строки переносятся в нее.
+-- Возвращает число созданных секций.
+CREATE OR REPLACE FUNCTION ensure_month_partitions(parent TEXT, date_from DATE, date_to DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', date_from)::date;
+    month_end DATE;
+    part TEXT;
+    default_part TEXT := parent || '_default';
+    created INTEGER := 0;
+BEGIN
+    -- Параллельные загрузки не должны создавать одну секцию дважды
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_month_partitions:' || parent));
+
+    IF to_regclass(default_part) IS NULL THEN
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', default_part, parent);
+    END IF;
+
+    WHILE month_start <= date_to LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        part := format('%s_p%s', parent, to_char(month_start, 'YYYY_MM'));
+
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part, parent);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE report_date >= %L AND report_date < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                default_part, month_start, month_end, part
+            );
+            -- Индексы родительской таблицы создаются на секции при подключении
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent, part, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+
+        month_start := month_end;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Перенос данных из таблиц до секционирования (см. 000_partitioning_prepare.sql)
+-- и секции на текущий и два следующих месяца
+DO $$
+DECLARE
+    tbl TEXT;
+    legacy TEXT;
+    cols TEXT;
+    min_date DATE;
+    max_date DATE;
+    moved BIGINT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY[
+        'iiko_raw_margin', 'iiko_raw_load_orders', 'iiko_raw_load_revenue', 'iiko_raw_discount_types',
+        'sheets_raw_direct', 'sheets_raw_fot',
+        'mart_daily_metrics', 'mart_hourly_load', 'mart_discount_types'
+    ] LOOP
+        legacy := tbl || '_legacy';
+
+        IF to_regclass(legacy) IS NOT NULL THEN
+            EXECUTE format('SELECT min(report_date), max(report_date) FROM %I', legacy)
+                INTO min_date, max_date;
+
+            IF min_date IS NOT NULL THEN
+                PERFORM ensure_month_partitions(tbl, min_date, max_date);
+            END IF;
+
+            -- Общие колонки (id в секционированных таблицах нет)
+            SELECT string_agg(quote_ident(c.column_name), ', ' ORDER BY c.ordinal_position)
+            INTO cols
+            FROM information_schema.columns c
+            JOIN information_schema.columns l
+                ON l.table_schema = c.table_schema
+                AND l.table_name = legacy
+                AND l.column_name = c.column_name
+            WHERE c.table_schema = current_schema() AND c.table_name = tbl;
+
+            EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM %I', tbl, cols, cols, legacy);
+            GET DIAGNOSTICS moved = ROW_COUNT;
+            EXECUTE format('DROP TABLE %I', legacy);
+
+            RAISE NOTICE 'Перенесено строк в %: %', tbl, moved;
+        END IF;
+
+        PERFORM ensure_month_partitions(
+            tbl,
+            CURRENT_DATE,
+            (date_trunc('month', CURRENT_DATE) + INTERVAL '2 months')::date
+        );
+    END LOOP;
+END $$;
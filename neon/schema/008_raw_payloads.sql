@@ -0,0 +1,25 @@
+-- Сырые ответы источников, по одному экземпляру на ответ
+
+-- Ответ OLAP отчета iiko или выгрузка листа Google Sheets целиком (gzip JSON).
+-- Строки сырых таблиц ссылаются на ответ и свое место в нем; прочитать
+-- исходную строку: python -m neon.payloads <payload_hash> <payload_pos>
+CREATE TABLE IF NOT EXISTS raw_payloads (
+    payload_hash CHAR(64) PRIMARY KEY,  -- SHA-256 несжатого содержимого
+    source VARCHAR(64) NOT NULL,  -- Источник: iiko:<отчет>, sheets:<лист>
+    content BYTEA NOT NULL,  -- Содержимое, сжатое gzip
+    size_bytes BIGINT,  -- Размер несжатого содержимого
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Уже сжатое содержимое не сжимается повторно при хранении (TOAST)
+ALTER TABLE raw_payloads ALTER COLUMN content SET STORAGE EXTERNAL;
+
+-- Ссылка строки на ответ: хеш ответа и номер строки в нем (с 0).
+-- raw_data заполнен только у строк, загруженных до появления raw_payloads,
+-- и очищается при их следующем обновлении.
+ALTER TABLE iiko_raw_margin ADD COLUMN IF NOT EXISTS payload_hash CHAR(64), ADD COLUMN IF NOT EXISTS payload_pos INTEGER;
+ALTER TABLE iiko_raw_load_orders ADD COLUMN IF NOT EXISTS payload_hash CHAR(64), ADD COLUMN IF NOT EXISTS payload_pos INTEGER;
+ALTER TABLE iiko_raw_load_revenue ADD COLUMN IF NOT EXISTS payload_hash CHAR(64), ADD COLUMN IF NOT EXISTS payload_pos INTEGER;
+ALTER TABLE iiko_raw_discount_types ADD COLUMN IF NOT EXISTS payload_hash CHAR(64), ADD COLUMN IF NOT EXISTS payload_pos INTEGER;
+ALTER TABLE sheets_raw_direct ADD COLUMN IF NOT EXISTS payload_hash CHAR(64), ADD COLUMN IF NOT EXISTS payload_pos INTEGER;
+ALTER TABLE sheets_raw_fot ADD COLUMN IF NOT EXISTS payload_hash CHAR(64), ADD COLUMN IF NOT EXISTS payload_pos INTEGER;
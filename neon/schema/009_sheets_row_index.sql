@@ -0,0 +1,26 @@
+-- Индекс строк листов Google Sheets по датам (google_sheets/row_index.py)
+
+-- Структура листа, для которой построен индекс.
+-- При изменении шапки (header_hash) или даты в последней проиндексированной
+-- строке (строки вставлены или удалены) индекс строится заново.
+CREATE TABLE IF NOT EXISTS sheets_layout (
+    spreadsheet_id VARCHAR(128) NOT NULL,
+    worksheet_id BIGINT NOT NULL,           -- gid листа
+    header_hash CHAR(32) NOT NULL,          -- MD5 строки заголовков
+    date_column INTEGER NOT NULL,           -- Номер колонки с датой (с 1)
+    indexed_rows INTEGER NOT NULL,          -- Последняя проиндексированная строка листа
+    last_date DATE,                         -- Дата в строке indexed_rows (проверка смещения строк)
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (spreadsheet_id, worksheet_id)
+);
+
+-- Номера строк листа для каждой даты
+CREATE TABLE IF NOT EXISTS sheets_row_index (
+    spreadsheet_id VARCHAR(128) NOT NULL,
+    worksheet_id BIGINT NOT NULL,
+    report_date DATE NOT NULL,
+    row_numbers INTEGER[] NOT NULL,
+    PRIMARY KEY (spreadsheet_id, worksheet_id, report_date),
+    FOREIGN KEY (spreadsheet_id, worksheet_id)
+        REFERENCES sheets_layout (spreadsheet_id, worksheet_id) ON DELETE CASCADE
+);
@@ -0,0 +1,17 @@
+-- Состояние загрузки листов Google Sheets (google_sheets/sync_state.py)
+
+-- Последняя успешная загрузка каждого листа (ключ из google_sheets/sources.py).
+-- Лист не скачивается, если версия таблицы в Drive не изменилась, а даты
+-- периода запуска загружены или отсутствуют в листе (sheets_row_index);
+-- строки не загружаются, если совпал отпечаток содержимого за тот же период.
+CREATE TABLE IF NOT EXISTS sheets_sync_state (
+    source VARCHAR(64) PRIMARY KEY,
+    spreadsheet_id VARCHAR(128) NOT NULL,
+    worksheet_id BIGINT,                  -- gid листа
+    version VARCHAR(32),                  -- Версия файла в Drive
+    modified_time TIMESTAMPTZ,            -- Время последнего изменения таблицы
+    content_hash CHAR(64) NOT NULL,       -- SHA-256 выгрузки листа за период (как в raw_payloads)
+    date_from DATE,                       -- Загруженный период (NULL - весь лист)
+    date_to DATE,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
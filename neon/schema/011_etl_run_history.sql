@@ -0,0 +1,22 @@
+-- История запусков ETL (neon/metrics.py)
+
+-- Метрики каждого этапа запуска: задача etl.py (iiko:<отчет>, sheets:<лист>,
+-- mart:<витрина>, ...) и строка run - запуск целиком.
+CREATE TABLE IF NOT EXISTS etl_run_history (
+    run_id VARCHAR(64) NOT NULL,  -- Идентификатор запуска
+    stage VARCHAR(128) NOT NULL,  -- Этап (задача) или run
+    started_at TIMESTAMP NOT NULL,
+    wall_seconds NUMERIC(12, 3) NOT NULL,  -- Длительность этапа
+    http_seconds NUMERIC(12, 3) NOT NULL DEFAULT 0,  -- Время HTTP запросов (с чтением ответа)
+    http_requests INTEGER NOT NULL DEFAULT 0,
+    bytes_received BIGINT NOT NULL DEFAULT 0,  -- Размер полученных ответов
+    rows_parsed INTEGER NOT NULL DEFAULT 0,  -- Строк разобрано из ответов
+    rows_written INTEGER NOT NULL DEFAULT 0,  -- Строк вставлено или изменено в БД
+    db_seconds NUMERIC(12, 3) NOT NULL DEFAULT 0,  -- Время запросов к БД
+    peak_rss_kb BIGINT,  -- Пиковая память процесса к концу этапа
+    status VARCHAR(16) NOT NULL,  -- ok / failed
+    error TEXT,
+    PRIMARY KEY (run_id, stage)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_run_history_started_at ON etl_run_history(started_at);
@@ -0,0 +1,42 @@
+-- Несколько серверов iiko в одних сырых таблицах (IIKO_SOURCES, см. iiko/api/sources.py)
+--
+-- Строки помечаются ключом сервера-источника (source); строки, загруженные
+-- до появления нескольких серверов, относятся к серверу по умолчанию.
+-- Ключ уникальности включает source: одно предприятие за один день может
+-- прийти с разных серверов, витрины суммируют такие строки (refresh_mart.sql).
+
+DO $$
+DECLARE
+    rec RECORD;
+BEGIN
+    FOR rec IN
+        SELECT * FROM (VALUES
+            ('iiko_raw_margin', 'report_date, source, department'),
+            ('iiko_raw_load_orders', 'report_date, source, department, hour_open'),
+            ('iiko_raw_load_revenue', 'report_date, source, department, hour_open'),
+            ('iiko_raw_discount_types', 'report_date, source, department, discount_type')
+        ) AS t(tbl, pk)
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %I ADD COLUMN IF NOT EXISTS source VARCHAR(64) NOT NULL DEFAULT %L',
+            rec.tbl, 'default'
+        );
+
+        -- Первичный ключ без source заменяется (секции получают новый ключ вместе с таблицей)
+        IF NOT EXISTS (
+            SELECT 1
+            FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+            WHERE c.conrelid = to_regclass(rec.tbl) AND c.contype = 'p' AND a.attname = 'source'
+        ) THEN
+            EXECUTE (
+                SELECT format('ALTER TABLE %I DROP CONSTRAINT %I', rec.tbl, conname)
+                FROM pg_constraint
+                WHERE conrelid = to_regclass(rec.tbl) AND contype = 'p'
+            );
+            EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (%s)', rec.tbl, rec.pk);
+
+            RAISE NOTICE 'Ключ % заменен на (%)', rec.tbl, rec.pk;
+        END IF;
+    END LOOP;
+END $$;
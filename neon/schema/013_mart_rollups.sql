@@ -0,0 +1,105 @@
+-- Агрегаты витрины для DataLens: недели, месяцы, итоги предприятий и
+-- матрица нагрузки день недели × час
+--
+-- Заполняются из mart_* секциями transforms/refresh_rollups.sql в той же
+-- транзакции, что и витрины: пересчитываются только недели, месяцы и
+-- предприятия, в которые попали пересчитанные дни (mart_refresh_scope).
+-- Пустые агрегаты при заполненной витрине (первое обновление после этой
+-- миграции) run_transforms.py заполняет за всю историю витрины.
+-- Дашборды читают сотни строк агрегатов вместо дневных строк за всю историю.
+--
+-- Суммы и проценты недели/месяца рассчитываются по суммам дней: процент
+-- периода - не среднее дневных процентов, а доля от выручки периода.
+
+-- Метрики mart_daily_metrics по неделям и месяцам
+CREATE TABLE IF NOT EXISTS mart_period_metrics (
+    period VARCHAR(8) NOT NULL CHECK (period IN ('week', 'month')),
+    period_start DATE NOT NULL,  -- Понедельник недели или первое число месяца
+    department VARCHAR(255) NOT NULL,
+    days_count INTEGER NOT NULL,  -- Дней с данными в периоде
+
+    revenue NUMERIC(15, 2),  -- 1) Выручка
+    discount_sum NUMERIC(15, 2),  -- Сумма скидок
+    discount_percent NUMERIC(5, 2),  -- 2) % скидки (от выручки периода)
+    product_cost NUMERIC(15, 2),  -- Себестоимость
+    cost_percent NUMERIC(5, 2),  -- 4) % себестоимости
+    ad_budget NUMERIC(15, 2),  -- 3) Рекламный бюджет
+    ad_budget_percent NUMERIC(5, 2),
+    fot_direct NUMERIC(15, 2),  -- 3) ФОТ директ
+    fot_direct_percent NUMERIC(5, 2),
+    fot_couriers NUMERIC(15, 2),  -- 5) ФОТ курьеры
+    fot_couriers_percent NUMERIC(5, 2),
+    fot_cooks NUMERIC(15, 2),  -- 11) ФОТ повара
+    fot_cooks_percent NUMERIC(5, 2),
+    fot_cleaners NUMERIC(15, 2),  -- 12) ФОТ уборщицы
+    fot_cleaners_percent NUMERIC(5, 2),
+    packaging_cost NUMERIC(15, 2),  -- 6) Упаковка
+    arora_cost NUMERIC(15, 2),  -- 7) Арора
+    taxes_cost NUMERIC(15, 2),  -- 8) Налоги
+    acquiring_cost NUMERIC(15, 2),  -- 9) Эквайринг
+    margin NUMERIC(15, 2),  -- 10) Маржа
+    margin_percent NUMERIC(7, 2),  -- % маржи (от выручки периода)
+
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period, period_start, department)
+);
+
+-- Итоги mart_daily_metrics по предприятиям за всю историю
+CREATE TABLE IF NOT EXISTS mart_department_totals (
+    department VARCHAR(255) PRIMARY KEY,
+    first_date DATE NOT NULL,  -- Первый день с данными
+    last_date DATE NOT NULL,  -- Последний день с данными
+    days_count INTEGER NOT NULL,
+    revenue NUMERIC(15, 2),
+    discount_sum NUMERIC(15, 2),
+    product_cost NUMERIC(15, 2),
+    ad_budget NUMERIC(15, 2),
+    fot_direct NUMERIC(15, 2),
+    fot_couriers NUMERIC(15, 2),
+    fot_cooks NUMERIC(15, 2),
+    fot_cleaners NUMERIC(15, 2),
+    margin NUMERIC(15, 2),
+    margin_percent NUMERIC(7, 2),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Нагрузка mart_hourly_load по неделям и месяцам
+CREATE TABLE IF NOT EXISTS mart_period_hourly_load (
+    period VARCHAR(8) NOT NULL CHECK (period IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    hour_open INTEGER NOT NULL,  -- Час (0-23)
+    orders_count INTEGER,  -- 13) Заказы
+    revenue NUMERIC(15, 2),  -- 14) Выручка
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period, period_start, department, hour_open)
+);
+
+-- Матрица нагрузки 7 × 24 (день недели × час) по месяцам, для тепловых карт.
+-- Для каждого дня недели с данными есть все 24 часа (часы без заказов - 0).
+-- Средняя нагрузка за любой период: SUM(orders_count) / SUM(days_count)
+CREATE TABLE IF NOT EXISTS mart_load_matrix (
+    month_start DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    weekday INTEGER NOT NULL,  -- День недели ISO: 1 - понедельник ... 7 - воскресенье
+    hour_open INTEGER NOT NULL,  -- Час (0-23)
+    days_count INTEGER NOT NULL,  -- Дней с этим днем недели в месяце (с данными)
+    orders_count INTEGER NOT NULL,
+    revenue NUMERIC(15, 2) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (month_start, department, weekday, hour_open)
+);
+
+-- Типы скидок mart_discount_types по неделям и месяцам
+CREATE TABLE IF NOT EXISTS mart_period_discount_types (
+    period VARCHAR(8) NOT NULL CHECK (period IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    discount_type VARCHAR(255) NOT NULL,
+    orders_count INTEGER,
+    revenue_with_discount NUMERIC(15, 2),
+    discount_sum NUMERIC(15, 2),
+    average_check NUMERIC(15, 2),  -- Выручка на заказ за период
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period, period_start, department, discount_type)
+);
@@ -16,9 +16,20 @@ def init_schema():
     
     # Порядок выполнения SQL файлов
     sql_files = [
+        "000_partitioning_prepare.sql",
         "001_iiko_raw.sql",
         "002_sheets_raw.sql",
-        "003_mart.sql"
+        "003_mart.sql",
+        "004_etl_ledger.sql",
+        "005_row_hash.sql",
+        "006_mart_refresh.sql",
+        "007_partitions.sql",
+        "008_raw_payloads.sql",
+        "009_sheets_row_index.sql",
+        "010_sheets_sync_state.sql",
+        "011_etl_run_history.sql",
+        "012_iiko_sources.sql",
+        "013_mart_rollups.sql"
     ]
     
     conn = psycopg2.connect(os.environ["NEON_DATABASE_URL"])
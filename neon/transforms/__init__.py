@@ -0,0 +1,3 @@
+"""
+SQL трансформации витрины данных.
+"""
@@ -1,10 +1,36 @@
 -- SQL трансформации для расчета всех 15 метрик в витрине данных
+--
+-- Пересчитываются только срезы (report_date, department) из временной
+-- таблицы mart_refresh_scope. run_transforms.py заполняет ее для каждой
+-- витрины отдельно (измененные с прошлого обновления строки или заданный
+-- период) и выполняет только секции "-- @mart: ..." этого файла.
+--
+-- При прямом запуске файла (psql, SQL консоль Neon) выполняется и эта шапка:
+-- область пересчета - вся история сырых таблиц.
+--
+-- Строки iiko одного предприятия с разных серверов (колонка source, см.
+-- 012_iiko_sources.sql) суммируются; проценты и средний чек пересчитываются
+-- по суммам. Строка с единственного сервера берется как есть.
 
--- Очистка витрины перед обновлением (опционально, можно использовать UPSERT)
--- TRUNCATE TABLE mart_daily_metrics;
--- TRUNCATE TABLE mart_hourly_load;
--- TRUNCATE TABLE mart_discount_types;
+CREATE TEMP TABLE IF NOT EXISTS mart_refresh_scope (
+    report_date DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    PRIMARY KEY (report_date, department)
+);
 
+TRUNCATE mart_refresh_scope;
+
+INSERT INTO mart_refresh_scope (report_date, department)
+SELECT report_date, department FROM iiko_raw_margin
+UNION SELECT report_date, department FROM iiko_raw_load_orders
+UNION SELECT report_date, department FROM iiko_raw_load_revenue
+UNION SELECT report_date, department FROM iiko_raw_discount_types
+UNION SELECT report_date, department FROM sheets_raw_direct
+UNION SELECT report_date, department FROM sheets_raw_fot;
+
+ANALYZE mart_refresh_scope;
+
+-- @mart: mart_daily_metrics
 -- 1. Обновление таблицы mart_daily_metrics (метрики по дням)
 
 INSERT INTO mart_daily_metrics (
@@ -96,7 +122,26 @@ SELECT
     - (m.dish_sum_int * 0.008)  -- эквайринг
     AS margin
     
-FROM iiko_raw_margin m
+FROM (
+    SELECT
+        m.report_date,
+        m.department,
+        SUM(m.dish_sum_int) AS dish_sum_int,
+        SUM(m.discount_sum) AS discount_sum,
+        CASE
+            WHEN COUNT(*) = 1 THEN MAX(m.product_cost_base_percent)
+            -- Себестоимость нескольких серверов - средняя, взвешенная по выручке
+            ELSE COALESCE(
+                SUM(m.dish_sum_int * m.product_cost_base_percent) / NULLIF(SUM(m.dish_sum_int), 0),
+                AVG(m.product_cost_base_percent)
+            )
+        END AS product_cost_base_percent
+    FROM iiko_raw_margin m
+    JOIN mart_refresh_scope s
+        ON m.report_date = s.report_date
+        AND m.department = s.department
+    GROUP BY m.report_date, m.department
+) m
 LEFT JOIN sheets_raw_direct d 
     ON m.report_date = d.report_date 
     AND m.department = d.department
@@ -125,6 +170,7 @@ DO UPDATE SET
     margin = EXCLUDED.margin,
     updated_at = CURRENT_TIMESTAMP;
 
+-- @mart: mart_hourly_load
 -- 2. Обновление таблицы mart_hourly_load (нагрузка по часам, п.13, 14)
 
 INSERT INTO mart_hourly_load (
@@ -140,8 +186,18 @@ SELECT
     COALESCE(o.hour_open, r.hour_open) AS hour_open,
     COALESCE(o.orders_count, 0) AS orders_count,  -- 13) Нагрузка по дням и по часам по кол-ву заказов
     COALESCE(r.dish_discount_sum_int, 0) AS revenue  -- 14) Нагрузка по дням и по часам по выручке
-FROM iiko_raw_load_orders o
-FULL OUTER JOIN iiko_raw_load_revenue r
+FROM (
+    SELECT report_date, department, hour_open, SUM(o.orders_count) AS orders_count
+    FROM iiko_raw_load_orders o
+    JOIN mart_refresh_scope s USING (report_date, department)
+    GROUP BY report_date, department, hour_open
+) o
+FULL OUTER JOIN (
+    SELECT report_date, department, hour_open, SUM(r.dish_discount_sum_int) AS dish_discount_sum_int
+    FROM iiko_raw_load_revenue r
+    JOIN mart_refresh_scope s USING (report_date, department)
+    GROUP BY report_date, department, hour_open
+) r
     ON o.report_date = r.report_date
     AND o.department = r.department
     AND o.hour_open = r.hour_open
@@ -151,6 +207,7 @@ DO UPDATE SET
     revenue = EXCLUDED.revenue,
     updated_at = CURRENT_TIMESTAMP;
 
+-- @mart: mart_discount_types
 -- 3. Обновление таблицы mart_discount_types (типы скидок, п.15)
 
 INSERT INTO mart_discount_types (
@@ -163,14 +220,31 @@ INSERT INTO mart_discount_types (
     average_check
 )
 SELECT 
-    report_date,
-    department,
-    discount_type,
-    orders_count,  -- Количество заказов со скидкой
-    dish_discount_sum_int AS revenue_with_discount,  -- Выручка с заказов со скидкой
-    discount_sum,  -- Сумма общей по скидке
-    average_order_sum AS average_check  -- Средний чек по заказам со скидкой
-FROM iiko_raw_discount_types
+    t.report_date,
+    t.department,
+    t.discount_type,
+    t.orders_count,  -- Количество заказов со скидкой
+    t.dish_discount_sum_int AS revenue_with_discount,  -- Выручка с заказов со скидкой
+    t.discount_sum,  -- Сумма общей по скидке
+    t.average_order_sum AS average_check  -- Средний чек по заказам со скидкой
+FROM (
+    SELECT
+        t.report_date,
+        t.department,
+        t.discount_type,
+        SUM(t.orders_count) AS orders_count,
+        SUM(t.dish_discount_sum_int) AS dish_discount_sum_int,
+        SUM(t.discount_sum) AS discount_sum,
+        CASE
+            WHEN COUNT(*) = 1 THEN MAX(t.average_order_sum)
+            ELSE SUM(t.dish_discount_sum_int) / NULLIF(SUM(t.orders_count), 0)
+        END AS average_order_sum
+    FROM iiko_raw_discount_types t
+    JOIN mart_refresh_scope s
+        ON t.report_date = s.report_date
+        AND t.department = s.department
+    GROUP BY t.report_date, t.department, t.discount_type
+) t
 ON CONFLICT (report_date, department, discount_type)
 DO UPDATE SET
     orders_count = EXCLUDED.orders_count,
@@ -0,0 +1,339 @@
+-- Пересчет агрегатов витрины (013_mart_rollups.sql)
+--
+-- Секция "-- @mart: <витрина>" выполняется run_transforms.py сразу после
+-- секции этой витрины из refresh_mart.sql, с той же mart_refresh_scope:
+-- недели и месяцы, в которые попали пересчитанные дни, пересчитываются
+-- целиком из витрины (строки периода удаляются и вставляются заново).
+--
+-- При прямом запуске файла (после refresh_mart.sql) выполняется и эта
+-- шапка: область пересчета - все дни витрин.
+
+CREATE TEMP TABLE IF NOT EXISTS mart_refresh_scope (
+    report_date DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    PRIMARY KEY (report_date, department)
+);
+
+TRUNCATE mart_refresh_scope;
+
+INSERT INTO mart_refresh_scope (report_date, department)
+SELECT report_date, department FROM mart_daily_metrics
+UNION SELECT report_date, department FROM mart_hourly_load
+UNION SELECT report_date, department FROM mart_discount_types;
+
+ANALYZE mart_refresh_scope;
+
+-- @mart: mart_daily_metrics
+-- 1. Недели и месяцы mart_daily_metrics (mart_period_metrics),
+--    итоги предприятий (mart_department_totals)
+
+CREATE TEMP TABLE IF NOT EXISTS rollup_scope (
+    period VARCHAR(8) NOT NULL,
+    period_start DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    PRIMARY KEY (period, period_start, department)
+);
+
+TRUNCATE rollup_scope;
+
+INSERT INTO rollup_scope (period, period_start, department)
+SELECT DISTINCT p.period, date_trunc(p.period, s.report_date)::date, s.department
+FROM mart_refresh_scope s
+CROSS JOIN (VALUES ('week'), ('month')) AS p(period);
+
+ANALYZE rollup_scope;
+
+DELETE FROM mart_period_metrics r
+USING rollup_scope s
+WHERE r.period = s.period
+    AND r.period_start = s.period_start
+    AND r.department = s.department;
+
+INSERT INTO mart_period_metrics (
+    period,
+    period_start,
+    department,
+    days_count,
+    revenue,
+    discount_sum,
+    discount_percent,
+    product_cost,
+    cost_percent,
+    ad_budget,
+    ad_budget_percent,
+    fot_direct,
+    fot_direct_percent,
+    fot_couriers,
+    fot_couriers_percent,
+    fot_cooks,
+    fot_cooks_percent,
+    fot_cleaners,
+    fot_cleaners_percent,
+    packaging_cost,
+    arora_cost,
+    taxes_cost,
+    acquiring_cost,
+    margin,
+    margin_percent
+)
+SELECT
+    t.period,
+    t.period_start,
+    t.department,
+    t.days_count,
+    t.revenue,
+    t.discount_sum,
+    -- Проценты периода - доли от выручки периода, а не средние дневных процентов
+    COALESCE(t.discount_sum / NULLIF(t.revenue, 0) * 100, 0) AS discount_percent,
+    t.product_cost,
+    COALESCE(t.product_cost / NULLIF(t.revenue, 0) * 100, 0) AS cost_percent,
+    t.ad_budget,
+    COALESCE(t.ad_budget / NULLIF(t.revenue, 0) * 100, 0) AS ad_budget_percent,
+    t.fot_direct,
+    COALESCE(t.fot_direct / NULLIF(t.revenue, 0) * 100, 0) AS fot_direct_percent,
+    t.fot_couriers,
+    COALESCE(t.fot_couriers / NULLIF(t.revenue, 0) * 100, 0) AS fot_couriers_percent,
+    t.fot_cooks,
+    COALESCE(t.fot_cooks / NULLIF(t.revenue, 0) * 100, 0) AS fot_cooks_percent,
+    t.fot_cleaners,
+    COALESCE(t.fot_cleaners / NULLIF(t.revenue, 0) * 100, 0) AS fot_cleaners_percent,
+    t.packaging_cost,
+    t.arora_cost,
+    t.taxes_cost,
+    t.acquiring_cost,
+    t.margin,
+    COALESCE(t.margin / NULLIF(t.revenue, 0) * 100, 0) AS margin_percent
+FROM (
+    SELECT
+        s.period,
+        s.period_start,
+        s.department,
+        COUNT(*) AS days_count,
+        SUM(m.revenue) AS revenue,
+        -- Суммы скидок и себестоимости восстанавливаются из дневных процентов
+        SUM(m.revenue * m.discount_percent / 100) AS discount_sum,
+        SUM(m.revenue * m.cost_percent / 100) AS product_cost,
+        SUM(m.ad_budget) AS ad_budget,
+        SUM(m.fot_direct) AS fot_direct,
+        SUM(m.fot_couriers) AS fot_couriers,
+        SUM(m.fot_cooks) AS fot_cooks,
+        SUM(m.fot_cleaners) AS fot_cleaners,
+        SUM(m.packaging_cost) AS packaging_cost,
+        SUM(m.arora_cost) AS arora_cost,
+        SUM(m.taxes_cost) AS taxes_cost,
+        SUM(m.acquiring_cost) AS acquiring_cost,
+        SUM(m.margin) AS margin
+    FROM rollup_scope s
+    JOIN mart_daily_metrics m
+        ON m.department = s.department
+        AND m.report_date >= s.period_start
+        AND m.report_date < s.period_start + ('1 ' || s.period)::interval
+    GROUP BY s.period, s.period_start, s.department
+) t;
+
+-- Итоги предприятия - сумма его месяцев
+DELETE FROM mart_department_totals r
+WHERE r.department IN (SELECT department FROM rollup_scope);
+
+INSERT INTO mart_department_totals (
+    department,
+    first_date,
+    last_date,
+    days_count,
+    revenue,
+    discount_sum,
+    product_cost,
+    ad_budget,
+    fot_direct,
+    fot_couriers,
+    fot_cooks,
+    fot_cleaners,
+    margin,
+    margin_percent
+)
+SELECT
+    p.department,
+    d.first_date,
+    d.last_date,
+    SUM(p.days_count),
+    SUM(p.revenue),
+    SUM(p.discount_sum),
+    SUM(p.product_cost),
+    SUM(p.ad_budget),
+    SUM(p.fot_direct),
+    SUM(p.fot_couriers),
+    SUM(p.fot_cooks),
+    SUM(p.fot_cleaners),
+    SUM(p.margin),
+    COALESCE(SUM(p.margin) / NULLIF(SUM(p.revenue), 0) * 100, 0)
+FROM mart_period_metrics p
+JOIN (
+    -- Первый и последний день - по индексу первичного ключа витрины
+    SELECT
+        s.department,
+        (SELECT MIN(report_date) FROM mart_daily_metrics m WHERE m.department = s.department) AS first_date,
+        (SELECT MAX(report_date) FROM mart_daily_metrics m WHERE m.department = s.department) AS last_date
+    FROM (SELECT DISTINCT department FROM rollup_scope) s
+) d
+    ON p.department = d.department
+WHERE p.period = 'month'
+GROUP BY p.department, d.first_date, d.last_date;
+
+-- @mart: mart_hourly_load
+-- 2. Недели и месяцы mart_hourly_load (mart_period_hourly_load),
+--    матрица день недели × час по месяцам (mart_load_matrix)
+
+CREATE TEMP TABLE IF NOT EXISTS rollup_scope (
+    period VARCHAR(8) NOT NULL,
+    period_start DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    PRIMARY KEY (period, period_start, department)
+);
+
+TRUNCATE rollup_scope;
+
+INSERT INTO rollup_scope (period, period_start, department)
+SELECT DISTINCT p.period, date_trunc(p.period, s.report_date)::date, s.department
+FROM mart_refresh_scope s
+CROSS JOIN (VALUES ('week'), ('month')) AS p(period);
+
+ANALYZE rollup_scope;
+
+DELETE FROM mart_period_hourly_load r
+USING rollup_scope s
+WHERE r.period = s.period
+    AND r.period_start = s.period_start
+    AND r.department = s.department;
+
+INSERT INTO mart_period_hourly_load (
+    period,
+    period_start,
+    department,
+    hour_open,
+    orders_count,
+    revenue
+)
+SELECT
+    s.period,
+    s.period_start,
+    s.department,
+    h.hour_open,
+    SUM(h.orders_count),
+    SUM(h.revenue)
+FROM rollup_scope s
+JOIN mart_hourly_load h
+    ON h.department = s.department
+    AND h.report_date >= s.period_start
+    AND h.report_date < s.period_start + ('1 ' || s.period)::interval
+GROUP BY s.period, s.period_start, s.department, h.hour_open;
+
+DELETE FROM mart_load_matrix r
+USING rollup_scope s
+WHERE s.period = 'month'
+    AND r.month_start = s.period_start
+    AND r.department = s.department;
+
+INSERT INTO mart_load_matrix (
+    month_start,
+    department,
+    weekday,
+    hour_open,
+    days_count,
+    orders_count,
+    revenue
+)
+WITH hourly AS (
+    SELECT
+        s.period_start AS month_start,
+        h.department,
+        h.report_date,
+        EXTRACT(ISODOW FROM h.report_date)::INTEGER AS weekday,
+        h.hour_open,
+        h.orders_count,
+        h.revenue
+    FROM rollup_scope s
+    JOIN mart_hourly_load h
+        ON h.department = s.department
+        AND h.report_date >= s.period_start
+        AND h.report_date < s.period_start + INTERVAL '1 month'
+    WHERE s.period = 'month'
+),
+days AS (
+    -- Знаменатель средней нагрузки: дни недели с данными хотя бы за один час
+    SELECT month_start, department, weekday, COUNT(DISTINCT report_date) AS days_count
+    FROM hourly
+    GROUP BY month_start, department, weekday
+),
+cells AS (
+    SELECT month_start, department, weekday, hour_open,
+        SUM(orders_count) AS orders_count,
+        SUM(revenue) AS revenue
+    FROM hourly
+    GROUP BY month_start, department, weekday, hour_open
+)
+SELECT
+    d.month_start,
+    d.department,
+    d.weekday,
+    hours.hour_open,
+    d.days_count,
+    COALESCE(c.orders_count, 0),
+    COALESCE(c.revenue, 0)
+FROM days d
+CROSS JOIN generate_series(0, 23) AS hours(hour_open)
+LEFT JOIN cells c
+    ON c.month_start = d.month_start
+    AND c.department = d.department
+    AND c.weekday = d.weekday
+    AND c.hour_open = hours.hour_open;
+
+-- @mart: mart_discount_types
+-- 3. Недели и месяцы mart_discount_types (mart_period_discount_types)
+
+CREATE TEMP TABLE IF NOT EXISTS rollup_scope (
+    period VARCHAR(8) NOT NULL,
+    period_start DATE NOT NULL,
+    department VARCHAR(255) NOT NULL,
+    PRIMARY KEY (period, period_start, department)
+);
+
+TRUNCATE rollup_scope;
+
+INSERT INTO rollup_scope (period, period_start, department)
+SELECT DISTINCT p.period, date_trunc(p.period, s.report_date)::date, s.department
+FROM mart_refresh_scope s
+CROSS JOIN (VALUES ('week'), ('month')) AS p(period);
+
+ANALYZE rollup_scope;
+
+DELETE FROM mart_period_discount_types r
+USING rollup_scope s
+WHERE r.period = s.period
+    AND r.period_start = s.period_start
+    AND r.department = s.department;
+
+INSERT INTO mart_period_discount_types (
+    period,
+    period_start,
+    department,
+    discount_type,
+    orders_count,
+    revenue_with_discount,
+    discount_sum,
+    average_check
+)
+SELECT
+    s.period,
+    s.period_start,
+    s.department,
+    t.discount_type,
+    SUM(t.orders_count),
+    SUM(t.revenue_with_discount),
+    SUM(t.discount_sum),
+    SUM(t.revenue_with_discount) / NULLIF(SUM(t.orders_count), 0)
+FROM rollup_scope s
+JOIN mart_discount_types t
+    ON t.department = s.department
+    AND t.report_date >= s.period_start
+    AND t.report_date < s.period_start + ('1 ' || s.period)::interval
+GROUP BY s.period, s.period_start, s.department, t.discount_type;
@@ -2,45 +2,308 @@
 Запуск SQL трансформаций для обновления витрины данных.
 """
 import os
-import psycopg2
+import re
+import sys
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, Optional
 from dotenv import load_dotenv
 
+# Корень репозитория в sys.path для запуска как скрипта: python neon/transforms/run_transforms.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-def run_transforms():
-    """Запустить SQL трансформации для обновления витрины."""
+from neon.db import atomic  # noqa: E402
+from neon.metrics import timed  # noqa: E402
+
+# Сырые таблицы, из которых рассчитывается каждая витрина
+MART_SOURCES: Dict[str, tuple] = {
+    "mart_daily_metrics": ("iiko_raw_margin", "sheets_raw_direct", "sheets_raw_fot"),
+    "mart_hourly_load": ("iiko_raw_load_orders", "iiko_raw_load_revenue"),
+    "mart_discount_types": ("iiko_raw_discount_types",),
+}
+
+# Агрегаты каждой витрины по неделям и месяцам (013_mart_rollups.sql, refresh_rollups.sql)
+MART_ROLLUPS: Dict[str, tuple] = {
+    "mart_daily_metrics": ("mart_period_metrics", "mart_department_totals"),
+    "mart_hourly_load": ("mart_period_hourly_load", "mart_load_matrix"),
+    "mart_discount_types": ("mart_period_discount_types",),
+}
+
+SCOPE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS mart_refresh_scope (
+        report_date DATE NOT NULL,
+        department VARCHAR(255) NOT NULL,
+        PRIMARY KEY (report_date, department)
+    )
+"""
+
+# Новая отметка: начало текущей транзакции или, если раньше, начало самой
+# старой другой открытой транзакции в БД. loaded_at - время начала
+# транзакции загрузчика (CURRENT_TIMESTAMP): строки транзакции, еще не
+# зафиксированной при чтении сырых таблиц, получат loaded_at не раньше
+# отметки и войдут в следующее обновление
+WATERMARK_SQL = """
+    SELECT LEAST(
+        LOCALTIMESTAMP,
+        (
+            -- Строки отбираются по loaded_at > отметки: отметка строго раньше
+            SELECT MIN(xact_start)::timestamp - INTERVAL '1 microsecond'
+            FROM pg_stat_activity
+            WHERE datname = current_database()
+                AND backend_type = 'client backend'
+                AND pid <> pg_backend_pid()
+                AND xact_start IS NOT NULL
+        )
+    )
+"""
+
+_SECTION_RE = re.compile(r"^-- @mart: (\w+)\s*$", re.MULTILINE)
+
+
+def _read_sections(filename: str) -> Dict[str, str]:
+    sql_file = os.path.join(os.path.dirname(__file__), filename)
+    
+    with open(sql_file, "r", encoding="utf-8") as f:
+        sql = f.read()
+    
+    parts = _SECTION_RE.split(sql)
+    # parts: [шапка, витрина_1, sql_1, витрина_2, sql_2, ...]
+    return dict(zip(parts[1::2], parts[2::2]))
+
+
+def load_sections() -> Dict[str, str]:
+    """
+    Прочитать refresh_mart.sql и refresh_rollups.sql и разбить их на секции по витринам.
+    
+    SQL витрины - ее секция из refresh_mart.sql, за которой следует секция
+    refresh_rollups.sql: агрегаты по неделям и месяцам пересчитываются в
+    той же транзакции и по той же области (mart_refresh_scope).
+    
+    Returns:
+        dict: Таблица витрины -> SQL ее обновления (шапки файлов не входят)
+    """
+    sections = _read_sections("refresh_mart.sql")
+    for mart, sql in _read_sections("refresh_rollups.sql").items():
+        sections[mart] += sql
+    return sections
+
+
+def _fill_scope(
+    cur,
+    sources: Iterable[str],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    since: Optional[datetime] = None
+) -> int:
+    """
+    Заполнить mart_refresh_scope срезами (report_date, department) из сырых таблиц.
+    
+    Args:
+        sources: Сырые таблицы витрины
+        date_from, date_to: Ограничить срезы периодом
+        since: Взять только срезы со строками, загруженными после этой отметки
+    
+    Returns:
+        int: Число срезов для пересчета
+    """
+    conditions = []
+    params = []
+    if date_from is not None:
+        conditions.append("report_date >= %s")
+        params.append(date_from.date())
+    if date_to is not None:
+        conditions.append("report_date <= %s")
+        params.append(date_to.date())
+    if since is not None:
+        conditions.append("loaded_at > %s")
+        params.append(since)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    selects = [f"SELECT DISTINCT report_date, department FROM {table}{where}" for table in sources]
+    
+    cur.execute(SCOPE_DDL)
+    cur.execute("TRUNCATE mart_refresh_scope")
+    cur.execute(
+        "INSERT INTO mart_refresh_scope (report_date, department)\n" + "\nUNION ".join(selects),
+        params * len(selects)
+    )
+    scope_size = cur.rowcount
+    # Временные таблицы не анализируются autovacuum: статистика нужна планировщику
+    cur.execute("ANALYZE mart_refresh_scope")
+    return scope_size
+
+
+def _rollups_missing(cur, mart: str) -> bool:
+    """Витрина заполнена, а ее агрегаты (MART_ROLLUPS) - нет."""
+    cur.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {mart}) AND NOT EXISTS (SELECT 1 FROM {MART_ROLLUPS[mart][0]})"
+    )
+    return cur.fetchone()[0]
+
+
+def refresh_mart(
+    cur,
+    mart: str,
+    sql: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    full: bool = False
+) -> int:
+    """
+    Пересчитать витрину для измененных срезов.
+    
+    Без периода пересчитываются срезы со строками, загруженными после
+    отметки прошлого обновления (mart_refresh_state), и отметка сдвигается;
+    при первом запуске или full=True - вся история. Заданный период
+    пересчитывается без изменения отметки. Если витрина заполнена, а ее
+    агрегаты пусты (первое обновление после 013_mart_rollups.sql), вся
+    история пересчитывается и без full, в том числе вместо периода.
+    
+    Отметка не позже начала открытых в этот момент транзакций
+    (WATERMARK_SQL), поэтому строки параллельной загрузки, зафиксированной
+    после чтения сырых таблиц, не пропускаются. Долго открытая транзакция
+    задерживает отметку: ее срезы пересчитываются повторно.
+    
+    Returns:
+        int: Число пересчитанных срезов (report_date, department)
+    """
+    scoped = date_from is not None or date_to is not None
+    since = None
+    
+    if not full and _rollups_missing(cur, mart):
+        # Агрегаты появились после прошлых обновлений (013_mart_rollups.sql)
+        # или очищены: ни отметка, ни период не покрывают их историю
+        print(f"   {mart}: агрегаты витрины пусты, пересчитывается вся история")
+        full = True
+        date_from = date_to = None
+    
+    if not scoped and not full:
+        cur.execute("SELECT watermark FROM mart_refresh_state WHERE mart = %s", (mart,))
+        row = cur.fetchone()
+        since = row[0] if row else None
+    
+    if not scoped:
+        # До чтения сырых таблиц: транзакции, зафиксированные после этого
+        # запроса, уже открыты и сдвигают отметку назад (см. WATERMARK_SQL)
+        cur.execute(WATERMARK_SQL)
+        watermark = cur.fetchone()[0]
+    
+    scope_size = _fill_scope(cur, MART_SOURCES[mart], date_from, date_to, since)
+    
+    if scope_size:
+        cur.execute(sql)
+    
+    if not scoped:
+        # Строки, записанные в текущей транзакции (run_transaction), уже
+        # учтены в этом обновлении
+        cur.execute(
+            """
+            INSERT INTO mart_refresh_state (mart, watermark)
+            VALUES (%s, %s)
+            ON CONFLICT (mart)
+            DO UPDATE SET
+                watermark = EXCLUDED.watermark,
+                refreshed_at = CURRENT_TIMESTAMP
+            """,
+            (mart, watermark)
+        )
+    
+    return scope_size
+
+
+def run_mart(
+    mart: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    full: bool = False
+) -> int:
+    """
+    Обновить одну витрину в отдельной транзакции (задача mart:<витрина> в etl.py).
+    
+    Args:
+        mart: Таблица витрины (ключ MART_SOURCES)
+        date_from, date_to, full: См. refresh_mart
+    
+    Returns:
+        int: Число пересчитанных срезов (report_date, department)
+    """
+    sql = load_sections()[mart]
+    
+    with atomic() as conn, timed("db_seconds"):
+        cur = conn.cursor()
+        try:
+            scope_size = refresh_mart(cur, mart, sql, date_from, date_to, full)
+        finally:
+            cur.close()
+    
+    if scope_size:
+        print(f"✅ {mart}: пересчитано срезов (дата, предприятие): {scope_size}")
+    else:
+        print(f"✅ {mart}: нет изменений")
+    return scope_size
+
+
+def run_transforms(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    full: bool = False
+):
+    """
+    Запустить SQL трансформации для обновления витрины.
+    
+    Каждая витрина пересчитывается только для срезов (report_date, department),
+    затронутых изменениями (см. refresh_mart), поэтому время обновления
+    зависит от объема изменений, а не от размера истории. Агрегаты витрин
+    (недели, месяцы, итоги предприятий, 013_mart_rollups.sql) пересчитываются
+    только для периодов, в которые попали эти срезы.
+    
+    Подключение берется из общего пула (neon.db); внутри run_transaction()
+    трансформации становятся частью транзакции всего запуска ETL.
+    
+    Args:
+        date_from: Дата начала пересчитываемого периода
+        date_to: Дата окончания пересчитываемого периода
+        full: Пересчитать всю историю
+    """
     # Загружаем переменные окружения
     load_dotenv()
     
     if not os.environ.get("NEON_DATABASE_URL"):
         raise ValueError("NEON_DATABASE_URL не установлена")
     
-    # Читаем SQL файл
-    sql_file = os.path.join(os.path.dirname(__file__), "refresh_mart.sql")
-    
-    with open(sql_file, "r", encoding="utf-8") as f:
-        sql = f.read()
-    
-    # Подключаемся к БД и выполняем SQL
-    conn = psycopg2.connect(os.environ["NEON_DATABASE_URL"])
-    cur = conn.cursor()
+    sections = load_sections()
     
     try:
         print("🔄 Запуск трансформаций для обновления витрины данных...")
         
-        # Выполняем SQL (может содержать несколько запросов)
-        cur.execute(sql)
-        conn.commit()
+        # Все витрины обновляются в одной транзакции
+        with atomic() as conn:
+            cur = conn.cursor()
+            try:
+                for mart, sql in sections.items():
+                    scope_size = refresh_mart(cur, mart, sql, date_from, date_to, full)
+                    if scope_size:
+                        print(f"   {mart}: пересчитано срезов (дата, предприятие): {scope_size}")
+                    else:
+                        print(f"   {mart}: нет изменений")
+            finally:
+                cur.close()
         
         print("✅ Трансформации выполнены успешно")
-        
+    
     except Exception as e:
-        conn.rollback()
         print(f"❌ Ошибка при выполнении трансформаций: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
 
 
 if __name__ == "__main__":
-    run_transforms()
+    def parse_date(value: str) -> datetime:
+        return datetime.strptime(value, "%Y-%m-%d")
+    
+    parser = argparse.ArgumentParser(description="Обновление витрины данных")
+    parser.add_argument("--date-from", type=parse_date, help="Дата начала периода, ГГГГ-ММ-ДД")
+    parser.add_argument("--date-to", type=parse_date, help="Дата окончания периода, ГГГГ-ММ-ДД")
+    parser.add_argument("--full", action="store_true", help="Пересчитать всю историю")
+    args = parser.parse_args()
+    
+    run_transforms(args.date_from, args.date_to, full=args.full)
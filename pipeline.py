@@ -0,0 +1,260 @@
+"""
+Выполнение задач ETL с зависимостями (DAG).
+
+Задача - источник (отчет iiko, лист Google Sheets) или приемник (таблица
+витрины) с перечнем задач, от которых она зависит. Независимые задачи
+выполняются параллельно, задача запускается, как только выполнены все ее
+зависимости, поэтому длительность запуска определяется критическим путем,
+а не суммой этапов.
+
+После запуска печатается время каждой задачи и критический путь, а итог
+вместе с параметрами запуска (период и флаги, от которых зависит состав
+задач) сохраняется в LAST_RUN_PATH для повторного запуска только упавших
+задач (python etl.py --rerun-failed).
+"""
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Итог последнего запуска: параметры и статусы задач
+LAST_RUN_PATH = os.path.join(".cache", "pipeline_last_run.json")
+
+# Статусы задач
+OK = "ok"
+FAILED = "failed"
+UPSTREAM_FAILED = "upstream_failed"
+
+
+@dataclass(frozen=True)
+class Task:
+    """Задача DAG."""
+    name: str  # Уникальное имя (iiko:margin, sheets:direct, mart:mart_daily_metrics, ...)
+    run: Callable[[], Any]
+    deps: Tuple[str, ...] = ()  # Задачи, которые должны завершиться раньше
+    optional: bool = False  # Ошибка не останавливает зависимые задачи и не проваливает запуск
+
+
+@dataclass
+class TaskResult:
+    """Итог выполнения задачи."""
+    name: str
+    status: str
+    started: float = 0.0  # Секунды от начала запуска
+    seconds: float = 0.0
+    result: Any = None
+    error: Optional[str] = None
+
+
+@dataclass
+class PipelineRun:
+    """Итог запуска DAG."""
+    results: Dict[str, TaskResult] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def failed(self) -> List[str]:
+        """Задачи, завершившиеся с ошибкой или не запущенные из-за ошибки зависимости."""
+        return [name for name, result in self.results.items() if result.status != OK]
+
+
+class Pipeline:
+    """Набор задач с зависимостями."""
+
+    def __init__(self, tasks: Iterable[Task]):
+        self.tasks: Dict[str, Task] = {}
+        for task in tasks:
+            if task.name in self.tasks:
+                raise ValueError(f"Задача '{task.name}' объявлена дважды")
+            self.tasks[task.name] = task
+
+        for task in self.tasks.values():
+            unknown = [dep for dep in task.deps if dep not in self.tasks]
+            if unknown:
+                raise ValueError(f"Задача '{task.name}' зависит от неизвестных задач: {', '.join(unknown)}")
+        self._check_cycles()
+
+    def _check_cycles(self):
+        state: Dict[str, int] = {}  # 1 - в обходе, 2 - проверена
+
+        def visit(name: str, path: Tuple[str, ...]):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Цикл зависимостей: {' → '.join(path + (name,))}")
+            state[name] = 1
+            for dep in self.tasks[name].deps:
+                visit(dep, path + (name,))
+            state[name] = 2
+
+        for name in self.tasks:
+            visit(name, ())
+
+    def downstream(self, names: Iterable[str]) -> Set[str]:
+        """Задачи names и все задачи, зависящие от них (прямо или через другие)."""
+        selected = set(names)
+        changed = True
+        while changed:
+            changed = False
+            for task in self.tasks.values():
+                if task.name not in selected and selected.intersection(task.deps):
+                    selected.add(task.name)
+                    changed = True
+        return selected
+
+    def select(self, patterns: Iterable[str]) -> Set[str]:
+        """
+        Задачи по шаблонам имен (fnmatch, например iiko:* или mart:mart_daily_metrics)
+        вместе с зависящими от них задачами.
+
+        Raises:
+            ValueError: Если шаблону не соответствует ни одна задача
+        """
+        matched = set()
+        for pattern in patterns:
+            names = {name for name in self.tasks if fnmatchcase(name, pattern)}
+            if not names:
+                raise ValueError(f"Нет задач, соответствующих '{pattern}', доступны: {', '.join(self.tasks)}")
+            matched |= names
+        return self.downstream(matched)
+
+    def run(self, only: Optional[Iterable[str]] = None, max_workers: int = 4) -> PipelineRun:
+        """
+        Выполнить задачи.
+
+        Args:
+            only: Выполнить только эти задачи; их зависимости вне only считаются
+                  выполненными (частичный повторный запуск)
+            max_workers: Число одновременно выполняемых задач
+
+        Returns:
+            PipelineRun: Итоги задач и общее время
+        """
+        selected = set(self.tasks) if only is None else set(only)
+        run = PipelineRun()
+        done: Set[str] = set(self.tasks) - selected  # Завершенные (успешно или optional)
+        pending = [name for name in self.tasks if name in selected]
+        started_at = time.monotonic()
+
+        def execute(task: Task) -> TaskResult:
+            started = time.monotonic()
+            result = TaskResult(task.name, OK, started=started - started_at)
+            try:
+                result.result = task.run()
+            except Exception as e:
+                result.status = FAILED
+                result.error = str(e)
+            result.seconds = time.monotonic() - started
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="task") as pool:
+            running = {}
+            while pending or running:
+                # Задачи, зависимости которых упали, не запускаются
+                for name in list(pending):
+                    failed = [
+                        dep for dep in self.tasks[name].deps
+                        if dep in run.results and run.results[dep].status != OK and not self.tasks[dep].optional
+                    ]
+                    if failed:
+                        pending.remove(name)
+                        run.results[name] = TaskResult(name, UPSTREAM_FAILED, error=f"не выполнены: {', '.join(failed)}")
+                        print(f"⏭️  {name}: пропущена, не выполнены зависимости ({', '.join(failed)})")
+                        if self.tasks[name].optional:
+                            done.add(name)
+
+                for name in [name for name in pending if done.issuperset(self.tasks[name].deps)]:
+                    pending.remove(name)
+                    running[pool.submit(execute, self.tasks[name])] = name
+
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    result = future.result()
+                    run.results[name] = result
+                    if result.status == OK:
+                        done.add(name)
+                    elif self.tasks[name].optional:
+                        print(f"⚠️  {name}: ошибка ({result.error}), продолжаем без этих данных")
+                        done.add(name)
+                    else:
+                        print(f"❌ {name}: ошибка ({result.error})")
+
+        run.seconds = time.monotonic() - started_at
+        return run
+
+    def critical_path(self, run: PipelineRun) -> Tuple[List[str], float]:
+        """Самая длинная по времени цепочка зависимых выполненных задач."""
+        best: Dict[str, Tuple[float, List[str]]] = {}
+
+        def longest(name: str) -> Tuple[float, List[str]]:
+            if name not in best:
+                chains = [longest(dep) for dep in self.tasks[name].deps if dep in run.results]
+                seconds, path = max(chains, key=lambda chain: chain[0], default=(0.0, []))
+                best[name] = (seconds + run.results[name].seconds, path + [name])
+            return best[name]
+
+        chains = [longest(name) for name in run.results]
+        seconds, path = max(chains, key=lambda chain: chain[0], default=(0.0, []))
+        return path, seconds
+
+    def print_summary(self, run: PipelineRun):
+        """Напечатать время задач и критический путь."""
+        width = max((len(name) for name in run.results), default=0)
+        print("\n⏱️  Время выполнения задач:")
+        for result in sorted(run.results.values(), key=lambda result: (result.status == UPSTREAM_FAILED, result.started)):
+            if result.status == UPSTREAM_FAILED:
+                print(f"   {result.name:<{width}}  {result.status}")
+            else:
+                print(
+                    f"   {result.name:<{width}}  {result.status:<6} "
+                    f"старт +{result.started:6.1f}s  {result.seconds:6.1f}s"
+                )
+
+        path, seconds = self.critical_path(run)
+        total = sum(result.seconds for result in run.results.values())
+        print(f"   Критический путь: {' → '.join(path)} ({seconds:.1f}s)")
+        print(f"   Всего: {run.seconds:.1f}s (сумма задач {total:.1f}s)")
+
+
+@dataclass
+class LastRun:
+    """Итог прошлого запуска для --rerun-failed."""
+    params: Dict[str, Any]  # Параметры, определяющие период и состав задач
+    statuses: Dict[str, str]  # Задача -> статус
+
+    @property
+    def failed(self) -> List[str]:
+        """Задачи, не выполненные в прошлом запуске."""
+        return [name for name, status in self.statuses.items() if status != OK]
+
+
+def save_last_run(run: PipelineRun, params: Dict[str, Any], path: str = LAST_RUN_PATH):
+    """Сохранить параметры и статусы задач запуска для --rerun-failed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"params": params, "tasks": {name: result.status for name, result in run.results.items()}},
+            f, ensure_ascii=False, indent=2
+        )
+
+
+def load_last_run(path: str = LAST_RUN_PATH) -> LastRun:
+    """
+    Итог прошлого запуска.
+
+    Raises:
+        FileNotFoundError: Если итог прошлого запуска не сохранен
+        ValueError: Если итог сохранен без параметров запуска (старый формат)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "params" not in data or "tasks" not in data:
+        raise ValueError(f"В {path} нет параметров прошлого запуска, повторите запуск целиком")
+    return LastRun(data["params"], data["tasks"])